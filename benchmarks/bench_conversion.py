@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пропускной способности преобразования текста
+Сравнивает прежний посимвольный алгоритм switch_text_layout с движком
+conversion.ConversionEngine и проверяет, что результаты совпадают.
+
+Запуск: python benchmarks/bench_conversion.py [--layout en_ru]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import conversion  # noqa: E402
+from keyboard_layouts import get_layout_dict  # noqa: E402
+
+SAMPLE = "ghbdtn, vbh! Привет, мир. 'nj ntcn/ {ENBY} 12345; "
+
+SIZES = {
+    "word": 8,
+    "paragraph": 600,
+    "1MB": 1 << 20,
+    "8MB": 8 << 20,
+}
+
+
+def reference_convert(text: str, layout_name: str) -> str:
+    """Прежний посимвольный алгоритм (эталон для сравнения)"""
+    forward_dict, reverse_dict = get_layout_dict(layout_name)
+    result = []
+    for char in text:
+        if char in forward_dict:
+            result.append(forward_dict[char])
+        elif char in reverse_dict:
+            result.append(reverse_dict[char])
+        else:
+            result.append(char)
+    return "".join(result)
+
+
+def make_text(size: int) -> str:
+    return (SAMPLE * (size // len(SAMPLE) + 1))[:size]
+
+
+def measure(func, text: str, min_time: float = 0.2) -> float:
+    """Возвращает пропускную способность в символах в секунду"""
+    loops = 0
+    started = time.perf_counter()
+    while True:
+        func(text)
+        loops += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return loops * len(text) / elapsed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--layout", default="en_ru")
+    args = parser.parse_args()
+
+    engine = conversion.get_engine(args.layout)
+    numpy = conversion.load_numpy()
+    print(f"layout={args.layout} numpy={'yes' if numpy is not None else 'no'}")
+    print(f"{'input':>10} {'reference':>14} {'engine':>14} {'speedup':>8}")
+    for name, size in SIZES.items():
+        text = make_text(size)
+        if engine.convert(text) != reference_convert(text, args.layout):
+            print(f"{name}: результат движка отличается от эталона", file=sys.stderr)
+            return 1
+        reference = measure(lambda t: reference_convert(t, args.layout), text)
+        fast = measure(engine.convert, text)
+        print(
+            f"{name:>10} {reference / 1e6:>10.2f} M/s {fast / 1e6:>10.2f} M/s "
+            f"{fast / reference:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
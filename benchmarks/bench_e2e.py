@@ -0,0 +1,688 @@
+#!/usr/bin/env python3
+"""
+Сквозной замер задержек lipunto без сеанса KDE
+Запускает отдельный dbus-daemon с поддельными сервисами org.kde.klipper и
+org.kde.keyboard, а также поддельный сокет ydotoold, события из которого
+применяются к модели текстового поля приложения. LayoutSwitcher.run()
+выполняется много раз; для каждого этапа выводятся p50/p95/p99, а после
+каждого нажатия проверяется, что текст заменен верно и история буфера
+обмена совпадает с исходной. С --clipboard-backend wl-clipboard или xclip
+вместо Klipper используются поддельные утилиты wl-copy/wl-paste и xclip,
+хранящие буфер в файле. С --primary приложение записывает выделение в
+PRIMARY поддельной утилиты wl-paste, и режим selected читает его без Ctrl+C.
+С --scheduler нажатия серии приходят одновременно из разных потоков через
+очередь демона и сливаются. С --dictionary-check каждое четвертое слово
+действия last набрано верно и должно остаться без изменений.
+
+Запуск:
+    python benchmarks/bench_e2e.py --iterations 2000 --history 20
+    python benchmarks/bench_e2e.py --action last --burst 3 --service-latency 0.002
+    python benchmarks/bench_e2e.py --action selected --selection-size 4000000 --iterations 5
+    python benchmarks/bench_e2e.py --clipboard-backend wl-clipboard --iterations 50
+    python benchmarks/bench_e2e.py --action selected --primary --iterations 200
+    python benchmarks/bench_e2e.py --action last --burst 4 --scheduler
+"""
+
+import argparse
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from conversion import convert_text  # noqa: E402
+from dbus_client import (  # noqa: E402
+    KEYBOARD_INTERFACE,
+    KLIPPER_INTERFACE,
+    DBusConnection,
+    DBusError,
+)
+from input_backend import INPUT_EVENT  # noqa: E402
+from keycodes import (  # noqa: E402
+    EV_KEY,
+    KEY_BACKSPACE,
+    KEY_C,
+    KEY_INSERT,
+    KEY_LEFT,
+    KEY_LEFTCTRL,
+    KEY_LEFTSHIFT,
+    KEY_RIGHT,
+    KEY_RIGHTCTRL,
+    KEY_RIGHTSHIFT,
+)
+from keystroke_buffer import strokes_text  # noqa: E402
+from scheduler import ActionScheduler  # noqa: E402
+
+KLIPPER_SERVICE = "org.kde.klipper"
+KEYBOARD_SERVICE = "org.kde.keyboard"
+# Раскладки поддельной сессии и их имена в кэше XKB
+LAYOUTS = [("us", "", "English (US)"), ("ru", "", "Russian")]
+# Третья раскладка для --layouts 3: переход к следующей раскладке ошибся бы
+EXTRA_LAYOUT = ("de", "", "German")
+CACHE_NAMES = {"us": "en", "ru": "ru", "de": "de"}
+# Тип события-метки, которой замер дожидается обработки всех событий
+SYNC_EVENT = 0xFFFF
+
+WORDS_WRONG = ["ghbdtn", "vbh", "ckjdj", "rkfdbfnehf", "hfcrkflrf", "ntrcn"]
+# Верно набранные слова: с --dictionary-check их замена пропускается
+WORDS_CORRECT = ["hello", "keyboard", "window", "language"]
+SELECTION = "Привет, ghbdtn vbh"
+SELECTION_EXPECTED = "Привет, привет мир"
+
+# Поддельные wl-copy, wl-paste и xclip: буфер и PRIMARY хранятся в файлах
+FAKE_TOOL = """#!{python} -IS
+import os, sys
+primary = "--primary" in sys.argv or "primary" in sys.argv
+path = os.environ["LIPUNTO_FAKE_PRIMARY" if primary else "LIPUNTO_FAKE_CLIPBOARD"]
+if os.path.basename(sys.argv[0]) == "wl-paste" or "-o" in sys.argv:
+    try:
+        with open(path, "rb") as source:
+            sys.stdout.buffer.write(source.read())
+    except FileNotFoundError:
+        sys.exit(1)
+else:
+    data = sys.stdin.buffer.read()
+    with open(path + ".tmp", "wb") as target:
+        target.write(data)
+    os.replace(path + ".tmp", path)
+"""
+FAKE_TOOLS = {"wl-clipboard": ("wl-copy", "wl-paste"), "xclip": ("xclip",)}
+DISPLAY_VARIABLES = {"wl-clipboard": "WAYLAND_DISPLAY", "xclip": "DISPLAY"}
+
+
+class FakeSession:
+    """Поддельные Klipper и раскладки KDE на отдельной шине"""
+
+    def __init__(self, address: str, max_items: int, latency: float, layouts=LAYOUTS):
+        self.max_items = max_items
+        self.latency = latency
+        self.history: List[str] = []
+        self.layouts = list(layouts)
+        self.layout = 0
+        self.lock = threading.Lock()
+        self.connection = DBusConnection(address).connect()
+        self.connection.request_name(KLIPPER_SERVICE)
+        self.connection.request_name(KEYBOARD_SERVICE)
+        self.connection.export("/klipper", self._klipper)
+        self.connection.export("/Layouts", self._keyboard)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self) -> None:
+        while self._running:
+            try:
+                self.connection.process(0.05)
+            except (OSError, ConnectionError):
+                return
+
+    def stop(self) -> None:
+        self._running = False
+        self._thread.join()
+        self.connection.close()
+
+    def set_history(self, items: List[str]) -> None:
+        with self.lock:
+            self.history = list(items)
+
+    def set_layout(self, index: int) -> None:
+        """Переключение раскладки пользователем"""
+        with self.lock:
+            changed = self.layout != index
+            self.layout = index
+        if changed:
+            self._layout_changed()
+
+    def _layout_changed(self) -> None:
+        self.connection.emit_signal(
+            "/Layouts", KEYBOARD_INTERFACE, "layoutChanged", "u", [self.layout]
+        )
+
+    def cache_name(self) -> str:
+        """Имя активной раскладки в кэше XKB"""
+        return CACHE_NAMES[self.layouts[self.layout][0]]
+
+    def _klipper(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        member, body = message.member, message.body
+        changed = False
+        with self.lock:
+            history = self.history
+            if member == "getClipboardContents":
+                return "s", [history[0] if history else ""]
+            if member == "getClipboardHistoryMenu":
+                return "as", [list(history)]
+            if member == "getClipboardHistoryItem":
+                index = body[0]
+                return "s", [history[index] if 0 <= index < len(history) else ""]
+            if member == "setClipboardContents":
+                # Klipper не хранит дубликаты: элемент переносится наверх
+                if body[0] in history:
+                    history.remove(body[0])
+                history.insert(0, body[0])
+                del history[self.max_items :]
+                changed = True
+            elif member == "clearClipboardContents":
+                if history:
+                    history.pop(0)
+                changed = True
+            elif member == "clearClipboardHistory":
+                history.clear()
+                changed = True
+            else:
+                raise DBusError("org.freedesktop.DBus.Error.UnknownMethod", member)
+        if changed:
+            self.connection.emit_signal(
+                "/klipper", KLIPPER_INTERFACE, "clipboardHistoryUpdated"
+            )
+        return "", []
+
+    def _keyboard(self, message):
+        member = message.member
+        with self.lock:
+            previous = self.layout
+            if member == "switchToNextLayout":
+                self.layout = (self.layout + 1) % len(self.layouts)
+                reply = "", []
+            elif member == "switchToPreviousLayout":
+                self.layout = (self.layout - 1) % len(self.layouts)
+                reply = "", []
+            elif member == "getLayout":
+                reply = "u", [self.layout]
+            elif member == "setLayout":
+                ok = 0 <= message.body[0] < len(self.layouts)
+                if ok:
+                    self.layout = message.body[0]
+                reply = "b", [ok]
+            elif member == "getLayoutsList":
+                reply = "a(sss)", [self.layouts]
+            else:
+                raise DBusError("org.freedesktop.DBus.Error.UnknownMethod", member)
+        if self.layout != previous:
+            self._layout_changed()
+        return reply
+
+
+class KlipperClipboard:
+    """Буфер обмена приложения в поддельном Klipper"""
+
+    def __init__(self, address: str):
+        self.bus = DBusConnection(address).connect()
+
+    def get(self) -> str:
+        (contents,) = self.bus.call(
+            KLIPPER_SERVICE, "/klipper", KLIPPER_INTERFACE, "getClipboardContents"
+        )
+        return contents
+
+    def set(self, text: str) -> None:
+        self.bus.call(
+            KLIPPER_SERVICE,
+            "/klipper",
+            KLIPPER_INTERFACE,
+            "setClipboardContents",
+            "s",
+            (text,),
+        )
+
+    def close(self) -> None:
+        self.bus.close()
+
+
+class FileClipboard:
+    """Буфер обмена приложения в файле поддельных wl-clipboard и xclip"""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def get(self) -> str:
+        try:
+            return self.path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return ""
+
+    def set(self, text: str) -> None:
+        tmp_path = self.path.with_suffix(".app")
+        tmp_path.write_text(text, encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    def close(self) -> None:
+        pass
+
+
+def _write_tools(directory: Path, names) -> None:
+    bin_dir = directory / "bin"
+    if not bin_dir.exists():
+        bin_dir.mkdir()
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+    for name in names:
+        tool = bin_dir / name
+        tool.write_text(FAKE_TOOL.format(python=sys.executable))
+        tool.chmod(0o755)
+
+
+def install_fake_tools(directory: Path, backend: str):
+    """Создает поддельные утилиты буфера и возвращает модель буфера"""
+    _write_tools(directory, FAKE_TOOLS[backend])
+    path = directory / "clipboard"
+    os.environ["LIPUNTO_FAKE_CLIPBOARD"] = str(path)
+    os.environ[DISPLAY_VARIABLES[backend]] = "lipunto-e2e"
+    return FileClipboard(path)
+
+
+def install_fake_primary(directory: Path):
+    """Создает поддельную wl-paste для PRIMARY и возвращает модель PRIMARY"""
+    _write_tools(directory, ["wl-paste"])
+    path = directory / "primary"
+    os.environ["LIPUNTO_FAKE_PRIMARY"] = str(path)
+    os.environ["WAYLAND_DISPLAY"] = "lipunto-e2e"
+    return FileClipboard(path)
+
+
+class FakeApplication:
+    """Текстовое поле, получающее события из поддельного сокета ydotoold"""
+
+    def __init__(
+        self, socket_path: str, clipboard, session: FakeSession, latency: float, primary=None
+    ):
+        self.session = session
+        self.latency = latency
+        self.text = ""
+        self.cursor = 0
+        self.anchor: Optional[int] = None
+        self.held: set = set()
+        self.clipboard = clipboard
+        # PRIMARY: выделение записывается в нее сразу, как в X11 и Wayland
+        self.primary = primary
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(socket_path)
+        self.socket_path = socket_path
+        self._synced = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def reset(self, text: str, select_all: bool = False) -> None:
+        self.sync()
+        self.text = text
+        self.cursor = len(text)
+        self.anchor = 0 if select_all else None
+        self._update_primary()
+
+    def sync(self, timeout: float = 5.0) -> None:
+        """Дожидается обработки всех уже отправленных событий"""
+        self._synced.clear()
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sender.sendto(INPUT_EVENT.pack(0, 0, SYNC_EVENT, 0, 0), self.socket_path)
+        finally:
+            sender.close()
+        if not self._synced.wait(timeout):
+            raise RuntimeError("Приложение не обработало события вовремя")
+
+    def stop(self) -> None:
+        self.sock.close()
+        self.clipboard.close()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                data = self.sock.recv(INPUT_EVENT.size)
+            except OSError:
+                return
+            _, _, event_type, code, value = INPUT_EVENT.unpack(data)
+            if event_type == SYNC_EVENT:
+                self._synced.set()
+            elif event_type == EV_KEY:
+                self._key(code, value)
+
+    def _update_primary(self) -> None:
+        selection = self._selection()
+        if self.primary is not None and selection:
+            self.primary.set(self.text[selection[0] : selection[1]])
+
+    def _selection(self):
+        if self.anchor is None or self.anchor == self.cursor:
+            return None
+        return min(self.anchor, self.cursor), max(self.anchor, self.cursor)
+
+    def _replace_selection(self, insert: str) -> None:
+        selection = self._selection()
+        start, end = selection if selection else (self.cursor, self.cursor)
+        self.text = self.text[:start] + insert + self.text[end:]
+        self.cursor = start + len(insert)
+        self.anchor = None
+
+    def _key(self, code: int, value: int) -> None:
+        if value == 0:
+            self.held.discard(code)
+            return
+        if code in (KEY_LEFTSHIFT, KEY_RIGHTSHIFT, KEY_LEFTCTRL, KEY_RIGHTCTRL):
+            self.held.add(code)
+            return
+        ctrl = bool(self.held & {KEY_LEFTCTRL, KEY_RIGHTCTRL})
+        shift = bool(self.held & {KEY_LEFTSHIFT, KEY_RIGHTSHIFT})
+        if ctrl and code == KEY_C:
+            selection = self._selection()
+            if selection:
+                if self.latency:
+                    time.sleep(self.latency)
+                self.clipboard.set(self.text[selection[0] : selection[1]])
+        elif shift and code == KEY_INSERT:
+            if self.latency:
+                time.sleep(self.latency)
+            self._replace_selection(self.clipboard.get())
+        elif code == KEY_LEFT:
+            if ctrl and shift:
+                if self.anchor is None:
+                    self.anchor = self.cursor
+                position = self.cursor
+                while position and self.text[position - 1] == " ":
+                    position -= 1
+                while position and self.text[position - 1] != " ":
+                    position -= 1
+                self.cursor = position
+                self._update_primary()
+            elif shift:
+                if self.anchor is None:
+                    self.anchor = self.cursor
+                self.cursor = max(0, self.cursor - 1)
+                self._update_primary()
+            else:
+                selection = self._selection()
+                self.cursor = selection[0] if selection else max(0, self.cursor - 1)
+                self.anchor = None
+        elif code == KEY_RIGHT:
+            selection = self._selection()
+            self.cursor = selection[1] if selection else min(len(self.text), self.cursor + 1)
+            self.anchor = None
+        elif code == KEY_BACKSPACE:
+            if self._selection():
+                self._replace_selection("")
+            elif self.cursor:
+                self.text = self.text[: self.cursor - 1] + self.text[self.cursor :]
+                self.cursor -= 1
+        else:
+            char = strokes_text([(code, shift)], self.session.cache_name())
+            if char and char != "?":
+                self._replace_selection(char)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def instrument(switcher, samples: Dict[str, List[float]]) -> None:
+    """Оборачивает этапы LayoutSwitcher замером времени"""
+
+    def wrap(owner, attribute: str, stage: str) -> None:
+        original = getattr(owner, attribute)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples[stage].append(time.perf_counter() - started)
+
+        setattr(owner, attribute, timed)
+
+    manager = switcher.clipboard_manager
+    # total - время до возврата управления; background - ожидание фоновых
+    # шагов (раскладка, восстановление истории) после последнего нажатия
+    wrap(switcher, "run", "total")
+    wrap(switcher.pipeline, "wait_idle", "background")
+    wrap(switcher, "read_primary", "primary")
+    wrap(manager, "copy_selection", "copy")
+    wrap(switcher, "switch_text_layout", "convert")
+    wrap(switcher, "switch_kde_layout", "layout switch")
+    wrap(manager, "send_paste", "paste")
+    wrap(manager, "save_clipboard_history", "history save")
+    wrap(manager, "restore_clipboard_history", "history restore")
+
+
+def start_bus(directory: Path) -> subprocess.Popen:
+    config = directory / "bus.conf"
+    config.write_text(
+        f"""<busconfig>
+  <type>session</type>
+  <listen>unix:path={directory / "bus"}</listen>
+  <auth>EXTERNAL</auth>
+  <policy context="default">
+    <allow send_destination="*" eavesdrop="true"/>
+    <allow eavesdrop="true"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+""",
+        encoding="utf-8",
+    )
+    process = subprocess.Popen(
+        ["dbus-daemon", f"--config-file={config}", "--nofork", "--print-address"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    process.stdout.readline()
+    return process
+
+
+def create_switcher(args):
+    from cli_args import create_arg_parser
+    from config_manager import build_settings
+    from switch_layout import LayoutSwitcher
+
+    argv = [
+        args.action,
+        "--no-popup",
+        "--delay-text-process", "0.001",
+        "--delay-clipboard-get", str(args.timeout),
+        "--delay-clipboard-set", str(args.timeout),
+        "--delay-paste", str(args.paste_delay),
+        "--replace-strategy", args.strategy,
+        "--clipboard-backend", args.clipboard_backend,
+    ]
+    argv.append("--primary-selection" if args.primary else "--no-primary-selection")
+    if args.dictionary_check:
+        argv.append("--dictionary-check")
+    settings = build_settings(create_arg_parser().parse_args(argv))
+    switcher = LayoutSwitcher(settings)
+    # Утилиты kdialog/qdbus/ydotool в замере не нужны
+    switcher.check_dependencies = lambda: None
+    return switcher
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--action", choices=["last", "selected", "both"], default="both")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--history", type=int, default=10, help="Размер истории буфера")
+    parser.add_argument("--max-items", type=int, default=20, help="Предел истории Klipper")
+    parser.add_argument(
+        "--service-latency", type=float, default=0.0, help="Задержка каждого вызова Klipper"
+    )
+    parser.add_argument(
+        "--app-latency", type=float, default=0.0, help="Задержка копирования и вставки в приложении"
+    )
+    parser.add_argument(
+        "--burst", type=int, default=1, help="Нажатий подряд без ожидания приложения"
+    )
+    parser.add_argument(
+        "--selection-size",
+        type=int,
+        default=0,
+        help="Размер выделения в символах (по умолчанию - одна фраза)",
+    )
+    parser.add_argument("--paste-delay", type=float, default=0.005)
+    parser.add_argument("--timeout", type=float, default=0.5, help="Граница ожидания буфера")
+    parser.add_argument("--strategy", choices=["auto", "keys", "paste"], default="paste")
+    parser.add_argument(
+        "--clipboard-backend", choices=["klipper", "wl-clipboard", "xclip"], default="klipper"
+    )
+    parser.add_argument(
+        "--primary", action="store_true", help="Читать выделение из PRIMARY без Ctrl+C"
+    )
+    parser.add_argument(
+        "--dictionary-check", action="store_true", help="Проверять замену по индексу слов"
+    )
+    parser.add_argument(
+        "--layouts", type=int, choices=[2, 3], default=2, help="Число раскладок KDE"
+    )
+    parser.add_argument(
+        "--mixed-start",
+        action="store_true",
+        help="Каждое второе слово действия last набрано в русской раскладке",
+    )
+    parser.add_argument(
+        "--track-layout",
+        action="store_true",
+        help="Отслеживать раскладку сигналами layoutChanged, как демон",
+    )
+    parser.add_argument(
+        "--scheduler", action="store_true", help="Нажатия серии - через очередь демона"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if shutil.which("dbus-daemon") is None:
+        print("dbus-daemon не найден", file=sys.stderr)
+        return 2
+
+    directory = Path(tempfile.mkdtemp(prefix="lipunto-e2e-"))
+    bus = start_bus(directory)
+    address = f"unix:path={directory / 'bus'}"
+    os.environ["DBUS_SESSION_BUS_ADDRESS"] = address
+    os.environ["YDOTOOL_SOCKET"] = str(directory / "ydotool")
+    # Кэши путей утилит и задержек не смешиваются с настоящими
+    os.environ["XDG_CACHE_HOME"] = str(directory / "cache")
+    layouts = LAYOUTS + [EXTRA_LAYOUT] * (args.layouts - len(LAYOUTS))
+    session = FakeSession(address, args.max_items, args.service_latency, layouts)
+    if args.clipboard_backend == "klipper":
+        clipboard = KlipperClipboard(address)
+    else:
+        clipboard = install_fake_tools(directory, args.clipboard_backend)
+    primary = install_fake_primary(directory) if args.primary else None
+    app = FakeApplication(
+        os.environ["YDOTOOL_SOCKET"], clipboard, session, args.app_latency, primary
+    )
+    actions = ["last", "selected"] if args.action == "both" else [args.action]
+    # Большое выделение - повтор фразы, в каждой копии неверны два слова
+    repeats = max(1, args.selection_size // (len(SELECTION) + 1))
+    selection = " ".join([SELECTION] * repeats)
+    selection_expected = " ".join([SELECTION_EXPECTED] * repeats)
+
+    random.seed(args.seed)
+    samples: Dict[str, List[float]] = defaultdict(list)
+    failures: Dict[str, int] = defaultdict(int)
+    presses = 0
+    switcher = None
+    try:
+        args.action = actions[0]
+        switcher = create_switcher(args)
+        instrument(switcher, samples)
+        scheduler = ActionScheduler(switcher.run) if args.scheduler else None
+        if args.track_layout and not switcher.layout_state.track():
+            print("Сигналы раскладок недоступны", file=sys.stderr)
+            return 2
+        for iteration in range(args.iterations):
+            action = actions[iteration % len(actions)]
+            history = [f"item {iteration}-{i} {random.random():.6f}" for i in range(args.history)]
+            session.set_history(history)
+            # Раскладка, в которой набран текст, и ожидаемая после нажатий
+            start = 0
+            if action == "last":
+                round_index = iteration // len(actions)
+                correct = args.dictionary_check and round_index % 4 == 3
+                if args.mixed_start and not correct and round_index % 2:
+                    # Английское слово, набранное в русской раскладке
+                    start = 1
+                    word = random.choice(WORDS_CORRECT)
+                    original = f"hello {convert_text(word, 'en_ru')}"
+                    converted = f"hello {word}"
+                else:
+                    word = random.choice(WORDS_CORRECT if correct else WORDS_WRONG)
+                    original = f"hello {word}"
+                    converted = original if correct else f"hello {convert_text(word, 'en_ru')}"
+                app.reset(original)
+                count = args.burst
+            else:
+                correct = False
+                # Номер итерации делает выделение новым: PRIMARY не устаревает
+                original = f"{selection} {iteration}"
+                converted = f"{selection_expected} {iteration}"
+                app.reset(original, select_all=True)
+                # Повторные нажатия отменяют замену: выделенный текст сверяется с журналом
+                count = args.burst
+            session.set_layout(start)
+            expected_layout = start if correct or count % 2 == 0 else 1 - start
+            # Новый текст в приложении: прошлые замены отменять нельзя
+            switcher.journal.clear()
+            if scheduler is not None:
+                threads = [
+                    threading.Thread(target=scheduler.submit, args=(action,))
+                    for _ in range(count)
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            else:
+                for _ in range(count):
+                    switcher.run(action)
+            presses += count
+            switcher.pipeline.wait_idle()
+            app.sync()
+            expected = converted if count % 2 else original
+            if app.text != expected:
+                failures["text"] += 1
+            # В заполненной истории Klipper вытесняет нижние элементы, и
+            # восстановление их не возвращает
+            kept = history
+            if len(history) >= args.max_items:
+                kept = history[: max(len(session.history), args.max_items - count - 1)]
+            with session.lock:
+                if session.history != kept:
+                    failures["history"] += 1
+                if session.layout != expected_layout:
+                    failures["layout"] += 1
+    finally:
+        if switcher is not None:
+            switcher.close()
+        app.stop()
+        session.stop()
+        bus.terminate()
+        bus.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(
+        f"presses={presses} history={args.history} burst={args.burst} "
+        f"service_latency={args.service_latency} app_latency={args.app_latency} "
+        f"strategy={args.strategy} selection={len(selection)} "
+        f"clipboard={args.clipboard_backend} primary={args.primary} "
+        f"scheduler={args.scheduler} layouts={args.layouts} "
+        f"mixed_start={args.mixed_start} track_layout={args.track_layout}"
+    )
+    print(f"{'stage':<18} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for stage, values in samples.items():
+        print(
+            f"{stage:<18} {len(values):>7} {percentile(values, 0.5) * 1e3:>9.3f} "
+            f"{percentile(values, 0.95) * 1e3:>9.3f} {percentile(values, 0.99) * 1e3:>9.3f}"
+        )
+    print(
+        f"failures: text={failures['text']} history={failures['history']} "
+        f"layout={failures['layout']} of {args.iterations} iterations"
+    )
+    return 1 if any(failures.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
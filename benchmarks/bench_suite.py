@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Набор микробенчмарков горячих путей lipunto
+Измеряет преобразование текста, поиск словарей раскладок, создание
+настроек, разбор аргументов и накладные расходы отключенного логгера.
+Результаты сравниваются с сохраненными базовыми значениями; при замедлении
+больше порога скрипт завершается с кодом 1. Сеть и рабочий стол не нужны.
+
+Запуск:
+    python benchmarks/bench_suite.py                 # сравнить с baselines.json
+    python benchmarks/bench_suite.py --save          # сохранить базовые значения
+    python benchmarks/bench_suite.py --threshold 0.5 --only conversion
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_conversion import make_text  # noqa: E402
+from cli_args import create_arg_parser  # noqa: E402
+from keyboard_layouts import get_layout_dict  # noqa: E402
+from logger import LipuntoLogger, Payload, span, traced  # noqa: E402
+
+BASELINES = Path(__file__).resolve().parent / "baselines.json"
+DEFAULT_THRESHOLD = 0.25
+# Число повторов; берется лучший, так как шум только замедляет
+REPEATS = 5
+
+ARGV = ["selected", "--layout", "en_ru", "--delay-paste", "0.05", "--no-popup"]
+
+# Бенчмарк: имя -> (функция, создающая измеряемый вызов, единица работы)
+Benchmark = Tuple[Callable[[], Optional[Callable[[], object]]], int]
+
+
+def _switcher(layout: str):
+    """LayoutSwitcher без D-Bus и ydotool: нужны только settings и logger"""
+    from layout_state import LayoutState
+    from settings_cache import SettingsView
+    from switch_layout import LayoutSwitcher
+
+    switcher = LayoutSwitcher.__new__(LayoutSwitcher)
+    switcher.settings = SettingsView({"layout": layout})
+    switcher.layout = layout
+    # Активная раскладка неизвестна - используется настроенная пара
+    switcher.layout_state = LayoutState(None, None)
+    switcher.logger = LipuntoLogger({"enabled": False})
+    return switcher
+
+
+def _switch_text(size: int, segment: bool = False):
+    def setup():
+        switcher = _switcher("en_ru")
+        text = make_text(size)
+        return lambda: switcher.switch_text_layout(text, segment)
+
+    return setup
+
+
+def _layout_dict():
+    layouts = ["en_ru", "ru_en", "en_uk", "de_ru"]
+    for name in layouts:
+        get_layout_dict(name)
+    return lambda: [get_layout_dict(name) for name in layouts]
+
+
+def _settings():
+    try:
+        from config_manager import build_settings
+    except ImportError:
+        # pydantic не установлен - бенчмарк пропускается
+        return None
+    args = create_arg_parser().parse_args(ARGV)
+    return lambda: build_settings(args)
+
+
+def _settings_cached():
+    from settings_cache import SettingsView, cache_key, read_cached, write_cached
+
+    path = Path(tempfile.mkdtemp()) / "settings.json"
+    key = cache_key(ARGV)
+    write_cached(key, {"layout": "en_ru", "delays": {"paste": 0.05}}, path)
+    return lambda: SettingsView(read_cached(cache_key(ARGV), path))
+
+
+def _arg_parser():
+    return lambda: create_arg_parser().parse_args(ARGV)
+
+
+def _disabled_logger():
+    logger = LipuntoLogger({"enabled": False})
+    text = "ghbdtn"
+
+    def call():
+        for _ in range(100):
+            logger.debug("Converting text: %s", Payload(text))
+
+    return call
+
+
+def _queued_info():
+    """Стоимость сообщения для вызывающего потока при записи в файл"""
+    log_file = Path(tempfile.mkdtemp()) / "lipunto.log"
+    logger = LipuntoLogger({"enabled": True, "level": "INFO", "file": str(log_file)})
+    text = make_text(600)
+
+    def call():
+        for _ in range(100):
+            logger.info("Converted text: %s", Payload(text))
+
+    return call
+
+
+def _disabled_span():
+    LipuntoLogger({"enabled": False})
+
+    @traced("stage")
+    def stage():
+        with span("dbus", method="getClipboardContents"):
+            pass
+
+    def call():
+        for _ in range(100):
+            stage()
+
+    return call
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "conversion.word": (_switch_text(8), 8),
+    "conversion.paragraph": (_switch_text(600), 600),
+    "conversion.1MB": (_switch_text(1 << 20), 1 << 20),
+    "conversion.segmented_paragraph": (_switch_text(600, segment=True), 600),
+    "layouts.get_layout_dict": (_layout_dict, 4),
+    "config.build_settings": (_settings, 1),
+    "config.settings_cache_hit": (_settings_cached, 1),
+    "config.parse_args": (_arg_parser, 1),
+    "logger.disabled_debug": (_disabled_logger, 100),
+    "logger.disabled_span": (_disabled_span, 100),
+    "logger.queued_info": (_queued_info, 100),
+}
+
+
+def measure(func: Callable[[], object], units: int) -> float:
+    """Возвращает лучшее время на единицу работы в наносекундах
+
+    Число вызовов в повторе подбирается так, чтобы повтор длился не меньше
+    0.2 с, - короткие вызовы не тонут в накладных расходах таймера.
+    """
+    # Прогрев: ленивые таблицы и модели строятся при первом вызове
+    func()
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(REPEATS, number)) / number
+    return best / units * 1e9
+
+
+def environment() -> Dict[str, str]:
+    """Описание машины: базовые значения сравнимы только на той же"""
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": str(os.cpu_count()),
+    }
+
+
+def load_baselines() -> Dict:
+    try:
+        return json.loads(BASELINES.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--save", action="store_true", help="Сохранить базовые значения")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=float(os.environ.get("LIPUNTO_BENCH_THRESHOLD", DEFAULT_THRESHOLD)),
+        help="Допустимое замедление относительно базы (0.25 = 25%%)",
+    )
+    parser.add_argument("--only", help="Запустить бенчмарки с этим префиксом")
+    args = parser.parse_args()
+
+    baselines = load_baselines()
+    reference: Dict[str, float] = baselines.get("results", {})
+    if baselines and baselines.get("environment") != environment() and not args.save:
+        print(
+            "Базовые значения сняты на другой машине или версии Python, "
+            "сравнение приблизительное",
+            file=sys.stderr,
+        )
+
+    results: Dict[str, float] = {}
+    regressions: List[str] = []
+    print(f"{'benchmark':<34} {'ns/unit':>12} {'baseline':>12} {'change':>8}")
+    for name, (setup, units) in BENCHMARKS.items():
+        if args.only and not name.startswith(args.only):
+            continue
+        func = setup()
+        if func is None:
+            print(f"{name:<34} {'skipped':>12}")
+            continue
+        value = measure(func, units)
+        results[name] = value
+        base = reference.get(name)
+        if base:
+            change = value / base - 1
+            mark = ""
+            if change > args.threshold:
+                regressions.append(name)
+                mark = " !"
+            print(f"{name:<34} {value:>12.2f} {base:>12.2f} {change:>+7.0%}{mark}")
+        else:
+            print(f"{name:<34} {value:>12.2f} {'-':>12}")
+
+    if args.save:
+        merged = dict(reference) if args.only else {}
+        merged.update(results)
+        BASELINES.write_text(
+            json.dumps(
+                {"environment": environment(), "results": merged},
+                indent=2,
+                sort_keys=True,
+            )
+            + "\n",
+            encoding="utf-8",
+        )
+        print(f"Базовые значения сохранены в {BASELINES}")
+        return 0
+
+    if regressions:
+        print(
+            f"Замедление больше {args.threshold:.0%}: {', '.join(regressions)}",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
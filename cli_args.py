@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Аргументы командной строки lipunto
+Модуль не зависит от pydantic: при действительном кэше настроек запуск
+обходится без импорта pydantic и pydantic_settings
+"""
+
+import argparse
+
+from keyboard_layouts import BUILTIN_PAIRS, get_available_layouts
+
+
+def layout_pair(value: str) -> str:
+    """Проверяет пару раскладок для --layout
+
+    Кэш раскладок XKB читается, только если пары нет среди встроенных,
+    поэтому разбор аргументов (и --help) обходится без него.
+    """
+    if value in BUILTIN_PAIRS or value in get_available_layouts():
+        return value
+    raise argparse.ArgumentTypeError(
+        f"неизвестная пара раскладок {value!r} (доступны: {', '.join(get_available_layouts())})"
+    )
+
+
+def create_arg_parser() -> argparse.ArgumentParser:
+    """Создает парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Переключатель раскладки клавиатуры")
+
+    # Группа аргументов для задержек
+    delay_group = parser.add_argument_group("Задержки")
+    delay_group.add_argument(
+        "--delay-clipboard-set",
+        type=float,
+        help="Задержка при установке содержимого буфера (секунды)",
+    )
+    delay_group.add_argument(
+        "--delay-clipboard-get",
+        type=float,
+        help="Задержка при получении содержимого буфера (секунды)",
+    )
+    delay_group.add_argument(
+        "--delay-text-process",
+        type=float,
+        help="Задержка при обработке текста (секунды)",
+    )
+    delay_group.add_argument(
+        "--delay-paste", type=float, help="Задержка при вставке текста (секунды)"
+    )
+    delay_group.add_argument(
+        "--auto-tune-delays",
+        action="store_true",
+        help="Подбирать задержки по статистике для каждого приложения "
+        "(значения задержек становятся верхними границами)",
+    )
+
+    # Группа аргументов для логирования
+    log_group = parser.add_argument_group("Логирование")
+    log_group.add_argument(
+        "--enable-logging",
+        action="store_true",
+        help="Включить логирование (отключено по умолчанию)"
+    )
+    log_group.add_argument(
+        "--log-level",
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="Уровень логирования (только при --enable-logging)"
+    )
+    log_group.add_argument("--log-file", help="Файл для логирования")
+    log_group.add_argument(
+        "--no-console-log",
+        action="store_true",
+        help="Отключить вывод логов в консоль (только при --enable-logging)"
+    )
+    log_group.add_argument(
+        "--syslog", action="store_true", help="Включить вывод логов в системный лог (только при --enable-logging)"
+    )
+    log_group.add_argument(
+        "--log-payload",
+        choices=["truncate", "hash", "full"],
+        help="Текст пользователя в логе: начало и хэш (по умолчанию), "
+        "только длина и хэш или целиком",
+    )
+    log_group.add_argument(
+        "--trace",
+        action="store_true",
+        help="Трассировать этапы действия: сводка в лог, "
+        "файл Chrome trace в --trace-dir",
+    )
+    log_group.add_argument(
+        "--trace-dir",
+        help="Каталог файлов трассировки (по умолчанию /tmp/lipunto-traces, "
+        "пустая строка - без файлов)",
+    )
+
+    # Группа аргументов для UI
+    ui_group = parser.add_argument_group("Интерфейс")
+    ui_group.add_argument(
+        "--show-popup", action="store_true", help="Включить уведомления"
+    )
+    ui_group.add_argument(
+        "--no-popup", action="store_true", help="Отключить уведомления"
+    )
+    ui_group.add_argument(
+        "--popup-timeout", type=int, help="Время отображения уведомления (1-60 секунд)"
+    )
+
+    # Основные аргументы
+    parser.add_argument(
+        "--layout",
+        default="en_ru",
+        type=layout_pair,
+        help="Пара раскладок для преобразования (по умолчанию: en_ru)",
+    )
+    parser.add_argument(
+        "--replace-strategy",
+        choices=["auto", "keys", "paste"],
+        help="Замена текста: keys - ввод клавиш, paste - вставка через буфер "
+        "обмена, auto - выбор по оценке времени (по умолчанию: auto)",
+    )
+    parser.add_argument(
+        "--clipboard-backend",
+        choices=["auto", "klipper", "wl-clipboard", "xclip"],
+        help="Буфер обмена: klipper - с сохранением истории, wl-clipboard или "
+        "xclip - без истории, auto - Klipper, если он запущен, иначе самый быстрый "
+        "из работающих (по умолчанию: auto)",
+    )
+    parser.add_argument(
+        "--toggle-window",
+        type=float,
+        help="Повторное нажатие в течение стольких секунд отменяет замену без "
+        "чтения буфера обмена, 0 - выключено (по умолчанию: 2.0)",
+    )
+    parser.add_argument(
+        "--no-segmentation",
+        action="store_true",
+        help="В режиме selected преобразовывать весь текст, а не только слова "
+        "в неверной раскладке",
+    )
+    parser.add_argument(
+        "--dictionary-check",
+        action="store_true",
+        help="Не заменять текст, если по словарю (word_index.py) исходные слова "
+        "известнее преобразованных",
+    )
+    parser.add_argument(
+        "--primary-selection",
+        action="store_true",
+        help="В режиме selected читать выделение из PRIMARY без Ctrl+C; такой "
+        "текст заменяется только вставкой",
+    )
+    parser.add_argument(
+        "--no-primary-selection",
+        action="store_true",
+        help="В режиме selected всегда копировать выделение через Ctrl+C, "
+        "не читая PRIMARY (по умолчанию)",
+    )
+
+    # Группа аргументов для режима демона
+    daemon_group = parser.add_argument_group("Демон")
+    daemon_group.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Запустить постоянный процесс, принимающий команды через Unix-сокет",
+    )
+    daemon_group.add_argument(
+        "--socket",
+        help="Путь к Unix-сокету демона (по умолчанию: $XDG_RUNTIME_DIR/lipunto.sock)",
+    )
+    daemon_group.add_argument(
+        "--keystroke-buffer",
+        action="store_true",
+        help="Запоминать нажатия из /dev/input и перенабирать последнее слово "
+        "без буфера обмена (нужна группа input)",
+    )
+    daemon_group.add_argument(
+        "--keystroke-file",
+        help="Файл записей input_event вместо устройств evdev (для проверки)",
+    )
+
+    # Группа аргументов для быстрого запуска
+    startup_group = parser.add_argument_group("Запуск")
+    startup_group.add_argument(
+        "--no-settings-cache",
+        action="store_true",
+        help="Не использовать кэш проверенных настроек",
+    )
+    startup_group.add_argument(
+        "--print-startup-profile",
+        action="store_true",
+        help="Вывести время импорта и инициализации модулей",
+    )
+
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "action",
+        default="last",
+        nargs="?",
+        choices=("last", "selected"),
+        help='Действие: "last" для последнего слова, "selected" для выделенного текста (по умолчанию: last)',
+    )
+
+    return parser
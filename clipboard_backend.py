@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Бэкенды буфера обмена для lipunto
+Буфер обмена читается и записывается через Klipper (D-Bus, с историей,
+которую lipunto сохраняет и восстанавливает), через wl-copy/wl-paste
+(Wayland) или через xclip (X11). У двух последних истории нет, поэтому
+снимок и восстановление истории для них не выполняются. В режиме 'auto'
+выбирается Klipper, если он отвечает: запись в буфер утилитами попала бы
+в его историю и осталась бы там. Без Klipper доступные бэкенды
+замеряются, и самый быстрый запоминается в файле состояния до смены сеанса.
+"""
+
+import json
+import os
+import subprocess
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from logger import get_logger, span
+from tool_paths import get_resolver
+
+BACKENDS = ("auto", "klipper", "wl-clipboard", "xclip")
+
+KLIPPER_SERVICE = "org.kde.klipper"
+KLIPPER_PATH = "/klipper"
+
+# Версия формата файла состояния
+STATE_VERSION = 1
+# Сколько раз читается буфер при замере бэкенда (берется лучшее время)
+PROBE_ROUNDS = 3
+# Граница выполнения утилиты буфера обмена (секунды)
+COMMAND_TIMEOUT = 2.0
+# Переменные окружения, определяющие сеанс: при их смене выбор повторяется
+SESSION_VARIABLES = ("DBUS_SESSION_BUS_ADDRESS", "WAYLAND_DISPLAY", "DISPLAY")
+
+
+def default_state_path() -> Path:
+    """Путь к файлу состояния с выбранным бэкендом"""
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(cache_dir) / "lipunto" / "clipboard.json"
+
+
+class KlipperBackend:
+    """Буфер обмена и история Klipper через D-Bus"""
+
+    name = "klipper"
+    has_history = True
+    commands: List[str] = []
+
+    def __init__(self, transport, call: Callable):
+        """
+        Args:
+            transport: Транспорт D-Bus из dbus_client
+            call: Функция вызова метода Klipper (ClipboardManager.klipper_call)
+        """
+        self.transport = transport
+        self._call = call
+        self.logger = get_logger()
+        # Klipper сообщает об изменении истории сигналом, если транспорт его принимает
+        self.signals = hasattr(transport, "wait_signal")
+        # qdbus не позволяет получить историю одним вызовом без потерь
+        self._bulk_history = transport.name != "qdbus"
+
+    def available(self) -> bool:
+        """Отвечает ли Klipper на шине (ошибка только записывается в лог)
+
+        Через qdbus Klipper проверяется, только если утилита qdbus
+        найдена: без нее процесс не запускается.
+        """
+        if self.transport.name == "qdbus" and not get_resolver().resolve("qdbus"):
+            self.logger.debug("Klipper unavailable: qdbus not found")
+            return False
+        try:
+            self.transport.call(KLIPPER_SERVICE, KLIPPER_PATH, "getClipboardContents")
+        except Exception as e:
+            self.logger.debug("Klipper unavailable: %s", e)
+            return False
+        return True
+
+    def get_text(self) -> str:
+        return self._call("getClipboardContents") or ""
+
+    def set_text(self, text: str) -> None:
+        self._call("setClipboardContents", text)
+
+    def remove_top(self) -> None:
+        """Удаляет верхний элемент истории"""
+        self._call("clearClipboardContents")
+
+    def clear_history(self) -> None:
+        self._call("clearClipboardHistory")
+
+    def history_item(self, index: int) -> str:
+        """Элемент истории по номеру; пустая строка - за концом истории"""
+        return self._call("getClipboardHistoryItem", index) or ""
+
+    def history(self) -> list:
+        """Возвращает всю историю буфера обмена, начиная с верхнего элемента
+
+        Через прямое соединение с шиной история читается одним вызовом
+        getClipboardHistoryMenu. qdbus выводит элементы массива построчно,
+        поэтому для него история читается по одному элементу.
+        """
+        if self._bulk_history:
+            try:
+                return list(self._call("getClipboardHistoryMenu") or [])
+            except RuntimeError as e:
+                self.logger.debug("Bulk history fetch unavailable: %s", e)
+                self._bulk_history = False
+
+        history = []
+        index = 0
+        while True:
+            item = self.history_item(index)
+            if not item:  # Пустая строка означает конец истории
+                break
+            history.append(item)
+            index += 1
+        return history
+
+
+class CommandBackend:
+    """Буфер обмена через утилиты командной строки, без истории
+
+    Текст передается через stdin/stdout, а не в командной строке.
+    """
+
+    name = ""
+    has_history = False
+    signals = False
+    # Переменная окружения, без которой утилиты не подключатся к дисплею
+    display_variable = ""
+    read_command: List[str] = []
+    write_command: List[str] = []
+
+    def __init__(self):
+        self.logger = get_logger()
+
+    @property
+    def commands(self) -> List[str]:
+        """Утилиты, которые проверяет check_dependencies"""
+        return list(dict.fromkeys([self.read_command[0], self.write_command[0]]))
+
+    def available(self) -> bool:
+        """Есть ли дисплей и все утилиты (процессы не запускаются)"""
+        if not os.environ.get(self.display_variable):
+            return False
+        resolver = get_resolver()
+        return all(resolver.resolve(command) for command in self.commands)
+
+    def _run(self, command: List[str], data: Optional[bytes] = None):
+        resolved = get_resolver().command(command)
+        try:
+            with span("exec", command=command[0]):
+                if data is None:
+                    return subprocess.run(
+                        resolved,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL,
+                        timeout=COMMAND_TIMEOUT,
+                    )
+                # Утилита остается в фоне и владеет буфером; ее вывод не
+                # читается, иначе пришлось бы ждать ее завершения
+                return subprocess.run(
+                    resolved,
+                    input=data,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=COMMAND_TIMEOUT,
+                )
+        except (OSError, subprocess.SubprocessError) as e:
+            raise RuntimeError(f"Не удалось выполнить {command[0]}: {e}") from e
+
+    def get_text(self) -> str:
+        result = self._run(self.read_command)
+        if result.returncode:
+            # Пустой буфер: wl-paste и xclip завершаются с ошибкой
+            return ""
+        return result.stdout.decode("utf-8", errors="replace")
+
+    def set_text(self, text: str) -> None:
+        result = self._run(self.write_command, text.encode("utf-8"))
+        if result.returncode:
+            raise RuntimeError(
+                f"Команда {self.write_command[0]} завершилась с кодом {result.returncode}"
+            )
+
+
+class WlClipboardBackend(CommandBackend):
+    """Буфер обмена Wayland через wl-copy и wl-paste"""
+
+    name = "wl-clipboard"
+    display_variable = "WAYLAND_DISPLAY"
+    read_command = ["wl-paste", "--no-newline"]
+    write_command = ["wl-copy"]
+
+
+class XclipBackend(CommandBackend):
+    """Буфер обмена X11 через xclip"""
+
+    name = "xclip"
+    display_variable = "DISPLAY"
+    read_command = ["xclip", "-selection", "clipboard", "-o", "-t", "UTF8_STRING"]
+    write_command = ["xclip", "-selection", "clipboard", "-i"]
+
+
+class WlPrimaryReader(WlClipboardBackend):
+    """Чтение PRIMARY-выделения Wayland через wl-paste"""
+
+    read_command = ["wl-paste", "--primary", "--no-newline"]
+    write_command = read_command
+
+
+class XclipPrimaryReader(XclipBackend):
+    """Чтение PRIMARY-выделения X11 через xclip"""
+
+    read_command = ["xclip", "-selection", "primary", "-o", "-t", "UTF8_STRING"]
+    write_command = read_command
+
+
+def create_primary_reader(clipboard_name: str = "") -> Optional[CommandBackend]:
+    """Создает читатель PRIMARY-выделения
+
+    Klipper не отдает PRIMARY через D-Bus, поэтому выделение читается
+    утилитой текущего дисплея независимо от бэкенда буфера обмена.
+    Сначала пробуется утилита того же семейства, что бэкенд буфера.
+
+    Args:
+        clipboard_name: Имя бэкенда буфера обмена
+
+    Returns:
+        Читатель с методом get_text() или None, если читать нечем
+    """
+    readers = [WlPrimaryReader(), XclipPrimaryReader()]
+    readers.sort(key=lambda reader: reader.name != clipboard_name)
+    for reader in readers:
+        if reader.available():
+            return reader
+    return None
+
+
+def make_backend(name: str, transport, call: Callable):
+    """Создает бэкенд по имени ('klipper', 'wl-clipboard', 'xclip')"""
+    if name == "wl-clipboard":
+        return WlClipboardBackend()
+    if name == "xclip":
+        return XclipBackend()
+    return KlipperBackend(transport, call)
+
+
+def measure(backend) -> Optional[float]:
+    """Лучшее время чтения буфера или None, если бэкенд не работает"""
+    if not backend.available():
+        return None
+    best = None
+    for _ in range(PROBE_ROUNDS):
+        started = time.perf_counter()
+        try:
+            backend.get_text()
+        except RuntimeError:
+            return None
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def session_key() -> str:
+    """Ключ сеанса: выбор бэкенда действителен, пока он не изменился"""
+    return "\n".join(os.environ.get(name, "") for name in SESSION_VARIABLES)
+
+
+def _load_choice(path: Path) -> Optional[str]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if (
+        not isinstance(data, dict)
+        or data.get("version") != STATE_VERSION
+        or data.get("session") != session_key()
+        or data.get("backend") not in BACKENDS[1:]
+    ):
+        return None
+    return data["backend"]
+
+
+def _save_choice(path: Path, name: str, timings: Dict[str, float]) -> None:
+    data = {
+        "version": STATE_VERSION,
+        "session": session_key(),
+        "backend": name,
+        "timings": {key: round(value, 6) for key, value in timings.items()},
+    }
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, path)
+    except OSError as e:
+        get_logger().warning("Failed to save clipboard backend choice: %s", e)
+
+
+def create_clipboard_backend(
+    kind: str, transport, call: Callable, state_path: Optional[Path] = None
+):
+    """Создает бэкенд буфера обмена
+
+    Args:
+        kind: 'klipper', 'wl-clipboard', 'xclip' или 'auto' - Klipper, если
+            он отвечает, иначе самый быстрый из работающих; выбор
+            запоминается до смены сеанса
+        transport: Транспорт D-Bus для Klipper
+        call: Функция вызова метода Klipper
+        state_path: Файл состояния; по умолчанию ~/.cache/lipunto/clipboard.json
+
+    Returns:
+        Бэкенд с методами get_text() и set_text(text)
+    """
+    if kind != "auto":
+        return make_backend(kind, transport, call)
+
+    logger = get_logger()
+    path = state_path or default_state_path()
+    name = _load_choice(path)
+    if name is not None:
+        return make_backend(name, transport, call)
+
+    timings = {}
+    # Klipper записывает в историю любое изменение буфера, поэтому при
+    # работающем Klipper утилиты не используются, даже если они быстрее
+    for candidate in BACKENDS[1:]:
+        elapsed = measure(make_backend(candidate, transport, call))
+        if elapsed is not None:
+            timings[candidate] = elapsed
+            if candidate == "klipper":
+                break
+    if not timings:
+        # Выбор не запоминается: сервис мог еще не запуститься
+        logger.warning("No clipboard backend responded, using Klipper")
+        return KlipperBackend(transport, call)
+    name = "klipper" if "klipper" in timings else min(timings, key=timings.get)
+    logger.info(
+        "Clipboard backend: %s (%s)",
+        name,
+        ", ".join(f"{key} {value * 1e3:.2f} ms" for key, value in timings.items()),
+    )
+    _save_choice(path, name, timings)
+    return make_backend(name, transport, call)
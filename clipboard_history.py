@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Снимок истории буфера обмена и расчет минимального восстановления
+Снимок хранит только хэши элементов истории (и содержимое нескольких
+последних элементов для полной перезаписи истории). Восстановление
+сравнивает снимок с текущей историей и выполняет только те операции,
+которые нужны, чтобы вернуть ее в исходное состояние. Элементы, которые
+Klipper вытеснил из заполненной истории, не возвращаются: поставить их
+обратно вниз можно только перезаписью всей истории.
+"""
+
+import hashlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Сколько последних элементов хранится целиком: их содержимого может не
+# оказаться в текущей истории, когда ее приходится перезаписывать
+TAIL_SIZE = 4
+
+
+def content_hash(text: str) -> bytes:
+    """Возвращает короткий хэш содержимого элемента истории"""
+    return hashlib.blake2b(
+        text.encode("utf-8", "surrogatepass"), digest_size=16
+    ).digest()
+
+
+class HistorySnapshot:
+    """Снимок истории буфера обмена в виде хэшей"""
+
+    __slots__ = ("hashes", "tail")
+
+    def __init__(self, items: Sequence[str], tail_size: int = TAIL_SIZE):
+        """
+        Args:
+            items: Элементы истории, начиная с текущего (верхнего)
+            tail_size: Сколько последних элементов сохранить целиком
+        """
+        self.hashes: List[bytes] = [content_hash(item) for item in items]
+        tail_items = items[max(0, len(items) - tail_size) :] if tail_size else []
+        self.tail: Dict[bytes, str] = {content_hash(i): i for i in tail_items}
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    @property
+    def top(self) -> Optional[bytes]:
+        """Хэш верхнего элемента истории"""
+        return self.hashes[0] if self.hashes else None
+
+
+class RestorePlan:
+    """План восстановления истории
+
+    Attributes:
+        remove_top: Сколько новых элементов удалить с вершины истории
+        reinsert: Элементы для повторной установки, в порядке вызова
+        full: True, если историю нужно очистить и заполнить заново
+        missing: Количество элементов, содержимое которых недоступно
+    """
+
+    __slots__ = ("remove_top", "reinsert", "full", "missing")
+
+    def __init__(self, remove_top=0, reinsert=None, full=False, missing=0):
+        self.remove_top = remove_top
+        self.reinsert: List[str] = reinsert or []
+        self.full = full
+        self.missing = missing
+
+    @property
+    def calls(self) -> int:
+        """Количество вызовов Klipper, необходимых для выполнения плана"""
+        return self.remove_top + len(self.reinsert) + (1 if self.full else 0)
+
+    def __repr__(self) -> str:
+        return (
+            f"RestorePlan(remove_top={self.remove_top}, "
+            f"reinsert={len(self.reinsert)}, full={self.full}, "
+            f"missing={self.missing})"
+        )
+
+
+def _contents(snapshot: HistorySnapshot, current: Sequence[str]) -> Dict[bytes, str]:
+    """Собирает содержимое по хэшам из текущей истории и хвоста снимка"""
+    contents = dict(snapshot.tail)
+    for item in current:
+        contents.setdefault(content_hash(item), item)
+    return contents
+
+
+def _reorder(
+    target: List[bytes], current: List[bytes], evict: bool = False
+) -> Tuple[int, int]:
+    """Находит минимальное j, при котором перемещение target[:j] на вершину
+    (в обратном порядке) превращает current в target
+
+    Элементы, которые не перемещались, должны стоять в current в исходном
+    порядке без пропусков. При evict в конце target могут отсутствовать
+    элементы, вытесненные из заполненной истории: вернуть их на место,
+    не перезаписав всю историю, нельзя.
+
+    Args:
+        target: Хэши снимка
+        current: Хэши текущей истории (только известные снимку)
+        evict: Допускать вытеснение последних элементов
+
+    Returns:
+        tuple: (j, количество вытесненных элементов)
+    """
+    position = {h: i for i, h in enumerate(target)}
+    index = {position[h]: i for i, h in enumerate(current)}
+    end = len(target)
+    if evict:
+        end = max(index, default=-1) + 1
+    # Неперемещенные элементы target[j:end] идут в current по порядку
+    j = end
+    while j > 0 and j - 1 in index and (j == end or index[j - 1] < index[j]):
+        j -= 1
+    return j, len(target) - end
+
+
+def plan_restore(snapshot: HistorySnapshot, current: Sequence[str]) -> RestorePlan:
+    """Вычисляет, какие операции вернут историю к состоянию снимка
+
+    Klipper добавляет новые элементы и перемещает повторно скопированные
+    только на вершину истории, поэтому в обычном случае план состоит из
+    удаления одного-двух верхних элементов и/или перемещения нескольких
+    элементов обратно наверх.
+
+    Args:
+        snapshot: Снимок истории до действия
+        current: Текущая история, начиная с верхнего элемента
+
+    Returns:
+        RestorePlan: План восстановления
+    """
+    current_hashes = [content_hash(item) for item in current]
+    if current_hashes == snapshot.hashes:
+        return RestorePlan()
+
+    known = set(snapshot.hashes)
+    contents = _contents(snapshot, current)
+
+    # Новые элементы допустимы только на вершине истории
+    remove_top = 0
+    while remove_top < len(current_hashes) and current_hashes[remove_top] not in known:
+        remove_top += 1
+    remaining = current_hashes[remove_top:]
+    if any(h not in known for h in remaining):
+        return _full_plan(snapshot, contents)
+
+    # История не уменьшилась - Klipper мог вытеснить ее последние элементы
+    j, evicted = _reorder(
+        snapshot.hashes, remaining, evict=len(current) >= len(snapshot)
+    )
+
+    reinsert = []
+    missing = evicted
+    for h in reversed(snapshot.hashes[:j]):
+        if h in contents:
+            reinsert.append(contents[h])
+        else:
+            missing += 1
+    return RestorePlan(remove_top=remove_top, reinsert=reinsert, missing=missing)
+
+
+def _full_plan(snapshot: HistorySnapshot, contents: Dict[bytes, str]) -> RestorePlan:
+    """План полной перезаписи истории"""
+    reinsert = []
+    missing = 0
+    for h in reversed(snapshot.hashes):
+        if h in contents:
+            reinsert.append(contents[h])
+        else:
+            missing += 1
+    return RestorePlan(reinsert=reinsert, full=True, missing=missing)
+
+
+def full_restore_plan(snapshot: HistorySnapshot, current: Sequence[str]) -> RestorePlan:
+    """План полной перезаписи истории (когда удаление элементов не сработало)"""
+    return _full_plan(snapshot, _contents(snapshot, current))
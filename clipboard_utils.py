@@ -1,35 +1,106 @@
 #!/usr/bin/env python3
+import codecs
 import subprocess
-import sys
 import time
+from typing import Optional
 
-from logger import get_logger
+from clipboard_backend import (
+    KLIPPER_PATH,
+    KLIPPER_SERVICE,
+    create_clipboard_backend,
+    create_primary_reader,
+)
+from clipboard_history import (
+    HistorySnapshot,
+    content_hash,
+    full_restore_plan,
+    plan_restore,
+)
+from dbus_client import KLIPPER_INTERFACE, create_transport
+from input_backend import chord, create_input_backend
+from keycodes import KEY_C, KEY_INSERT, KEY_LEFTCTRL, KEY_LEFTSHIFT
+from logger import get_logger, span, traced
+from tool_paths import get_resolver
+
+# Сигнал Klipper об изменении истории
+HISTORY_UPDATED = "clipboardHistoryUpdated"
+
+# Интервалы опроса буфера при ожидании изменений (секунды)
+POLL_INITIAL = 0.001
+POLL_MAX = 0.02
+# Вывод команд читается из канала частями такого размера
+READ_CHUNK = 1 << 16
 
 
 class ClipboardManager:
     """Класс для управления буфером обмена в KDE Plasma"""
 
-    # Атрибут класса для хранения истории буфера обмена
-    history = []
+    def __init__(
+        self,
+        dbus_transport: str = "auto",
+        input_backend: str = "auto",
+        clipboard_backend: str = "auto",
+    ):
+        """
+        Инициализация ClipboardManager
 
-    def __init__(self):
-        self._cached_history = []
+        Args:
+            dbus_transport: Транспорт D-Bus ('auto', 'native' или 'qdbus')
+            input_backend: Бэкенд ввода ('auto', 'socket' или 'ydotool')
+            clipboard_backend: Бэкенд буфера обмена ('auto', 'klipper',
+                'wl-clipboard' или 'xclip')
+        """
         self.logger = get_logger()
-
-    def get_class_history(self) -> list:
-        """Получает историю буфера обмена из атрибута класса"""
-        return self.history
-
-    def set_class_history(self, history: list) -> None:
-        """Устанавливает историю буфера обмена в атрибут класса"""
-        self.history = history
+        # Снимок истории буфера обмена, сделанный перед действием
+        self.history: Optional[HistorySnapshot] = None
+        # Одно соединение с сессионной шиной на все вызовы Klipper и раскладок
+        self.dbus = create_transport(dbus_transport, self._run_command)
+        self.logger.debug("Using D-Bus transport: %s", self.dbus.name)
+        # Нажатия клавиш пишутся прямо в сокет ydotoold, если он доступен
+        self.input = create_input_backend(input_backend, self._run_command)
+        self.logger.debug("Using input backend: %s", self.input.name)
+        # Буфер обмена: Klipper с историей или утилиты wl-clipboard/xclip
+        self.clipboard = create_clipboard_backend(
+            clipboard_backend, self.dbus, self.klipper_call
+        )
+        self.logger.debug("Using clipboard backend: %s", self.clipboard.name)
+        # Читатель PRIMARY-выделения: None - еще не создан, False - нечем читать
+        self._primary = None
+        # Удаляет ли clearClipboardContents верхний элемент истории
+        self._top_removal = True
+        # Фактическое время ожидания шагов последнего действия (для DelayTuner)
+        self.settle_times: dict = {}
 
     def run_qbus_command(self, commands: list) -> str:
         """
         Run qbus command
+
+        Команда в формате qdbus (сервис, путь, метод, аргументы) выполняется
+        через текущий транспорт D-Bus, результат возвращается строкой.
         """
-        commands.insert(0, "qdbus")
-        return self._run_command(commands)
+        result = self.dbus_call(*commands)
+        if result is None:
+            return ""
+        if isinstance(result, bool):
+            return "true" if result else "false"
+        if isinstance(result, list):
+            return "\n".join(str(item) for item in result)
+        return str(result)
+
+    def dbus_call(self, service: str, path: str, method: str, *args):
+        """Вызывает метод D-Bus и возвращает результат в виде значения Python"""
+        try:
+            with span("dbus", method=method):
+                return self.dbus.call(service, path, method, *args)
+        except RuntimeError:
+            raise
+        except Exception as e:
+            error_text = f"Вызов D-Bus {service} {method} завершился с ошибкой: {e}"
+            raise RuntimeError(error_text) from e
+
+    def klipper_call(self, method: str, *args):
+        """Вызывает метод Klipper"""
+        return self.dbus_call(KLIPPER_SERVICE, KLIPPER_PATH, method, *args)
 
     def run_ydotool_command(self, commands: list) -> None:
         """
@@ -38,25 +109,66 @@ class ClipboardManager:
         commands.insert(0, "ydotool")
         self._run_command(commands)
 
+    @traced("input")
+    def send_chord(self, *codes: int) -> None:
+        """Нажимает сочетание клавиш через текущий бэкенд ввода
+
+        Args:
+            *codes: Коды клавиш из keycodes, например KEY_LEFTCTRL, KEY_C
+        """
+        self.input.send_keys(chord(*codes))
+
+    @traced("input")
+    def send_keys(self, events: list) -> None:
+        """Отправляет последовательность событий клавиш одним вызовом
+
+        Args:
+            events (list): Пары (код, состояние), например из chord()
+        """
+        self.input.send_keys(events)
+
     def _run_command(self, commands: list) -> str:
         """
         Run command
+
+        Вывод читается из канала частями и декодируется по мере чтения,
+        поэтому большое содержимое буфера, полученное через qdbus, не
+        хранится одновременно в виде bytes и str. Ошибка не выводится:
+        ее сообщает тот, кто прерывает действие (main() или ответ демона),
+        а проверка доступности Klipper при выборе бэкенда остается тихой.
+
+        Raises:
+            RuntimeError: Если команда не найдена или завершилась с ошибкой
         """
         result = ""
         error_text = ""
+        # Утилита запускается по запомненному абсолютному пути без поиска в PATH
+        resolved = get_resolver().command(commands)
         try:
-            result = (
-                subprocess.check_output(commands, stderr=sys.stdout).decode().strip()
-            )
+            with span("exec", command=commands[0]):
+                with subprocess.Popen(
+                    resolved, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                ) as process:
+                    decoder = codecs.getincrementaldecoder("utf-8")()
+                    parts = []
+                    while True:
+                        chunk = process.stdout.read1(READ_CHUNK)
+                        if not chunk:
+                            break
+                        parts.append(decoder.decode(chunk))
+                    parts.append(decoder.decode(b"", final=True))
+                    # Сообщения утилиты короткие и читаются после вывода
+                    errors = process.stderr.read().decode(errors="replace").strip()
+                    returncode = process.wait()
+            result = "".join(parts).strip()
+            if returncode:
+                # These errors mean commands[0] ran but failed to execute.
+                error_text = f"Команда {commands[0]} завершилась с ошибкой:\n{errors or result}"
         except FileNotFoundError:
             # This error means the commands[0] command itself was not found.
             error_text = f"Команда {commands[0]} не найдена. Убедитесь, что она установлена и доступна в вашем PATH (например, через пакет 'qttools5-dev-tools')."
-        except subprocess.CalledProcessError as e:
-            # These errors mean commands[0] ran but failed to execute.
-            error_text = f"Команда {commands[0]} завершилась с ошибкой:\n{e.output.decode().strip()}"
 
         if error_text:
-            print(error_text, file=sys.stderr)
             raise RuntimeError(error_text)
 
         return result
@@ -65,97 +177,244 @@ class ClipboardManager:
         """
         Get last item from clipboard
         """
-        return self.run_qbus_command(
-            [
-                "org.kde.klipper",
-                "/klipper",
-                "getClipboardContents",
-            ]
-        )
+        return self.clipboard.get_text()
 
     def clear_clipboard_contents(self):
         """
         Clear clipboard contents
         """
-        self.run_qbus_command(
-            [
-                "org.kde.klipper",
-                "/klipper",
-                "clearClipboardContents",
-            ]
-        )
+        self.clipboard.remove_top()
 
+    @traced("clipboard_set")
     def set_clipboard_last_item(self, item: str, delay: float = 0):
         """
         Set clipboard last item
+
+        delay - максимальное время ожидания, пока буфер не вернет новое
+        содержимое; при delay=0 проверка не выполняется.
         """
-        self.run_qbus_command(
-            ["org.kde.klipper", "/klipper", "setClipboardContents", item]
-        )
-        self.logger.debug(f"Waiting {delay}s for clipboard set operation")
-        time.sleep(delay)
+        self.clipboard.set_text(item)
+        if delay > 0:
+            self.logger.debug("Waiting up to %ss for clipboard set operation", delay)
+            started = time.monotonic()
+            _, settled = self.wait_for_clipboard(lambda text: text == item, delay)
+            # Истекшее ожидание тоже записывается - длительностью до границы
+            self.settle_times["clipboard_set"] = time.monotonic() - started
+            if not settled:
+                self.logger.debug("Clipboard set not confirmed within %ss", delay)
+
+    @traced("primary")
+    def get_primary(self) -> Optional[str]:
+        """Читает PRIMARY-выделение, не затрагивая буфер обмена и его историю
+
+        Returns:
+            str: Текст выделения (возможно, пустой) или None, если PRIMARY
+                прочитать нечем
+        """
+        if self._primary is None:
+            self._primary = create_primary_reader(self.clipboard.name) or False
+            if self._primary:
+                self.logger.debug("Reading PRIMARY with %s", self._primary.read_command[0])
+        if not self._primary:
+            return None
+        try:
+            return self._primary.get_text()
+        except RuntimeError as e:
+            self.logger.debug("PRIMARY selection unavailable: %s", e)
+            return None
+
+    def _prepare_wait(self) -> None:
+        """Подписывается на сигнал Klipper и сбрасывает старые сигналы
 
-    def save_clipboard_history(self) -> list:
-        """Сохраняет текущую историю буфера обмена в список и атрибут класса"""
-        history = []
-        index = 0
+        Вызывается перед действием, результат которого будет ожидаться.
+        """
+        if not self.clipboard.signals:
+            return
+        try:
+            self.dbus.subscribe(KLIPPER_INTERFACE, HISTORY_UPDATED)
+            # Сигналы раскладок нужны LayoutState и не отбрасываются
+            self.dbus.drain_signals(KLIPPER_INTERFACE)
+        except Exception as e:
+            self.logger.debug("Klipper signals unavailable, polling instead: %s", e)
+
+    @traced("wait_clipboard")
+    def wait_for_clipboard(self, predicate, timeout: float) -> tuple:
+        """Ожидает, пока содержимое буфера не удовлетворит условию
+
+        Проверка выполняется сразу, затем после каждого сигнала Klipper
+        clipboardHistoryUpdated или, без сигналов, с нарастающим интервалом
+        опроса. timeout - верхняя граница ожидания, а не фиксированная пауза.
+
+        Args:
+            predicate: Функция, принимающая текст буфера
+            timeout (float): Максимальное время ожидания в секундах
+
+        Returns:
+            tuple: (текст буфера, выполнено ли условие)
+        """
+        deadline = time.monotonic() + timeout
+        interval = POLL_INITIAL
+        signals = self.clipboard.signals
         while True:
-            item = self.run_qbus_command(
-                ["org.kde.klipper", "/klipper", "getClipboardHistoryItem", str(index)]
-            )
-            if not item:  # Пустая строка означает конец истории
-                break
-            history.append(item)
-            index += 1
-        self.history = history
-        return history
-
-    def get_cached_clipboard_history(self) -> list:
-        """Получает закэшированную историю или обновляет ее"""
-        if not self.history:
-            self.history = self.save_clipboard_history()
+            text = self.get_clipboard_last_item()
+            if predicate(text):
+                return text, True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return text, False
+            wait = min(interval, remaining)
+            if signals:
+                try:
+                    with span("wait_signal"):
+                        self.dbus.wait_signal(KLIPPER_INTERFACE, HISTORY_UPDATED, wait)
+                except Exception:
+                    signals = False
+                    with span("sleep", seconds=wait):
+                        time.sleep(wait)
+            else:
+                with span("sleep", seconds=wait):
+                    time.sleep(wait)
+            interval = min(interval * 2, POLL_MAX)
+
+    def fetch_clipboard_history(self) -> list:
+        """Получает всю историю буфера обмена, начиная с верхнего элемента"""
+        return self.clipboard.history()
+
+    @traced("history_snapshot")
+    def save_clipboard_history(self) -> HistorySnapshot:
+        """Сохраняет снимок текущей истории буфера обмена (хэши элементов)
+
+        У бэкенда без истории запоминается только текущее содержимое: по
+        нему копирование узнает, что буфер изменился.
+        """
+        if self.clipboard.has_history:
+            items = self.fetch_clipboard_history()
+        else:
+            items = [self.get_clipboard_last_item()]
+        self.history = HistorySnapshot(items)
+        self.logger.debug("Saved clipboard history snapshot: %d items", len(self.history))
         return self.history
 
+    @traced("history_restore")
     def restore_clipboard_history(self) -> None:
-        """Восстанавливает историю буфера обмена из списка и обновляет атрибут класса"""
-        # Сначала очищаем текущую историю
-        self.run_qbus_command(["org.kde.klipper", "/klipper", "clearClipboardHistory"])
+        """Восстанавливает историю буфера обмена по снимку
+
+        Сравнивает текущую историю со снимком и выполняет только нужные
+        операции: удаляет добавленные действием элементы с вершины и
+        возвращает наверх перемещенные. Полная перезапись истории
+        выполняется, только если иначе восстановить порядок нельзя.
+        """
+        if self.history is None or not self.clipboard.has_history:
+            return
+        snapshot = self.history
+        current = self.fetch_clipboard_history()
+        plan = plan_restore(snapshot, current)
+        self.logger.debug(
+            "Clipboard history restore plan: remove %d, reinsert %d, full %s",
+            plan.remove_top,
+            len(plan.reinsert),
+            plan.full,
+        )
+
+        removed = False
+        if plan.remove_top and self._top_removal:
+            for _ in range(plan.remove_top):
+                self.clear_clipboard_contents()
+            # История не читается заново: если элементы удалены, за ее
+            # концом пусто, иначе там остался последний элемент
+            removed = not self.clipboard.history_item(len(current) - plan.remove_top)
+            if removed:
+                current = current[plan.remove_top :]
+                plan.remove_top = 0
+            else:
+                # Эта версия Klipper не удаляет элемент из истории
+                self.logger.debug("clearClipboardContents keeps history items")
+                self._top_removal = False
+        if plan.remove_top:
+            plan = full_restore_plan(snapshot, current)
 
-        # Затем восстанавливаем элементы в обратном порядке
-        for item in reversed(self.history):
+        if plan.full:
+            self.clipboard.clear_history()
+        for item in plan.reinsert:
             self.set_clipboard_last_item(item)
+        if removed and not plan.reinsert and current:
+            # После очистки буфер пуст - возвращаем в него верхний элемент
+            self.set_clipboard_last_item(current[0])
+        if plan.missing:
+            self.logger.warning(
+                "%d clipboard history items could not be restored", plan.missing
+            )
 
-    def get_selection(self, delay: float = 0) -> str:
-        """Get the last word using ydotool (Ctrl+C) and copy it to clipboard
-        key codes: 29=Ctrl, 46=C
+    @traced("copy")
+    def copy_selection(self, snapshot: HistorySnapshot, delay: float = 0) -> str:
+        """Копирует выделение (Ctrl+C) и ждет нового содержимого буфера
+
+        История не восстанавливается: снимок остается в self.history до
+        release_history(), чтобы копирование и вставка одного действия
+        восстанавливались за один раз.
+
+        Args:
+            snapshot (HistorySnapshot): Снимок истории, снятый до копирования
+            delay (float): Максимальное ожидание нового содержимого
+
+        Returns:
+            str: Скопированный текст или пустая строка, если буфер не
+            изменился: прежнее содержимое буфера не считается выделением,
+            иначе замена стерла бы в приложении невыделенный текст
         """
-        # Сохраняем текущую историю
-        last_item = self.get_clipboard_last_item()
-        self.save_clipboard_history()
+        self._prepare_wait()
         # Выполняем копирование
-        self.run_ydotool_command(["key", "29:1", "46:1", "46:0", "29:0"])  # Ctrl+C
-        # Ждем немного, чтобы история обновилась
-        self.logger.debug(f"Waiting {delay}s for clipboard get operation")
-        time.sleep(delay)
-        # Получаем скопированный текст
-        selection = self.get_clipboard_last_item()
-        self.restore_clipboard_history()
-        if last_item:
-            self.set_clipboard_last_item(last_item)
+        self.send_chord(KEY_LEFTCTRL, KEY_C)
+        started = time.monotonic()
+        # Ждем, пока в буфере не появится новое содержимое (не дольше delay)
+        self.logger.debug("Waiting up to %ss for clipboard get operation", delay)
+        selection, changed = self.wait_for_clipboard(
+            lambda text: content_hash(text) != snapshot.top, delay
+        )
+        if delay > 0:
+            # Истекшее ожидание тоже записывается - длительностью до границы
+            self.settle_times["clipboard_get"] = time.monotonic() - started
+        if not changed:
+            self.logger.debug("Clipboard did not change, copy not confirmed")
+            return ""
+        return selection
 
+    @traced("selection")
+    def get_selection(self, delay: float = 0) -> str:
+        """Get the last word using ydotool (Ctrl+C) and copy it to clipboard"""
+        # Сохраняем снимок текущей истории (верхний элемент - текущий буфер)
+        snapshot = self.save_clipboard_history()
+        selection = self.copy_selection(snapshot, delay)
+        self.release_history()
         return selection
 
-    def paste_text(self, new_text: str, delay: float = 0) -> None:
-        """Pastes text using ydotool (Shift+Insert).
-        key codes: 42=Shift, 110=Insert
-        """
-        last_item = self.get_clipboard_last_item()
-        self.set_clipboard_last_item(new_text)
-        self.run_ydotool_command(
-            ["key", "42:1", "110:1", "110:0", "42:0"]
-        )  # Shift+Insert
-        self.logger.debug(f"Waiting {delay}s for clipboard paste operation")
-        time.sleep(delay)
+    @traced("paste")
+    def send_paste(self, new_text: str, set_delay: float = 0) -> None:
+        """Устанавливает буфер и нажимает Shift+Insert
+
+        Не ждет, пока приложение прочитает буфер, и не восстанавливает
+        историю - это делает release_history() после паузы.
+        """
+        if self.history is None and self.clipboard.has_history:
+            self.save_clipboard_history()
+        self.set_clipboard_last_item(new_text, set_delay)
+        self.send_chord(KEY_LEFTSHIFT, KEY_INSERT)
+
+    def release_history(self) -> None:
+        """Восстанавливает историю по снимку действия и забывает снимок"""
         self.restore_clipboard_history()
-        if last_item:
-            self.set_clipboard_last_item(last_item)
+        # Цикл действия завершен - снимок больше не нужен
+        self.history = None
+
+    def paste_text(self, new_text: str, delay: float = 0, set_delay: float = 0) -> None:
+        """Pastes text using ydotool (Shift+Insert).
+
+        set_delay - максимальное ожидание установки буфера; delay - пауза
+        после вставки: момент, когда приложение прочитало буфер, не
+        наблюдаем, поэтому эта задержка остается фиксированной.
+        """
+        self.send_paste(new_text, set_delay)
+        self.logger.debug("Waiting %ss for clipboard paste operation", delay)
+        with span("sleep", step="paste"):
+            time.sleep(delay)
+        self.release_history()
@@ -10,6 +10,10 @@ import argparse
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
+# Парсер аргументов не зависит от pydantic и вынесен в cli_args, чтобы
+# быстрый запуск с кэшем настроек не импортировал pydantic
+from cli_args import create_arg_parser  # noqa: F401
+
 
 class DelaysConfig(BaseSettings):
     """Конфигурация задержек"""
@@ -26,6 +30,10 @@ class DelaysConfig(BaseSettings):
     paste: float = Field(
         0.1, ge=0.0, le=10.0, description="Задержка при вставке текста"
     )
+    auto_tune: bool = Field(
+        False,
+        description="Подбирать задержки по статистике для каждого приложения",
+    )
 
     class Config:
         populate_by_name = True
@@ -48,6 +56,20 @@ class LoggingConfig(BaseSettings):
     file: str = Field("/tmp/lipunto.log", description="Файл для логирования")
     console: bool = Field(False, description="Выводить в консоль")
     syslog: bool = Field(False, description="Выводить в системный лог")
+    max_bytes: int = Field(
+        1 << 20, ge=0, description="Размер файла лога до ротации (0 - без ротации)"
+    )
+    backup_count: int = Field(3, ge=0, description="Число старых файлов лога")
+    payload: str = Field(
+        "truncate",
+        pattern="^(truncate|hash|full)$",
+        description="Текст пользователя в логе: начало, только хэш или целиком",
+    )
+    trace: bool = Field(False, description="Трассировать этапы действия")
+    trace_dir: str = Field(
+        "/tmp/lipunto-traces",
+        description="Каталог файлов трассировки Chrome trace (пусто - только сводка)",
+    )
 
     class Config:
         populate_by_name = True
@@ -79,6 +101,48 @@ class LipuntoSettings(BaseSettings):
     """Основная модель настроек lipunto"""
 
     layout: str = Field("en_ru", description="Пара раскладок для преобразования")
+    dbus_transport: str = Field(
+        "auto",
+        pattern="^(auto|native|qdbus)$",
+        description="Транспорт D-Bus: прямое соединение с шиной или qdbus",
+    )
+    input_backend: str = Field(
+        "auto",
+        pattern="^(auto|socket|ydotool)$",
+        description="Эмуляция ввода: запись в сокет ydotoold или утилита ydotool",
+    )
+    segment_selection: bool = Field(
+        True,
+        description="В режиме selected преобразовывать только слова в неверной раскладке",
+    )
+    dictionary_check: bool = Field(
+        False,
+        description="Не заменять текст, если исходные слова известнее преобразованных",
+    )
+    primary_selection: bool = Field(
+        False,
+        description="В режиме selected читать выделение из PRIMARY без Ctrl+C",
+    )
+    clipboard_backend: str = Field(
+        "auto",
+        pattern="^(auto|klipper|wl-clipboard|xclip)$",
+        description="Буфер обмена: Klipper с историей, wl-clipboard, xclip или auto",
+    )
+    replace_strategy: str = Field(
+        "auto",
+        pattern="^(auto|keys|paste)$",
+        description="Замена текста: ввод клавиш, вставка через буфер или выбор по стоимости",
+    )
+    keystroke_buffer: bool = Field(
+        False,
+        description="В режиме демона брать последнее слово из нажатий evdev",
+    )
+    toggle_window: float = Field(
+        2.0,
+        ge=0.0,
+        le=60.0,
+        description="Окно повторного нажатия, отменяющего замену (0 - выключено)",
+    )
     delays: DelaysConfig
     logging: LoggingConfig
     ui: UIConfig
@@ -100,80 +164,56 @@ class LipuntoSettings(BaseSettings):
         extra = "ignore"
 
 
-def create_arg_parser() -> argparse.ArgumentParser:
-    """Создает парсер аргументов командной строки"""
-    parser = argparse.ArgumentParser(description="Переключатель раскладки клавиатуры")
-
-    # Группа аргументов для задержек
-    delay_group = parser.add_argument_group("Задержки")
-    delay_group.add_argument(
-        "--delay-clipboard-set",
-        type=float,
-        help="Задержка при установке содержимого буфера (секунды)",
-    )
-    delay_group.add_argument(
-        "--delay-clipboard-get",
-        type=float,
-        help="Задержка при получении содержимого буфера (секунды)",
-    )
-    delay_group.add_argument(
-        "--delay-text-process",
-        type=float,
-        help="Задержка при обработке текста (секунды)",
-    )
-    delay_group.add_argument(
-        "--delay-paste", type=float, help="Задержка при вставке текста (секунды)"
-    )
-
-    # Группа аргументов для логирования
-    log_group = parser.add_argument_group("Логирование")
-    log_group.add_argument(
-        "--enable-logging",
-        action="store_true",
-        help="Включить логирование (отключено по умолчанию)"
-    )
-    log_group.add_argument(
-        "--log-level",
-        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
-        help="Уровень логирования (только при --enable-logging)"
-    )
-    log_group.add_argument("--log-file", help="Файл для логирования")
-    log_group.add_argument(
-        "--no-console-log",
-        action="store_true",
-        help="Отключить вывод логов в консоль (только при --enable-logging)"
-    )
-    log_group.add_argument(
-        "--syslog", action="store_true", help="Включить вывод логов в системный лог (только при --enable-logging)"
-    )
-
-    # Группа аргументов для UI
-    ui_group = parser.add_argument_group("Интерфейс")
-    ui_group.add_argument(
-        "--show-popup", action="store_true", help="Включить уведомления"
-    )
-    ui_group.add_argument(
-        "--no-popup", action="store_true", help="Отключить уведомления"
-    )
-    ui_group.add_argument(
-        "--popup-timeout", type=int, help="Время отображения уведомления (1-60 секунд)"
-    )
-
-    # Основные аргументы
-    parser.add_argument(
-        "--layout",
-        default="en_ru",
-        choices=["en_ru", "ru_en"],
-        help="Пара раскладок для преобразования (по умолчанию: en_ru)",
+def build_settings(args: argparse.Namespace) -> LipuntoSettings:
+    """Создает и проверяет настройки из аргументов командной строки и окружения
+
+    Args:
+        args: Результат create_arg_parser().parse_args()
+
+    Returns:
+        LipuntoSettings: Проверенные настройки
+    """
+    delays_config = DelaysConfig(
+        clipboard_set=args.delay_clipboard_set or 0.05,
+        clipboard_get=args.delay_clipboard_get or 0.05,
+        text_process=args.delay_text_process or 0.05,
+        paste=args.delay_paste or 0.1,
+        # Флаг только включает автоподбор, иначе действует LIPUNTO_DELAY_AUTO_TUNE
+        **({"auto_tune": True} if args.auto_tune_delays else {}),
+    )
+
+    # Определяем, включено ли логирование
+    logging_enabled = args.enable_logging
+
+    logging_config = LoggingConfig(
+        enabled=logging_enabled,
+        level=args.log_level if logging_enabled and args.log_level else "WARNING",
+        file=args.log_file or "/tmp/lipunto.log",
+        console=not args.no_console_log
+        if logging_enabled and args.no_console_log is not None
+        else False,
+        syslog=args.syslog or False,
+        **({"payload": args.log_payload} if args.log_payload else {}),
+        **({"trace": True} if args.trace else {}),
+        **({"trace_dir": args.trace_dir} if args.trace_dir is not None else {}),
+    )
+
+    ui_config = UIConfig(
+        show_popup=args.show_popup if args.show_popup else False,
+        popup_timeout=args.popup_timeout or 5,
+    )
+
+    return LipuntoSettings(
+        layout=args.layout,
+        delays=delays_config,
+        logging=logging_config,
+        ui=ui_config,
+        **({"segment_selection": False} if args.no_segmentation else {}),
+        **({"primary_selection": True} if args.primary_selection else {}),
+        **({"primary_selection": False} if args.no_primary_selection else {}),
+        **({"dictionary_check": True} if args.dictionary_check else {}),
+        **({"keystroke_buffer": True} if args.keystroke_buffer else {}),
+        **({"replace_strategy": args.replace_strategy} if args.replace_strategy else {}),
+        **({"clipboard_backend": args.clipboard_backend} if args.clipboard_backend else {}),
+        **({"toggle_window": args.toggle_window} if args.toggle_window is not None else {}),
     )
-
-    group = parser.add_mutually_exclusive_group()
-    group.add_argument(
-        "action",
-        default="last",
-        nargs="?",
-        choices=("last", "selected"),
-        help='Действие: "last" для последнего слова, "selected" для выделенного текста (по умолчанию: last)',
-    )
-
-    return parser
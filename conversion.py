@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Движок преобразования текста между раскладками
+Каждая пара раскладок один раз компилируется в таблицу для str.translate
+и кэшируется на время жизни процесса. Для очень больших текстов, если
+установлен numpy, используется векторизованный поиск по кодовым точкам;
+numpy импортируется только при первом таком тексте, чтобы не замедлять
+запуск; массивы строятся для частей текста по VECTOR_CHUNK символов, чтобы
+пиковая память не зависела от размера выделения.
+"""
+
+from functools import lru_cache
+from typing import Dict, List
+
+from keyboard_layouts import get_layout_dict
+
+# Модуль numpy: None - еще не загружался, False - не установлен
+np = None
+
+# Начиная с этого размера текста используется векторизованный путь
+VECTOR_THRESHOLD = 1 << 20
+# Размер части текста в векторизованном пути: промежуточные массивы
+# (UTF-32, маска, результат) в несколько раз больше самого текста
+VECTOR_CHUNK = 1 << 18
+
+
+def build_mapping(layout_name: str) -> Dict[int, str]:
+    """Строит отображение кодовая точка -> символ для пары раскладок
+
+    Приоритет совпадает с прежним посимвольным алгоритмом: символ ищется
+    сначала в прямом словаре, затем в обратном.
+
+    Args:
+        layout_name (str): Название пары раскладок ('en_ru', 'ru_en', ...)
+
+    Returns:
+        dict: Отображение кодовых точек
+    """
+    forward_dict, reverse_dict = get_layout_dict(layout_name)
+    mapping = {ord(k): v for k, v in reverse_dict.items()}
+    mapping.update({ord(k): v for k, v in forward_dict.items()})
+    return mapping
+
+
+def load_numpy():
+    """Лениво импортирует numpy (необязательная зависимость)
+
+    Returns:
+        Модуль numpy или None, если он не установлен
+    """
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            np = False
+        else:
+            np = numpy
+    return np or None
+
+
+class ConversionEngine:
+    """Скомпилированное преобразование для одной пары раскладок"""
+
+    def __init__(self, layout_name: str):
+        """
+        Args:
+            layout_name (str): Название пары раскладок
+        """
+        self.layout_name = layout_name
+        self.mapping = build_mapping(layout_name)
+        size = max(self.mapping) + 1 if self.mapping else 0
+        # Плотная таблица по кодовым точкам быстрее словаря в str.translate;
+        # символы за ее пределами str.translate оставляет без изменений
+        table: List[str] = [chr(i) for i in range(size)]
+        for code, char in self.mapping.items():
+            table[code] = char
+        self.table = table
+        self._size = size
+        # Таблица для numpy: None - еще не строилась, False - недоступна
+        self._lookup = None
+
+    def _vector_lookup(self):
+        """Строит таблицу кодовых точек для векторизованного пути"""
+        if self._lookup is None:
+            self._lookup = False
+            numpy = load_numpy()
+            if numpy is not None and all(len(v) == 1 for v in self.mapping.values()):
+                lookup = numpy.arange(self._size, dtype=numpy.uint32)
+                for code, char in self.mapping.items():
+                    lookup[code] = ord(char)
+                self._lookup = lookup
+        return self._lookup if self._lookup is not False else None
+
+    def convert(self, text: str) -> str:
+        """Преобразует текст
+
+        Args:
+            text (str): Исходный текст
+
+        Returns:
+            str: Преобразованный текст
+        """
+        if len(text) >= VECTOR_THRESHOLD and self._vector_lookup() is not None:
+            return self._convert_vectorized(text)
+        return text.translate(self.table)
+
+    def _convert_vectorized(self, text: str) -> str:
+        """Преобразование через массив кодовых точек (numpy) по частям"""
+        return "".join(
+            self._convert_chunk(text[start : start + VECTOR_CHUNK])
+            for start in range(0, len(text), VECTOR_CHUNK)
+        )
+
+    def _convert_chunk(self, text: str) -> str:
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        inside = codes < self._size
+        result = codes.copy()
+        result[inside] = self._lookup[codes[inside]]
+        return result.tobytes().decode("utf-32-le")
+
+
+@lru_cache(maxsize=None)
+def get_engine(layout_name: str) -> ConversionEngine:
+    """Возвращает закэшированный движок для пары раскладок"""
+    return ConversionEngine(layout_name)
+
+
+def convert_text(text: str, layout_name: str) -> str:
+    """Преобразует текст для указанной пары раскладок"""
+    return get_engine(layout_name).convert(text)
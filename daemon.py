@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Демон lipunto
+Держит LayoutSwitcher и ClipboardManager в памяти и принимает команды
+"last"/"selected" через Unix-сокет, чтобы нажатие горячей клавиши не
+требовало запуска нового интерпретатора Python. Каждое соединение
+обслуживается своим потоком, а действия выполняются по очереди
+ActionScheduler: нажатия, пришедшие во время действия, сливаются
+"""
+
+import os
+import signal
+import socket
+import threading
+from pathlib import Path
+from typing import Optional
+
+from logger import get_logger
+from scheduler import ActionScheduler
+
+# Допустимые команды демона
+ACTIONS = ("last", "selected")
+# Максимальный размер одной команды
+MAX_COMMAND_SIZE = 64
+
+
+def default_socket_path() -> str:
+    """Возвращает путь к сокету демона по умолчанию
+
+    Сокет размещается в $XDG_RUNTIME_DIR, а при его отсутствии - в /tmp
+    с идентификатором пользователя в имени.
+
+    Returns:
+        str: Путь к Unix-сокету
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "lipunto.sock")
+    return f"/tmp/lipunto-{os.getuid()}.sock"
+
+
+class LipuntoDaemon:
+    """Долгоживущий процесс, выполняющий действия LayoutSwitcher по запросу"""
+
+    def __init__(self, switcher, socket_path: Optional[str] = None, keystrokes=None):
+        """
+        Инициализация демона
+
+        Args:
+            switcher: Экземпляр LayoutSwitcher, созданный один раз при запуске
+            socket_path: Путь к Unix-сокету. Если None, используется путь по умолчанию
+            keystrokes: KeystrokeMonitor с буфером набранных клавиш. Если задан,
+                действие "last" перенабирает слово без буфера обмена
+        """
+        self.switcher = switcher
+        self.socket_path = socket_path or default_socket_path()
+        self.keystrokes = keystrokes
+        # Счетчик правок буфера нажатий отличает повторное нажатие от нового слова
+        self.switcher.keystrokes = keystrokes
+        self.logger = get_logger()
+        # Очередь действий: одно действие за раз, серии нажатий сливаются
+        self.scheduler = ActionScheduler(self.execute)
+        self._server: Optional[socket.socket] = None
+        self._running = False
+
+    def _bind(self) -> socket.socket:
+        """Создает слушающий сокет, удаляя устаревший файл сокета"""
+        path = Path(self.socket_path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            # Сокет мог остаться от аварийно завершенного демона
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                path.unlink()
+            else:
+                raise RuntimeError(
+                    f"Демон lipunto уже запущен на сокете {self.socket_path}"
+                )
+            finally:
+                probe.close()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        server.listen(8)
+        return server
+
+    def handle_command(self, command: str) -> str:
+        """Выполняет одну команду и возвращает строку ответа
+
+        Args:
+            command (str): Команда ('last', 'selected' или 'ping')
+
+        Returns:
+            str: "ok" при успехе или "error <описание>"
+        """
+        if command == "ping":
+            return "ok"
+        if command not in ACTIONS:
+            return f"error unknown command: {command!r}"
+        try:
+            self.scheduler.submit(command)
+        except Exception as e:
+            self.logger.exception("Action '%s' failed: %s", command, e)
+            return f"error {e}"
+        return "ok"
+
+    def execute(self, command: str) -> None:
+        """Выполняет одно действие (вызывается планировщиком)
+
+        Args:
+            command (str): Действие ('last' или 'selected')
+        """
+        strokes = self.keystrokes.buffer.last_word() if self.keystrokes else []
+        # Повторное нажатие отменяет замену по журналу в конвейере
+        if command == "last" and strokes and not self.switcher.toggle_entry(command):
+            self.switcher.retype_last_word(strokes)
+        else:
+            self.switcher.run(command)
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        """Читает команду из соединения и отправляет ответ"""
+        with conn:
+            conn.settimeout(1.0)
+            try:
+                data = conn.recv(MAX_COMMAND_SIZE)
+            except OSError as e:
+                self.logger.warning("Failed to read command: %s", e)
+                return
+            command = data.decode("utf-8", errors="replace").strip()
+            self.logger.debug("Received command: %r", command)
+            reply = self.handle_command(command)
+            try:
+                conn.sendall(reply.encode("utf-8") + b"\n")
+            except OSError:
+                # Клиент мог не дожидаться ответа
+                pass
+
+    def stop(self, *_args) -> None:
+        """Останавливает цикл обработки команд"""
+        self._running = False
+        if self._server is not None:
+            self._server.close()
+
+    def serve_forever(self) -> None:
+        """Основной цикл демона: соединения принимаются сразу, действия
+        выполняются по очереди планировщиком"""
+        self._server = self._bind()
+        self._running = True
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+        self.logger.info("lipunto daemon listening on %s", self.socket_path)
+        # Раскладка отслеживается сигналами: действие не запрашивает ее заново
+        if self.switcher.layout_state.track():
+            self.logger.info("Tracking keyboard layout through D-Bus signals")
+        try:
+            while self._running:
+                try:
+                    conn, _ = self._server.accept()
+                except OSError:
+                    # Сокет закрыт обработчиком сигнала
+                    break
+                # Нажатие во время действия должно попасть в очередь, а не
+                # ждать в очереди сокета
+                threading.Thread(
+                    target=self._serve_connection, args=(conn,), daemon=True
+                ).start()
+        finally:
+            self._server.close()
+            if self.keystrokes is not None:
+                self.keystrokes.stop()
+            self.switcher.close()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+            self.logger.info("lipunto daemon stopped")
@@ -0,0 +1,904 @@
+#!/usr/bin/env python3
+"""
+Клиент D-Bus для lipunto
+Содержит минимальную реализацию протокола D-Bus на чистом Python и
+транспорты для вызова методов Klipper и KDE-раскладок: через одно
+постоянное соединение с сессионной шиной или через утилиту qdbus
+"""
+
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logger import get_logger
+
+# Типы сообщений D-Bus
+METHOD_CALL = 1
+METHOD_RETURN = 2
+ERROR = 3
+SIGNAL = 4
+
+# Флаги сообщений
+NO_REPLY_EXPECTED = 0x1
+
+# Коды полей заголовка
+FIELD_PATH = 1
+FIELD_INTERFACE = 2
+FIELD_MEMBER = 3
+FIELD_ERROR_NAME = 4
+FIELD_REPLY_SERIAL = 5
+FIELD_DESTINATION = 6
+FIELD_SENDER = 7
+FIELD_SIGNATURE = 8
+
+_HEADER_FIELD_TYPES = {
+    FIELD_PATH: "o",
+    FIELD_INTERFACE: "s",
+    FIELD_MEMBER: "s",
+    FIELD_ERROR_NAME: "s",
+    FIELD_REPLY_SERIAL: "u",
+    FIELD_DESTINATION: "s",
+    FIELD_SENDER: "s",
+    FIELD_SIGNATURE: "g",
+}
+
+# Выравнивание и формат struct для простых типов
+_FIXED_TYPES = {
+    "y": (1, "B"),
+    "b": (4, "I"),
+    "n": (2, "h"),
+    "q": (2, "H"),
+    "i": (4, "i"),
+    "u": (4, "I"),
+    "x": (8, "q"),
+    "t": (8, "Q"),
+    "d": (8, "d"),
+    "h": (4, "I"),
+}
+_ALIGNMENT = {"s": 4, "o": 4, "g": 1, "v": 1, "a": 4, "(": 8, "{": 8}
+
+# Длинные строки кодируются в UTF-8 частями такого размера (символы)
+STRING_CHUNK = 1 << 16
+# Тело сообщения больше этого отправляется отдельно от заголовка без склейки
+SEND_COPY_LIMIT = 1 << 16
+# Аргумент qdbus длиннее этого (символы) не передается в командной строке:
+# ядро ограничивает одну строку argv 128 КиБ (MAX_ARG_STRLEN)
+ARGV_MAX_CHARS = 16 * 1024
+
+BUS_NAME = "org.freedesktop.DBus"
+BUS_PATH = "/org/freedesktop/DBus"
+
+KLIPPER_INTERFACE = "org.kde.klipper.klipper"
+KEYBOARD_INTERFACE = "org.kde.KeyboardLayouts"
+
+# Сигнатуры известных методов: имя -> (интерфейс, входная, выходная)
+METHOD_SIGNATURES: Dict[str, Tuple[str, str, str]] = {
+    "getClipboardContents": (KLIPPER_INTERFACE, "", "s"),
+    "setClipboardContents": (KLIPPER_INTERFACE, "s", ""),
+    "clearClipboardContents": (KLIPPER_INTERFACE, "", ""),
+    "clearClipboardHistory": (KLIPPER_INTERFACE, "", ""),
+    "getClipboardHistoryItem": (KLIPPER_INTERFACE, "i", "s"),
+    "getClipboardHistoryMenu": (KLIPPER_INTERFACE, "", "as"),
+    "switchToNextLayout": (KEYBOARD_INTERFACE, "", ""),
+    "switchToPreviousLayout": (KEYBOARD_INTERFACE, "", ""),
+    "getLayout": (KEYBOARD_INTERFACE, "", "u"),
+    "setLayout": (KEYBOARD_INTERFACE, "u", "b"),
+    "getLayoutsList": (KEYBOARD_INTERFACE, "", "a(sss)"),
+}
+
+
+class DBusError(RuntimeError):
+    """Ошибка, полученная от шины или удаленного объекта"""
+
+    def __init__(self, name: str, message: str = ""):
+        super().__init__(f"{name}: {message}" if message else name)
+        self.name = name
+        self.message = message
+
+
+def _type_end(signature: str, index: int) -> int:
+    """Возвращает индекс конца одного полного типа в сигнатуре"""
+    char = signature[index]
+    if char == "a":
+        return _type_end(signature, index + 1)
+    if char in "({":
+        closing = ")" if char == "(" else "}"
+        depth = 0
+        for pos in range(index, len(signature)):
+            if signature[pos] == char:
+                depth += 1
+            elif signature[pos] == closing:
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+        raise ValueError(f"Незакрытая скобка в сигнатуре {signature!r}")
+    return index + 1
+
+
+def split_signature(signature: str) -> List[str]:
+    """Разбивает сигнатуру на список полных типов"""
+    types = []
+    index = 0
+    while index < len(signature):
+        end = _type_end(signature, index)
+        types.append(signature[index:end])
+        index = end
+    return types
+
+
+def _alignment(type_code: str) -> int:
+    char = type_code[0]
+    if char in _FIXED_TYPES:
+        return _FIXED_TYPES[char][0]
+    return _ALIGNMENT[char]
+
+
+class _Writer:
+    """Сериализация значений в формат D-Bus (little endian)"""
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def align(self, n: int) -> None:
+        self.buf.extend(b"\0" * (-len(self.buf) % n))
+
+    def write(self, type_code: str, value: Any) -> None:
+        char = type_code[0]
+        if char in _FIXED_TYPES:
+            size, fmt = _FIXED_TYPES[char]
+            self.align(size)
+            self.buf.extend(struct.pack("<" + fmt, value))
+        elif char in "so":
+            self.align(4)
+            if len(value) <= STRING_CHUNK:
+                data = value.encode("utf-8")
+                self.buf.extend(struct.pack("<I", len(data)))
+                self.buf.extend(data)
+            else:
+                # Большой текст не копируется целиком в промежуточный bytes
+                length_pos = len(self.buf)
+                self.buf.extend(b"\0\0\0\0")
+                for start in range(0, len(value), STRING_CHUNK):
+                    self.buf.extend(value[start : start + STRING_CHUNK].encode("utf-8"))
+                struct.pack_into("<I", self.buf, length_pos, len(self.buf) - length_pos - 4)
+            self.buf.append(0)
+        elif char == "g":
+            data = value.encode("ascii")
+            self.buf.append(len(data))
+            self.buf.extend(data)
+            self.buf.append(0)
+        elif char == "v":
+            signature, inner = value
+            self.write("g", signature)
+            self.write(signature, inner)
+        elif char == "a":
+            element = type_code[1:]
+            self.align(4)
+            length_pos = len(self.buf)
+            self.buf.extend(b"\0\0\0\0")
+            self.align(_alignment(element))
+            start = len(self.buf)
+            items = value.items() if element[0] == "{" else value
+            for item in items:
+                self.write(element, item)
+            struct.pack_into("<I", self.buf, length_pos, len(self.buf) - start)
+        elif char in "({":
+            self.align(8)
+            for field_type, field in zip(split_signature(type_code[1:-1]), value):
+                self.write(field_type, field)
+        else:
+            raise ValueError(f"Неподдерживаемый тип D-Bus: {type_code!r}")
+
+    def write_all(self, signature: str, values) -> None:
+        for type_code, value in zip(split_signature(signature), values):
+            self.write(type_code, value)
+
+
+class _Reader:
+    """Разбор значений в формате D-Bus"""
+
+    def __init__(self, data, offset: int = 0, endian: str = "<"):
+        self.data = data
+        # Строки декодируются прямо из буфера сообщения, без копии среза
+        self.view = memoryview(data)
+        self.pos = offset
+        self.endian = endian
+
+    def align(self, n: int) -> None:
+        self.pos += -self.pos % n
+
+    def read(self, type_code: str) -> Any:
+        char = type_code[0]
+        if char in _FIXED_TYPES:
+            size, fmt = _FIXED_TYPES[char]
+            self.align(size)
+            (value,) = struct.unpack_from(self.endian + fmt, self.data, self.pos)
+            self.pos += size
+            return bool(value) if char == "b" else value
+        if char in "so":
+            self.align(4)
+            (length,) = struct.unpack_from(self.endian + "I", self.data, self.pos)
+            start = self.pos + 4
+            self.pos = start + length + 1
+            return str(self.view[start : start + length], "utf-8")
+        if char == "g":
+            length = self.data[self.pos]
+            start = self.pos + 1
+            self.pos = start + length + 1
+            return bytes(self.data[start : start + length]).decode("ascii")
+        if char == "v":
+            signature = self.read("g")
+            return self.read(signature)
+        if char == "a":
+            element = type_code[1:]
+            self.align(4)
+            (length,) = struct.unpack_from(self.endian + "I", self.data, self.pos)
+            self.pos += 4
+            self.align(_alignment(element))
+            end = self.pos + length
+            items = []
+            while self.pos < end:
+                items.append(self.read(element))
+            if element[0] == "{":
+                return dict(items)
+            return items
+        if char in "({":
+            self.align(8)
+            return tuple(self.read(t) for t in split_signature(type_code[1:-1]))
+        raise ValueError(f"Неподдерживаемый тип D-Bus: {type_code!r}")
+
+    def read_all(self, signature: str) -> tuple:
+        return tuple(self.read(t) for t in split_signature(signature))
+
+
+class Message:
+    """Сообщение D-Bus"""
+
+    def __init__(
+        self,
+        msg_type: int,
+        fields: Dict[int, Any],
+        body: tuple = (),
+        serial: int = 0,
+        flags: int = 0,
+    ):
+        self.type = msg_type
+        self.fields = fields
+        self.body = body
+        self.serial = serial
+        self.flags = flags
+
+    @property
+    def path(self) -> Optional[str]:
+        return self.fields.get(FIELD_PATH)
+
+    @property
+    def interface(self) -> Optional[str]:
+        return self.fields.get(FIELD_INTERFACE)
+
+    @property
+    def member(self) -> Optional[str]:
+        return self.fields.get(FIELD_MEMBER)
+
+    @property
+    def sender(self) -> Optional[str]:
+        return self.fields.get(FIELD_SENDER)
+
+    @property
+    def signature(self) -> str:
+        return self.fields.get(FIELD_SIGNATURE, "")
+
+    @property
+    def reply_serial(self) -> Optional[int]:
+        return self.fields.get(FIELD_REPLY_SERIAL)
+
+    def encode(self) -> bytes:
+        """Сериализует сообщение для отправки"""
+        header, body = self.encode_parts()
+        return bytes(header + body)
+
+    def encode_parts(self) -> Tuple[bytearray, bytearray]:
+        """Сериализует заголовок и тело сообщения по отдельности"""
+        body = _Writer()
+        body.write_all(self.signature, self.body)
+        header = _Writer()
+        header.write_all(
+            "yyyyuu",
+            (ord("l"), self.type, self.flags, 1, len(body.buf), self.serial),
+        )
+        fields = [
+            (code, (_HEADER_FIELD_TYPES[code], value))
+            for code, value in self.fields.items()
+            if value is not None and not (code == FIELD_SIGNATURE and value == "")
+        ]
+        header.write("a(yv)", fields)
+        header.align(8)
+        return header.buf, body.buf
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Message":
+        """Разбирает полностью прочитанное сообщение"""
+        endian = "<" if data[0:1] == b"l" else ">"
+        reader = _Reader(data, 4, endian)
+        body_length = reader.read("u")
+        serial = reader.read("u")
+        fields = dict(reader.read("a(yv)"))
+        reader.align(8)
+        body_end = reader.pos + body_length
+        signature = fields.get(FIELD_SIGNATURE, "")
+        body = reader.read_all(signature) if signature else ()
+        if reader.pos > body_end:
+            raise ValueError("Тело сообщения D-Bus повреждено")
+        return cls(data[1], fields, body, serial, data[2])
+
+
+def session_bus_address() -> str:
+    """Возвращает адрес сессионной шины"""
+    address = os.environ.get("DBUS_SESSION_BUS_ADDRESS")
+    if address:
+        return address
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")
+    return f"unix:path={runtime_dir}/bus"
+
+
+def _parse_address(address: str) -> str:
+    """Преобразует адрес шины в адрес Unix-сокета для socket.connect"""
+    for entry in address.split(";"):
+        transport, _, params = entry.partition(":")
+        if transport != "unix":
+            continue
+        options = dict(p.split("=", 1) for p in params.split(",") if "=" in p)
+        if "path" in options:
+            return options["path"]
+        if "abstract" in options:
+            return "\0" + options["abstract"]
+    raise ValueError(f"Неподдерживаемый адрес D-Bus: {address!r}")
+
+
+class DBusConnection:
+    """Соединение с шиной D-Bus через Unix-сокет
+
+    Соединение потокобезопасно: вызовы из разных потоков сериализуются.
+    Сигналы, пришедшие во время ожидания ответа, сохраняются в очереди,
+    входящие вызовы методов передаются зарегистрированным обработчикам.
+    """
+
+    def __init__(self, address: Optional[str] = None, timeout: float = 5.0):
+        """
+        Инициализация соединения
+
+        Args:
+            address: Адрес шины. Если None, используется сессионная шина
+            timeout: Время ожидания ответа на вызов по умолчанию (секунды)
+        """
+        self.address = address or session_bus_address()
+        self.timeout = timeout
+        self.unique_name: Optional[str] = None
+        self._sock: Optional[socket.socket] = None
+        self._buffer = bytearray()
+        self._serial = 0
+        self._lock = threading.RLock()
+        self._signals: deque = deque(maxlen=256)
+        self._handlers: Dict[str, Callable[[Message], Any]] = {}
+
+    # ------------------------------------------------------------------
+    # Соединение и аутентификация
+    # ------------------------------------------------------------------
+
+    def connect(self) -> "DBusConnection":
+        """Открывает соединение, выполняет аутентификацию и Hello"""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(_parse_address(self.address))
+            uid = str(os.getuid()).encode("ascii").hex()
+            sock.sendall(b"\0AUTH EXTERNAL " + uid.encode("ascii") + b"\r\n")
+            reply = b""
+            while not reply.endswith(b"\r\n"):
+                chunk = sock.recv(256)
+                if not chunk:
+                    raise ConnectionError("Шина закрыла соединение при аутентификации")
+                reply += chunk
+            if not reply.startswith(b"OK"):
+                raise ConnectionError(f"Аутентификация D-Bus отклонена: {reply!r}")
+            sock.sendall(b"BEGIN\r\n")
+        except Exception:
+            sock.close()
+            raise
+        self._sock = sock
+        (self.unique_name,) = self.call(BUS_NAME, BUS_PATH, BUS_NAME, "Hello")
+        return self
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def close(self) -> None:
+        """Закрывает соединение"""
+        with self._lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+                self._buffer.clear()
+
+    # ------------------------------------------------------------------
+    # Отправка и прием сообщений
+    # ------------------------------------------------------------------
+
+    def _next_serial(self) -> int:
+        self._serial += 1
+        return self._serial
+
+    def send(self, message: Message) -> int:
+        """Отправляет сообщение и возвращает его серийный номер"""
+        with self._lock:
+            if self._sock is None:
+                raise ConnectionError("Соединение D-Bus закрыто")
+            message.serial = self._next_serial()
+            header, body = message.encode_parts()
+            # Чтение оставляет на сокете остаток своего срока; большое
+            # сообщение отправляется дольше, поэтому срок - таймаут соединения
+            self._sock.settimeout(self.timeout)
+            if len(body) > SEND_COPY_LIMIT:
+                # Большое тело не склеивается с заголовком в новый буфер
+                self._sock.sendall(header)
+                self._sock.sendall(body)
+            else:
+                self._sock.sendall(header + body)
+            return message.serial
+
+    def _read_message(self, deadline: Optional[float]) -> Optional[Message]:
+        """Читает одно сообщение или возвращает None по истечении deadline"""
+        while True:
+            if len(self._buffer) >= 16:
+                endian = "<" if self._buffer[0:1] == b"l" else ">"
+                body_length, _, fields_length = struct.unpack_from(
+                    endian + "III", self._buffer, 4
+                )
+                header_length = 16 + fields_length + (-fields_length % 8)
+                total = header_length + body_length
+                if len(self._buffer) == total:
+                    # Буфер целиком отдается сообщению без копирования
+                    data, self._buffer = self._buffer, bytearray()
+                    return Message.decode(data)
+                if len(self._buffer) > total:
+                    data = self._buffer[:total]
+                    del self._buffer[:total]
+                    return Message.decode(data)
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+            self._sock.settimeout(remaining)
+            try:
+                chunk = self._sock.recv(65536)
+            except socket.timeout:
+                return None
+            if not chunk:
+                self.close()
+                raise ConnectionError("Шина D-Bus закрыла соединение")
+            self._buffer.extend(chunk)
+
+    def _dispatch(self, message: Message) -> None:
+        """Обрабатывает сообщение, не являющееся ожидаемым ответом"""
+        if message.type == SIGNAL:
+            self._signals.append(message)
+        elif message.type == METHOD_CALL:
+            self._handle_method_call(message)
+
+    def _handle_method_call(self, message: Message) -> None:
+        """Передает входящий вызов обработчику объекта и отправляет ответ"""
+        handler = self._handlers.get(message.path or "")
+        fields: Dict[int, Any] = {
+            FIELD_REPLY_SERIAL: message.serial,
+            FIELD_DESTINATION: message.sender,
+        }
+        if handler is None:
+            fields[FIELD_ERROR_NAME] = "org.freedesktop.DBus.Error.UnknownObject"
+            fields[FIELD_SIGNATURE] = "s"
+            reply = Message(ERROR, fields, (f"No object at {message.path}",))
+        else:
+            try:
+                signature, values = handler(message)
+                fields[FIELD_SIGNATURE] = signature
+                reply = Message(METHOD_RETURN, fields, tuple(values))
+            except DBusError as e:
+                fields[FIELD_ERROR_NAME] = e.name
+                fields[FIELD_SIGNATURE] = "s"
+                reply = Message(ERROR, fields, (e.message,))
+        if not message.flags & NO_REPLY_EXPECTED:
+            self.send(reply)
+
+    def call(
+        self,
+        destination: str,
+        path: str,
+        interface: Optional[str],
+        member: str,
+        signature: str = "",
+        args: tuple = (),
+        timeout: Optional[float] = None,
+    ) -> tuple:
+        """Вызывает метод и ожидает ответ
+
+        Args:
+            destination: Имя сервиса на шине
+            path: Путь объекта
+            interface: Интерфейс (может быть None)
+            member: Имя метода
+            signature: Сигнатура аргументов
+            args: Аргументы вызова
+            timeout: Время ожидания ответа (секунды)
+
+        Returns:
+            tuple: Значения из тела ответа
+
+        Raises:
+            DBusError: Если удаленная сторона вернула ошибку
+        """
+        message = Message(
+            METHOD_CALL,
+            {
+                FIELD_PATH: path,
+                FIELD_INTERFACE: interface,
+                FIELD_MEMBER: member,
+                FIELD_DESTINATION: destination,
+                FIELD_SIGNATURE: signature,
+            },
+            tuple(args),
+        )
+        deadline = time.monotonic() + (timeout or self.timeout)
+        with self._lock:
+            serial = self.send(message)
+            while True:
+                reply = self._read_message(deadline)
+                if reply is None:
+                    raise DBusError(
+                        "org.freedesktop.DBus.Error.NoReply",
+                        f"{destination} {member} timed out",
+                    )
+                if reply.reply_serial == serial and reply.type in (
+                    METHOD_RETURN,
+                    ERROR,
+                ):
+                    if reply.type == ERROR:
+                        text = reply.body[0] if reply.body else ""
+                        raise DBusError(reply.fields.get(FIELD_ERROR_NAME, ""), text)
+                    return reply.body
+                self._dispatch(reply)
+
+    def emit_signal(
+        self, path: str, interface: str, member: str, signature: str = "", args=()
+    ) -> None:
+        """Отправляет сигнал"""
+        self.send(
+            Message(
+                SIGNAL,
+                {
+                    FIELD_PATH: path,
+                    FIELD_INTERFACE: interface,
+                    FIELD_MEMBER: member,
+                    FIELD_SIGNATURE: signature,
+                },
+                tuple(args),
+            )
+        )
+
+    # ------------------------------------------------------------------
+    # Сигналы и экспорт объектов
+    # ------------------------------------------------------------------
+
+    def add_match(self, rule: str) -> None:
+        """Подписывается на сообщения по правилу AddMatch"""
+        self.call(BUS_NAME, BUS_PATH, BUS_NAME, "AddMatch", "s", (rule,))
+
+    def subscribe(self, interface: str, member: Optional[str] = None) -> None:
+        """Подписывается на сигналы интерфейса"""
+        rule = f"type='signal',interface='{interface}'"
+        if member:
+            rule += f",member='{member}'"
+        self.add_match(rule)
+
+    def wait_signal(
+        self,
+        interface: str,
+        member: str,
+        timeout: float,
+    ) -> Optional[Message]:
+        """Ожидает сигнал до истечения timeout
+
+        Args:
+            interface: Интерфейс сигнала
+            member: Имя сигнала
+            timeout: Максимальное время ожидания (секунды)
+
+        Returns:
+            Message или None, если сигнал не пришел
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                for signal_message in list(self._signals):
+                    if (
+                        signal_message.interface == interface
+                        and signal_message.member == member
+                    ):
+                        self._signals.remove(signal_message)
+                        return signal_message
+                message = self._read_message(deadline)
+                if message is None:
+                    return None
+                self._dispatch(message)
+
+    def drain_signals(self, interface: Optional[str] = None) -> None:
+        """Отбрасывает накопленные и уже пришедшие сигналы
+
+        Args:
+            interface: Отбросить только сигналы этого интерфейса
+        """
+        with self._lock:
+            while True:
+                message = self._read_message(time.monotonic())
+                if message is None:
+                    break
+                self._dispatch(message)
+            self._signals = deque(
+                (
+                    message
+                    for message in self._signals
+                    if interface is not None and message.interface != interface
+                ),
+                maxlen=self._signals.maxlen,
+            )
+
+    def take_signals(self, interface: str) -> List[Message]:
+        """Забирает сигналы интерфейса, уже пришедшие на сокет, без ожидания
+
+        Returns:
+            list: Сигналы в порядке получения
+        """
+        with self._lock:
+            while True:
+                message = self._read_message(time.monotonic())
+                if message is None:
+                    if not select.select([self._sock], [], [], 0)[0]:
+                        break
+                    # Данные уже пришли: остаток сообщения дочитывается сразу
+                    message = self._read_message(None)
+                self._dispatch(message)
+            taken = [message for message in self._signals if message.interface == interface]
+            self._signals = deque(
+                (message for message in self._signals if message.interface != interface),
+                maxlen=self._signals.maxlen,
+            )
+        return taken
+
+    def request_name(self, name: str) -> int:
+        """Запрашивает имя сервиса на шине"""
+        (result,) = self.call(
+            BUS_NAME, BUS_PATH, BUS_NAME, "RequestName", "su", (name, 0x4)
+        )
+        return result
+
+    def export(self, path: str, handler: Callable[[Message], Any]) -> None:
+        """Регистрирует обработчик входящих вызовов для пути объекта
+
+        Обработчик получает Message и возвращает пару (сигнатура, значения).
+        """
+        self._handlers[path] = handler
+
+    def process(self, timeout: float) -> bool:
+        """Обрабатывает входящие сообщения до истечения timeout
+
+        Returns:
+            bool: True, если было обработано хотя бы одно сообщение
+        """
+        deadline = time.monotonic() + timeout
+        handled = False
+        with self._lock:
+            while True:
+                message = self._read_message(deadline)
+                if message is None:
+                    return handled
+                self._dispatch(message)
+                handled = True
+
+
+def _coerce(type_code: str, value: Any) -> Any:
+    """Приводит аргумент (например, строку из командной строки) к типу D-Bus"""
+    if type_code in "ynqiuxt":
+        return int(value)
+    if type_code == "b":
+        return value if isinstance(value, bool) else str(value).lower() == "true"
+    if type_code == "d":
+        return float(value)
+    if type_code in "sog":
+        return str(value)
+    return value
+
+
+def _infer_signature(args: tuple) -> str:
+    """Подбирает сигнатуру для аргументов неизвестного метода"""
+    signature = ""
+    for arg in args:
+        if isinstance(arg, bool):
+            signature += "b"
+        elif isinstance(arg, int):
+            signature += "i"
+        elif isinstance(arg, float):
+            signature += "d"
+        else:
+            signature += "s"
+    return signature
+
+
+class QdbusTransport:
+    """Транспорт через утилиту qdbus: по одному процессу на вызов"""
+
+    name = "qdbus"
+
+    def __init__(self, run_command: Callable[[list], str]):
+        """
+        Args:
+            run_command: Функция запуска команды, возвращающая stdout
+        """
+        self._run_command = run_command
+
+    def call(self, service: str, path: str, method: str, *args) -> Any:
+        """Вызывает метод и приводит вывод qdbus к типу результата
+
+        Большой текст нельзя передать в командной строке, такой вызов
+        выполняется через прямое соединение с шиной.
+
+        Raises:
+            RuntimeError: Если аргумент слишком велик, а шина недоступна
+        """
+        size = max((len(a) for a in args if isinstance(a, str)), default=0)
+        if size > ARGV_MAX_CHARS:
+            try:
+                transport = get_session_transport()
+            except (OSError, ValueError, DBusError) as e:
+                raise RuntimeError(
+                    f"Текст из {size} символов нельзя передать qdbus в командной "
+                    f"строке, а сессионная шина D-Bus недоступна: {e}"
+                ) from e
+            return transport.call(service, path, method, *args)
+        output = self._run_command(
+            ["qdbus", service, path, method] + [str(a) for a in args]
+        )
+        _, _, out_signature = METHOD_SIGNATURES.get(method, (None, "", "s"))
+        if out_signature == "":
+            return None
+        if out_signature in ("u", "i"):
+            return int(output) if output else 0
+        if out_signature == "b":
+            return output == "true"
+        if out_signature.startswith("a"):
+            # qdbus выводит элементы массива построчно
+            return output.split("\n") if output else []
+        return output
+
+    def close(self) -> None:
+        pass
+
+
+class SessionBusTransport:
+    """Транспорт через одно постоянное соединение с сессионной шиной"""
+
+    name = "native"
+
+    def __init__(self, connection: Optional[DBusConnection] = None):
+        self.connection = connection or DBusConnection()
+        self._subscriptions: set = set()
+
+    def _ensure_connected(self) -> DBusConnection:
+        if not self.connection.connected:
+            self.connection.connect()
+        return self.connection
+
+    def call(self, service: str, path: str, method: str, *args) -> Any:
+        """Вызывает метод по известной сигнатуре и возвращает результат"""
+        interface, in_signature, _ = METHOD_SIGNATURES.get(
+            method, (None, _infer_signature(args), "")
+        )
+        values = tuple(
+            _coerce(t, a) for t, a in zip(split_signature(in_signature), args)
+        )
+        connection = self._ensure_connected()
+        try:
+            body = connection.call(service, path, interface, method, in_signature, values)
+        except ConnectionError:
+            # Переподключаемся один раз, если шина разорвала соединение
+            connection.close()
+            connection = self._ensure_connected()
+            body = connection.call(service, path, interface, method, in_signature, values)
+        if not body:
+            return None
+        return body[0] if len(body) == 1 else body
+
+    def subscribe(self, interface: str, member: str) -> None:
+        """Подписывается на сигнал (повторная подписка игнорируется)"""
+        key = (interface, member)
+        if key not in self._subscriptions:
+            self._ensure_connected().subscribe(interface, member)
+            self._subscriptions.add(key)
+
+    def drain_signals(self, interface: Optional[str] = None) -> None:
+        """Отбрасывает уже пришедшие сигналы (только интерфейса, если он задан)"""
+        if self.connection.connected:
+            self.connection.drain_signals(interface)
+
+    def take_signals(self, interface: str) -> List[Message]:
+        """Забирает пришедшие сигналы интерфейса без ожидания"""
+        return self._ensure_connected().take_signals(interface)
+
+    def wait_signal(self, interface: str, member: str, timeout: float) -> bool:
+        """Ожидает сигнал не дольше timeout
+
+        Returns:
+            bool: True, если сигнал пришел
+        """
+        connection = self._ensure_connected()
+        return connection.wait_signal(interface, member, timeout) is not None
+
+    def close(self) -> None:
+        self.connection.close()
+        self._subscriptions.clear()
+
+
+_shared_transport: Optional[SessionBusTransport] = None
+
+
+def get_session_transport() -> SessionBusTransport:
+    """Возвращает общий для процесса транспорт сессионной шины
+
+    Raises:
+        OSError, ValueError: Если подключиться к шине не удалось
+    """
+    global _shared_transport
+    if _shared_transport is None:
+        transport = SessionBusTransport()
+        transport.connection.connect()
+        _shared_transport = transport
+    return _shared_transport
+
+
+def create_transport(kind: str, run_command: Callable[[list], str]):
+    """Создает транспорт D-Bus
+
+    Args:
+        kind: 'native', 'qdbus' или 'auto' (native с откатом на qdbus)
+        run_command: Функция запуска команды для транспорта qdbus
+
+    Returns:
+        Транспорт с методом call(service, path, method, *args)
+    """
+    if kind in ("auto", "native"):
+        try:
+            return get_session_transport()
+        except (OSError, ValueError, DBusError) as e:
+            if kind == "native":
+                raise
+            get_logger().warning("D-Bus session bus unavailable, using qdbus: %s", e)
+    return QdbusTransport(run_command)
+
+
+def _main() -> int:
+    """Отладочный вызов: python dbus_client.py SERVICE PATH METHOD [ARGS...]"""
+    if len(sys.argv) < 4:
+        print("usage: dbus_client.py SERVICE PATH METHOD [ARGS...]", file=sys.stderr)
+        return 2
+    transport = get_session_transport()
+    print(transport.call(*sys.argv[1:]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Автоподбор задержек lipunto
+Запоминает, сколько на самом деле занимали шаги с буфером обмена в каждом
+приложении (по классу активного окна), и предлагает в качестве задержки
+выученный 99-й перцентиль с запасом вместо значения из DelaysConfig.
+Истекшее ожидание записывается с длительностью до его границы, поэтому
+слишком короткая выученная задержка растет обратно. Пауза после вставки
+не наблюдается и не подбирается
+"""
+
+import json
+import math
+import os
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from logger import get_logger
+from tool_paths import get_resolver
+
+# Логарифмическая шкала корзин гистограммы: от 0.5 мс до ~16 с
+BUCKET_MIN = 0.0005
+BUCKET_RATIO = 1.25
+BUCKET_COUNT = 48
+
+# Коэффициент затухания старых наблюдений при каждом новом
+DECAY = 0.97
+# Минимальный суммарный вес наблюдений, после которого задержке можно доверять
+MIN_WEIGHT = 5.0
+# Запас к выученному перцентилю
+MARGIN_RATIO = 0.5
+MARGIN_MIN = 0.005
+# Нижняя граница выученной задержки
+FLOOR = 0.01
+
+DEFAULT_CLASS = "default"
+
+
+def default_stats_path() -> Path:
+    """Путь к файлу статистики задержек"""
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(cache_dir) / "lipunto" / "delays.json"
+
+
+def _bucket(seconds: float) -> int:
+    if seconds <= BUCKET_MIN:
+        return 0
+    index = int(math.log(seconds / BUCKET_MIN, BUCKET_RATIO)) + 1
+    return min(index, BUCKET_COUNT - 1)
+
+
+def _bucket_upper(index: int) -> float:
+    return BUCKET_MIN * BUCKET_RATIO**index
+
+
+class DelayStats:
+    """Гистограмма длительностей шага с экспоненциальным затуханием"""
+
+    __slots__ = ("counts",)
+
+    def __init__(self, counts: Optional[List[float]] = None):
+        self.counts = list(counts) if counts else [0.0] * BUCKET_COUNT
+
+    @property
+    def weight(self) -> float:
+        return sum(self.counts)
+
+    def add(self, seconds: float) -> None:
+        """Добавляет наблюдение, уменьшая вес старых"""
+        self.counts = [c * DECAY for c in self.counts]
+        self.counts[_bucket(seconds)] += 1.0
+
+    def percentile(self, q: float) -> float:
+        """Возвращает верхнюю границу корзины, содержащей q-й перцентиль"""
+        total = self.weight
+        if total <= 0:
+            return 0.0
+        threshold = total * q
+        cumulative = 0.0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return _bucket_upper(index)
+        return _bucket_upper(BUCKET_COUNT - 1)
+
+
+class DelayTuner:
+    """Подбор задержек по статистике для каждого класса окна"""
+
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Args:
+            path: Файл статистики. Если None, используется путь по умолчанию
+        """
+        self.path = Path(path) if path else default_stats_path()
+        self.logger = get_logger()
+        self._stats: Dict[str, Dict[str, DelayStats]] = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            self.logger.warning("Failed to load delay statistics: %s", e)
+            return
+        for window_class, steps in data.items():
+            self._stats[window_class] = {
+                step: DelayStats(counts)
+                for step, counts in steps.items()
+                if isinstance(counts, list) and len(counts) == BUCKET_COUNT
+            }
+
+    def save(self) -> None:
+        """Сохраняет статистику, если она изменилась"""
+        if not self._dirty:
+            return
+        data = {
+            window_class: {
+                step: [round(c, 4) for c in stats.counts]
+                for step, stats in steps.items()
+            }
+            for window_class, steps in self._stats.items()
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            self.logger.warning("Failed to save delay statistics: %s", e)
+
+    def record(self, step: str, seconds: float, window_class: str = DEFAULT_CLASS) -> None:
+        """Запоминает фактическую длительность шага
+
+        Args:
+            step: Имя задержки из DelaysConfig ('clipboard_get', 'clipboard_set')
+            seconds: Сколько заняло ожидание до изменения буфера или до
+                истечения ожидания
+            window_class: Класс активного окна
+        """
+        steps = self._stats.setdefault(window_class, {})
+        steps.setdefault(step, DelayStats()).add(seconds)
+        self._dirty = True
+        self.logger.debug("Delay sample %s/%s: %.4fs", window_class, step, seconds)
+
+    def delay(self, step: str, configured: float, window_class: str = DEFAULT_CLASS) -> float:
+        """Возвращает задержку для шага
+
+        Выученный p99 с запасом, ограниченный сверху настроенным значением.
+        Пока наблюдений мало, а также для шагов без наблюдений (paste),
+        возвращается настроенное значение.
+
+        Args:
+            step: Имя задержки из DelaysConfig
+            configured: Значение из DelaysConfig (верхняя граница)
+            window_class: Класс активного окна
+
+        Returns:
+            float: Задержка в секундах
+        """
+        stats = self._stats.get(window_class, {}).get(step)
+        if stats is None or stats.weight < MIN_WEIGHT:
+            return configured
+        p99 = stats.percentile(0.99)
+        learned = max(FLOOR, p99 + max(p99 * MARGIN_RATIO, MARGIN_MIN))
+        return min(configured, learned)
+
+    def estimate(self, step: str, default: float, window_class: str = DEFAULT_CLASS) -> float:
+        """Возвращает типичную (медианную) длительность шага
+
+        В отличие от delay() это оценка для сравнения способов, а не
+        граница ожидания.
+
+        Args:
+            step: Имя шага ('replace_key', 'replace_paste')
+            default: Оценка, пока наблюдений мало
+            window_class: Класс активного окна
+
+        Returns:
+            float: Длительность в секундах
+        """
+        stats = self._stats.get(window_class, {}).get(step)
+        if stats is None or stats.weight < MIN_WEIGHT:
+            return default
+        return stats.percentile(0.5)
+
+
+_window_tool: Optional[list] = None
+
+
+def active_window_class() -> str:
+    """Определяет класс активного окна
+
+    Используется $LIPUNTO_WINDOW_CLASS, затем kdotool (KDE Wayland) или
+    xdotool (X11). Если определить класс не удалось, возвращается 'default'.
+    """
+    override = os.environ.get("LIPUNTO_WINDOW_CLASS")
+    if override:
+        return override
+    global _window_tool
+    if _window_tool is None:
+        _window_tool = []
+        resolver = get_resolver()
+        for tool in ("kdotool", "xdotool"):
+            path = resolver.resolve(tool)
+            if path:
+                _window_tool = [path, "getactivewindow", "getwindowclassname"]
+                break
+    if not _window_tool:
+        return DEFAULT_CLASS
+    try:
+        result = subprocess.run(
+            _window_tool, capture_output=True, timeout=0.5, check=True
+        )
+    except (OSError, subprocess.SubprocessError):
+        return DEFAULT_CLASS
+    return result.stdout.decode(errors="replace").strip() or DEFAULT_CLASS
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Генератор таблицы кодов клавиш
+Читает input-event-codes.h и записывает keycodes.py с константами
+EV_*, SYN_*, KEY_* и BTN_*. Запуск: python gen_keycodes.py [заголовок] [-o keycodes.py]
+"""
+
+import argparse
+import re
+import sys
+from pathlib import Path
+
+PREFIXES = ("EV_", "SYN_", "KEY_", "BTN_")
+DEFINE_RE = re.compile(r"^#define\s+([A-Z][A-Z0-9_]*)\s+([^\s/]+)")
+
+HEADER = '''#!/usr/bin/env python3
+"""
+Коды событий ввода Linux
+Автоматически сгенерировано gen_keycodes.py из input-event-codes.h.
+Не редактируйте вручную.
+"""
+
+'''
+
+
+def parse_header(path: Path) -> dict:
+    """Разбирает #define из заголовочного файла
+
+    Значения-ссылки на другие макросы разрешаются, выражения вида
+    (KEY_MAX+1) пропускаются.
+
+    Returns:
+        dict: Имя константы -> числовое значение в порядке объявления
+    """
+    codes = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        match = DEFINE_RE.match(line)
+        if not match:
+            continue
+        name, value = match.groups()
+        if not name.startswith(PREFIXES):
+            continue
+        if value in codes:
+            codes[name] = codes[value]
+            continue
+        try:
+            codes[name] = int(value, 0)
+        except ValueError:
+            continue
+    return codes
+
+
+def render(codes: dict) -> str:
+    """Формирует исходный код модуля keycodes.py"""
+    lines = [HEADER]
+    for name, value in codes.items():
+        lines.append(f"{name} = {value}\n")
+    lines.append(
+        "\n# Имя константы -> код\n"
+        "KEYCODES = {\n"
+        "    name: value\n"
+        "    for name, value in globals().items()\n"
+        f"    if name.startswith({PREFIXES!r})\n"
+        "}\n"
+    )
+    return "".join(lines)
+
+
+def main() -> int:
+    root = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description="Генерация keycodes.py из input-event-codes.h")
+    parser.add_argument(
+        "header",
+        nargs="?",
+        default=str(root / "input-event-codes.h"),
+        help="Путь к input-event-codes.h",
+    )
+    parser.add_argument(
+        "-o", "--output", default=str(root / "keycodes.py"), help="Файл модуля keycodes.py"
+    )
+    args = parser.parse_args()
+
+    source = Path(args.header)
+    if not source.is_file():
+        parser.error(f"файл {source} не найден")
+    target = Path(args.output)
+    codes = parse_header(source)
+    target.write_text(render(codes), encoding="utf-8")
+    print(f"{len(codes)} codes written to {target}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Бэкенды эмуляции ввода для lipunto
+Нажатия клавиш отправляются либо напрямую в сокет ydotoold в виде записей
+struct input_event, либо через утилиту ydotool (по процессу на команду)
+"""
+
+import os
+import socket
+import struct
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from keycodes import EV_KEY, EV_SYN, SYN_REPORT
+from logger import get_logger
+
+# struct input_event: struct timeval (два long), __u16 type, __u16 code, __s32 value
+INPUT_EVENT = struct.Struct("llHHi")
+
+DEFAULT_YDOTOOL_SOCKET = "/tmp/.ydotool_socket"
+
+# Событие клавиши: (код, состояние) где 1 - нажатие, 0 - отпускание
+KeyEvent = Tuple[int, int]
+
+
+def chord(*codes: int) -> List[KeyEvent]:
+    """Формирует последовательность событий для сочетания клавиш
+
+    Клавиши нажимаются в указанном порядке и отпускаются в обратном.
+
+    Args:
+        *codes: Коды клавиш, например KEY_LEFTCTRL, KEY_C
+
+    Returns:
+        list: Список пар (код, состояние)
+    """
+    return [(code, 1) for code in codes] + [(code, 0) for code in reversed(codes)]
+
+
+def ydotool_socket_path() -> str:
+    """Возвращает путь к сокету ydotoold"""
+    return os.environ.get("YDOTOOL_SOCKET", DEFAULT_YDOTOOL_SOCKET)
+
+
+class YdotoolCliBackend:
+    """Эмуляция ввода через утилиту ydotool"""
+
+    name = "ydotool"
+
+    def __init__(self, run_command: Callable[[list], str]):
+        """
+        Args:
+            run_command: Функция запуска команды
+        """
+        self._run_command = run_command
+
+    def send_keys(self, events: Iterable[KeyEvent]) -> None:
+        """Отправляет события клавиш одной командой ydotool key"""
+        self._run_command(
+            ["ydotool", "key"] + [f"{code}:{state}" for code, state in events]
+        )
+
+    def close(self) -> None:
+        pass
+
+
+class YdotoolSocketBackend:
+    """Эмуляция ввода записью input_event напрямую в сокет ydotoold
+
+    Каждое событие клавиши сопровождается SYN_REPORT, как это делает ydotool.
+    Сокет открывается один раз и переиспользуется между вызовами.
+    """
+
+    name = "socket"
+
+    def __init__(self, socket_path: Optional[str] = None):
+        """
+        Args:
+            socket_path: Путь к сокету ydotoold. Если None, берется $YDOTOOL_SOCKET
+        """
+        self.socket_path = socket_path or ydotool_socket_path()
+        self._sock: Optional[socket.socket] = None
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        return self._sock
+
+    @staticmethod
+    def encode(events: Iterable[KeyEvent]) -> List[bytes]:
+        """Упаковывает события клавиш в записи input_event"""
+        syn = INPUT_EVENT.pack(0, 0, EV_SYN, SYN_REPORT, 0)
+        packets = []
+        for code, state in events:
+            packets.append(INPUT_EVENT.pack(0, 0, EV_KEY, code, state))
+            packets.append(syn)
+        return packets
+
+    def send_keys(self, events: Iterable[KeyEvent]) -> None:
+        """Отправляет события клавиш в ydotoold
+
+        Raises:
+            RuntimeError: Если сокет ydotoold недоступен
+        """
+        packets = self.encode(events)
+        for attempt in range(2):
+            try:
+                sock = self._connect()
+                for packet in packets:
+                    sock.send(packet)
+                return
+            except OSError as e:
+                # ydotoold мог перезапуститься - переподключаемся один раз
+                self.close()
+                if attempt:
+                    error_text = (
+                        f"Не удалось отправить события в сокет ydotoold "
+                        f"{self.socket_path}: {e}"
+                    )
+                    raise RuntimeError(error_text) from e
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def create_input_backend(kind: str, run_command: Callable[[list], str]):
+    """Создает бэкенд эмуляции ввода
+
+    Args:
+        kind: 'socket', 'ydotool' или 'auto' (сокет, если он доступен)
+        run_command: Функция запуска команды для бэкенда ydotool
+
+    Returns:
+        Бэкенд с методом send_keys(events)
+    """
+    if kind in ("auto", "socket"):
+        backend = YdotoolSocketBackend()
+        try:
+            backend._connect()
+            return backend
+        except OSError as e:
+            if kind == "socket":
+                raise RuntimeError(
+                    f"Сокет ydotoold {backend.socket_path} недоступен: {e}"
+                ) from e
+            get_logger().warning("ydotoold socket unavailable, using ydotool: %s", e)
+    return YdotoolCliBackend(run_command)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Журнал преобразований lipunto
+Хранит последние замены текста (исходный и новый текст, способ, время),
+чтобы повторное нажатие в течение короткого окна отменяло предыдущую
+замену напрямую - без копирования выделения и чтения буфера обмена.
+Демон держит журнал в памяти; одиночные запуски используют небольшой
+файл в $XDG_RUNTIME_DIR, отображенный в память через mmap. Там же
+хранится хэш последнего прочитанного PRIMARY, по которому следующий
+запуск узнает устаревшее выделение.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from logger import get_logger
+
+# Сколько последних замен хранить
+JOURNAL_SIZE = 8
+# Более длинный текст не записывается: стирать его нажатиями слишком долго
+MAX_ENTRY_CHARS = 1024
+# Размер файла журнала и его заголовок: сигнатура, длина JSON
+JOURNAL_BYTES = 64 * 1024
+HEADER = struct.Struct("<4sI")
+MAGIC = b"LPJ2"
+# Хэш последнего прочитанного PRIMARY занимает конец файла журнала
+PRIMARY_BYTES = 16
+PRIMARY_OFFSET = JOURNAL_BYTES - PRIMARY_BYTES
+# Место для JSON со списком записей
+ENTRIES_BYTES = PRIMARY_OFFSET - HEADER.size
+
+
+class JournalEntry(NamedTuple):
+    """Одна замена текста
+
+    Attributes:
+        action: Действие ('last' или 'selected')
+        original: Текст до замены
+        converted: Текст после замены (стоит перед курсором)
+        strategy: Способ замены ('keys' или 'paste')
+        timestamp: Время замены (time.time())
+        edits: Счетчик правок KeystrokeBuffer на момент замены или None
+    """
+
+    action: str
+    original: str
+    converted: str
+    strategy: str
+    timestamp: float
+    edits: Optional[int] = None
+
+
+class ConversionJournal:
+    """Журнал последних замен в памяти процесса"""
+
+    def __init__(self, size: int = JOURNAL_SIZE):
+        self.size = size
+        self._entries: List[JournalEntry] = []
+        self._primary: Optional[bytes] = None
+        self._lock = threading.Lock()
+
+    def _read(self) -> List[JournalEntry]:
+        return self._entries
+
+    def _write(self, entries: List[JournalEntry]) -> None:
+        self._entries = entries
+
+    def _read_primary(self) -> Optional[bytes]:
+        return self._primary
+
+    def _write_primary(self, digest: bytes) -> None:
+        self._primary = digest
+
+    def record(self, entry: JournalEntry) -> None:
+        """Добавляет замену; слишком длинный текст не записывается"""
+        if max(len(entry.original), len(entry.converted)) > MAX_ENTRY_CHARS:
+            self.clear()
+            return
+        with self._lock:
+            self._write((self._read() + [entry])[-self.size :])
+
+    def last(self) -> Optional[JournalEntry]:
+        """Возвращает последнюю замену или None"""
+        with self._lock:
+            entries = self._read()
+        return entries[-1] if entries else None
+
+    def entries(self) -> List[JournalEntry]:
+        """Возвращает все записи, начиная со старой"""
+        with self._lock:
+            return list(self._read())
+
+    def clear(self) -> None:
+        """Забывает все замены"""
+        with self._lock:
+            self._write([])
+
+    def toggle_candidate(
+        self, action: str, window: float, edits: Optional[int] = None
+    ) -> Optional[JournalEntry]:
+        """Возвращает замену, которую отменит повторное нажатие
+
+        Args:
+            action (str): Текущее действие
+            window (float): Окно повторного нажатия в секундах (0 - выключено)
+            edits (int): Текущий счетчик правок; если он изменился, пользователь
+                печатал после замены, и текст перед курсором уже другой.
+                None - правки не отслеживаются, и перед отменой текст
+                сверяется с записью (edits записи тоже None)
+
+        Returns:
+            JournalEntry: Запись или None, если это не повторное нажатие
+        """
+        if window <= 0:
+            return None
+        entry = self.last()
+        if entry is None or entry.action != action:
+            return None
+        if not 0 <= time.time() - entry.timestamp <= window:
+            return None
+        if entry.edits != edits:
+            return None
+        return entry
+
+    def swap_primary(self, digest: bytes) -> Optional[bytes]:
+        """Запоминает хэш прочитанного PRIMARY и возвращает прежний
+
+        Args:
+            digest (bytes): Хэш текста PRIMARY (content_hash, 16 байт)
+
+        Returns:
+            bytes: Хэш предыдущего чтения или None
+        """
+        with self._lock:
+            previous = self._read_primary()
+            self._write_primary(digest)
+        return previous
+
+    def close(self) -> None:
+        """Освобождает ресурсы журнала"""
+
+
+def default_journal_path() -> Path:
+    """Путь к файлу журнала: каталог времени выполнения пользователя"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or f"/tmp/lipunto-{os.getuid()}"
+    return Path(runtime_dir) / "lipunto" / "journal"
+
+
+class MappedJournal(ConversionJournal):
+    """Журнал в файле, отображенном в память, для одиночных запусков
+
+    Заголовок хранит длину JSON со списком записей; запись сначала
+    копирует данные, затем обновляет заголовок. Последние PRIMARY_BYTES
+    байт файла - хэш последнего прочитанного PRIMARY (нули - его нет).
+    """
+
+    def __init__(self, path: Optional[Path] = None, size: int = JOURNAL_SIZE):
+        super().__init__(size)
+        self.path = path or default_journal_path()
+        self._map: Optional[mmap.mmap] = None
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                if os.fstat(fd).st_size < JOURNAL_BYTES:
+                    os.ftruncate(fd, JOURNAL_BYTES)
+                self._map = mmap.mmap(fd, JOURNAL_BYTES)
+            finally:
+                os.close(fd)
+        except (OSError, ValueError) as e:
+            # Без файла журнал работает в памяти процесса
+            get_logger().warning("Conversion journal file unavailable: %s", e)
+
+    def _read(self) -> List[JournalEntry]:
+        if self._map is None:
+            return super()._read()
+        magic, length = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or not 0 < length <= ENTRIES_BYTES:
+            return []
+        try:
+            data = json.loads(self._map[HEADER.size : HEADER.size + length])
+            return [JournalEntry(*item) for item in data]
+        except (ValueError, TypeError):
+            return []
+
+    def _write(self, entries: List[JournalEntry]) -> None:
+        if self._map is None:
+            super()._write(entries)
+            return
+        data = json.dumps(entries, ensure_ascii=False).encode("utf-8")
+        while len(data) > ENTRIES_BYTES and entries:
+            entries = entries[1:]
+            data = json.dumps(entries, ensure_ascii=False).encode("utf-8")
+        # Нулевая длина на время записи: читатель не увидит половину данных
+        HEADER.pack_into(self._map, 0, MAGIC, 0)
+        self._map[HEADER.size : HEADER.size + len(data)] = data
+        HEADER.pack_into(self._map, 0, MAGIC, len(data))
+
+    def _read_primary(self) -> Optional[bytes]:
+        if self._map is None:
+            return super()._read_primary()
+        digest = self._map[PRIMARY_OFFSET:JOURNAL_BYTES]
+        return digest if any(digest) else None
+
+    def _write_primary(self, digest: bytes) -> None:
+        if self._map is None:
+            super()._write_primary(digest)
+            return
+        self._map[PRIMARY_OFFSET:JOURNAL_BYTES] = digest[:PRIMARY_BYTES].ljust(
+            PRIMARY_BYTES, b"\0"
+        )
+
+    def close(self) -> None:
+        """Закрывает отображение файла; журнал продолжает работу в памяти"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
@@ -76,12 +76,34 @@ en_ru = {
 # Русская на английскую (ru_en) - инверсия en_ru
 ru_en = {v: k for k, v in en_ru.items()}
 
-# Дополнительные словари могут быть добавлены здесь в будущем
-# Например:
-# en_ua = {...}  # Английская на украинскую
-# ua_en = {...}  # Украинская на английскую
-# en_be = {...}  # Английская на белорусскую
-# be_en = {...}  # Белорусская на английскую
+# Остальные пары раскладок (en_uk, ru_be, de_ru, ...) берутся из кэша,
+# скомпилированного из символов XKB командой: python layout_compiler.py
+BUILTIN_PAIRS = {
+    "en_ru": (en_ru, ru_en),
+    "ru_en": (ru_en, en_ru),
+}
+
+# Кэш раскладок: None - еще не загружался, False - не найден
+_layout_cache = None
+_cached_pairs = {}
+
+
+def get_layout_cache():
+    """Лениво открывает отображенный в память кэш раскладок XKB"""
+    global _layout_cache
+    if _layout_cache is None:
+        _layout_cache = False
+        from layout_compiler import LayoutCache, default_cache_paths
+
+        for path in default_cache_paths():
+            if not path.exists():
+                continue
+            try:
+                _layout_cache = LayoutCache(path)
+                break
+            except (OSError, ValueError):
+                continue
+    return _layout_cache or None
 
 
 def get_layout_dict(layout_name: str):
@@ -97,20 +119,21 @@ def get_layout_dict(layout_name: str):
     Raises:
         ValueError: Если раскладка не найдена
     """
-    layout_pairs = {
-        "en_ru": (en_ru, ru_en),
-        "ru_en": (ru_en, en_ru),
-        # Здесь можно добавить другие пары раскладок
-        # 'en_ua': (en_ua, ua_en),
-        # 'ua_en': (ua_en, en_ua),
-    }
-
-    if layout_name not in layout_pairs:
+    if layout_name in BUILTIN_PAIRS:
+        return BUILTIN_PAIRS[layout_name]
+    if layout_name in _cached_pairs:
+        return _cached_pairs[layout_name]
+
+    source, _, target = layout_name.partition("_")
+    cache = get_layout_cache()
+    if cache is None or source not in cache.names() or target not in cache.names():
         raise ValueError(
-            f"Раскладка '{layout_name}' не найдена. Доступные: {list(layout_pairs.keys())}"
+            f"Раскладка '{layout_name}' не найдена. Доступные: {get_available_layouts()}"
         )
 
-    return layout_pairs[layout_name]
+    pair = (cache.pair(source, target), cache.pair(target, source))
+    _cached_pairs[layout_name] = pair
+    return pair
 
 
 def get_available_layouts():
@@ -120,4 +143,13 @@ def get_available_layouts():
     Returns:
         list: Список названий доступных раскладок
     """
-    return ["en_ru", "ru_en"]
+    layouts = list(BUILTIN_PAIRS)
+    cache = get_layout_cache()
+    if cache is not None:
+        names = cache.names()
+        for source in names:
+            for target in names:
+                pair = f"{source}_{target}"
+                if source != target and pair not in layouts:
+                    layouts.append(pair)
+    return layouts
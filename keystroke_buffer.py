@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Кольцевой буфер набранных клавиш для lipunto
+В режиме демона события клавиатуры читаются из evdev (/dev/input/event*),
+и последнее слово известно без выделения и буфера обмена: действие "last"
+стирает его клавишей Backspace, переключает раскладку и повторяет те же
+коды клавиш. Для проверки источник событий можно заменить записанным файлом
+из записей struct input_event.
+"""
+
+import os
+import select
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from input_backend import INPUT_EVENT, KeyEvent, chord
+from keyboard_layouts import get_layout_cache
+from keycodes import (
+    BTN_DIGI,
+    BTN_MISC,
+    EV_KEY,
+    KEY_102ND,
+    KEY_BACKSPACE,
+    KEY_DELETE,
+    KEY_DOWN,
+    KEY_END,
+    KEY_ENTER,
+    KEY_ESC,
+    KEY_HOME,
+    KEY_INSERT,
+    KEY_KPENTER,
+    KEY_LEFT,
+    KEY_LEFTALT,
+    KEY_LEFTCTRL,
+    KEY_LEFTMETA,
+    KEY_LEFTSHIFT,
+    KEY_PAGEDOWN,
+    KEY_PAGEUP,
+    KEY_RIGHT,
+    KEY_RIGHTALT,
+    KEY_RIGHTCTRL,
+    KEY_RIGHTMETA,
+    KEY_RIGHTSHIFT,
+    KEY_SPACE,
+    KEY_TAB,
+    KEY_UP,
+)
+from logger import get_logger
+
+# Нажатие: (код клавиши, была ли зажата Shift)
+Stroke = Tuple[int, bool]
+# Событие evdev: (тип, код, значение)
+Event = Tuple[int, int, int]
+
+DEFAULT_CAPACITY = 256
+
+# Клавиши, печатающие символ: ряды основного блока и клавиша 102nd
+PRINTABLE_KEYS = frozenset(
+    list(range(2, 14)) + list(range(16, 28)) + list(range(30, 42))
+    + list(range(43, 54)) + [KEY_102ND, KEY_SPACE]
+)
+SHIFT_KEYS = frozenset((KEY_LEFTSHIFT, KEY_RIGHTSHIFT))
+# При зажатых Ctrl/Alt/Meta нажатие - это сочетание, а не ввод текста
+CHORD_KEYS = frozenset(
+    (KEY_LEFTCTRL, KEY_RIGHTCTRL, KEY_LEFTALT, KEY_RIGHTALT, KEY_LEFTMETA, KEY_RIGHTMETA)
+)
+# Прочие клавиши, не печатающие символ (F1-F12, Pause, мультимедиа), буфер не
+# сбрасывают: ими вызываются горячие клавиши, в том числе сама lipunto.
+# Клавиши, перемещающие курсор или завершающие ввод, сбрасывают буфер
+RESET_KEYS = frozenset(
+    (
+        KEY_ESC,
+        KEY_TAB,
+        KEY_ENTER,
+        KEY_KPENTER,
+        KEY_HOME,
+        KEY_END,
+        KEY_PAGEUP,
+        KEY_PAGEDOWN,
+        KEY_UP,
+        KEY_DOWN,
+        KEY_LEFT,
+        KEY_RIGHT,
+        KEY_INSERT,
+        KEY_DELETE,
+    )
+)
+
+# Виртуальное устройство, через которое lipunto вводит клавиши
+YDOTOOL_DEVICE = "ydotoold virtual device"
+
+
+class KeystrokeBuffer:
+    """Ограниченный буфер нажатий с момента последнего перемещения курсора"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """
+        Args:
+            capacity (int): Максимальное число хранимых нажатий
+        """
+        self._strokes: deque = deque(maxlen=capacity)
+        self._held: set = set()
+        self._lock = threading.Lock()
+        # Счетчик нажатий, меняющих текст или положение курсора
+        self.edits = 0
+
+    def reset(self) -> None:
+        """Забывает набранные клавиши"""
+        with self._lock:
+            self._strokes.clear()
+
+    def feed(self, event_type: int, code: int, value: int) -> None:
+        """Обрабатывает одно событие evdev
+
+        Args:
+            event_type (int): Тип события (учитывается только EV_KEY)
+            code (int): Код клавиши или кнопки
+            value (int): 1 - нажатие, 2 - автоповтор, 0 - отпускание
+        """
+        if event_type != EV_KEY:
+            return
+        with self._lock:
+            if value == 0:
+                self._held.discard(code)
+                return
+            if code in SHIFT_KEYS or code in CHORD_KEYS:
+                self._held.add(code)
+                return
+            if not (
+                BTN_MISC <= code < BTN_DIGI
+                or self._held & CHORD_KEYS
+                or code in RESET_KEYS
+                or code == KEY_BACKSPACE
+                or code in PRINTABLE_KEYS
+            ):
+                # Горячие клавиши (Pause, F1-F12) текст не меняют
+                return
+            self.edits += 1
+            if BTN_MISC <= code < BTN_DIGI:
+                # Щелчок мыши мог переместить курсор
+                self._strokes.clear()
+            elif self._held & CHORD_KEYS or code in RESET_KEYS:
+                self._strokes.clear()
+            elif code == KEY_BACKSPACE:
+                if self._strokes:
+                    self._strokes.pop()
+            elif code in PRINTABLE_KEYS:
+                self._strokes.append((code, bool(self._held & SHIFT_KEYS)))
+
+    def last_word(self) -> List[Stroke]:
+        """Возвращает нажатия последнего слова вместе с пробелами после него
+
+        Returns:
+            list: Нажатия (код, Shift) или пустой список, если слова нет
+        """
+        with self._lock:
+            strokes = list(self._strokes)
+        end = len(strokes)
+        while end and strokes[end - 1][0] == KEY_SPACE:
+            end -= 1
+        start = end
+        while start and strokes[start - 1][0] != KEY_SPACE:
+            start -= 1
+        if start == end:
+            return []
+        return strokes[start:]
+
+
+def strokes_text(strokes: List[Stroke], layout: str) -> Optional[str]:
+    """Возвращает текст, который дают нажатия в указанной раскладке
+
+    Args:
+        strokes (list): Нажатия (код, Shift)
+        layout (str): Имя раскладки в кэше ('en', 'ru', ...)
+
+    Returns:
+        str: Текст или None, если раскладки нет в кэше
+    """
+    cache = get_layout_cache()
+    if cache is None or layout not in cache.names():
+        return None
+    levels: Dict[int, Tuple[int, int]] = {
+        code: (level1, level2) for code, level1, level2 in cache.records(layout)
+    }
+    chars = []
+    for code, shift in strokes:
+        if code == KEY_SPACE:
+            chars.append(" ")
+            continue
+        point = levels.get(code, (0, 0))[1 if shift else 0]
+        chars.append(chr(point) if point else "?")
+    return "".join(chars)
+
+
+def stroke_events(strokes: List[Stroke]) -> List[KeyEvent]:
+    """Преобразует нажатия (код, Shift) в события клавиш для бэкенда ввода"""
+    events: List[KeyEvent] = []
+    for code, shift in strokes:
+        events.extend(chord(KEY_LEFTSHIFT, code) if shift else chord(code))
+    return events
+
+
+def input_devices() -> List[Path]:
+    """Находит клавиатуры и мыши в /proc/bus/input/devices
+
+    Виртуальное устройство ydotoold пропускается, чтобы собственный ввод
+    lipunto не попадал в буфер.
+
+    Returns:
+        list: Пути к /dev/input/eventN
+    """
+    try:
+        text = Path("/proc/bus/input/devices").read_text(encoding="utf-8")
+    except OSError:
+        return []
+    devices = []
+    for block in text.split("\n\n"):
+        name = ""
+        handlers: List[str] = []
+        for line in block.splitlines():
+            if line.startswith("N: Name="):
+                name = line[len("N: Name="):].strip('"')
+            elif line.startswith("H: Handlers="):
+                handlers = line[len("H: Handlers="):].split()
+        is_input = "kbd" in handlers or any(h.startswith("mouse") for h in handlers)
+        if name == YDOTOOL_DEVICE or not is_input:
+            continue
+        devices.extend(Path("/dev/input") / h for h in handlers if h.startswith("event"))
+    return devices
+
+
+class EvdevSource:
+    """Чтение событий из устройств /dev/input/event*"""
+
+    def __init__(self, paths: Optional[List[Path]] = None):
+        """
+        Args:
+            paths: Устройства. Если None, берутся все клавиатуры и мыши
+
+        Raises:
+            RuntimeError: Если ни одно устройство не удалось открыть
+        """
+        self.paths = paths if paths is not None else input_devices()
+        self._fds: List[int] = []
+        errors = []
+        for path in self.paths:
+            try:
+                self._fds.append(os.open(path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError as e:
+                errors.append(f"{path}: {e.strerror}")
+        if not self._fds:
+            raise RuntimeError(
+                "Не удалось открыть устройства ввода (нужна группа input): "
+                + ("; ".join(errors) or "устройства не найдены")
+            )
+        self._closed = False
+
+    def events(self) -> Iterator[Event]:
+        """Возвращает события по мере поступления до вызова close()"""
+        size = INPUT_EVENT.size
+        while not self._closed:
+            try:
+                ready, _, _ = select.select(self._fds, [], [], 0.5)
+            except (OSError, ValueError):
+                return
+            for fd in ready:
+                try:
+                    data = os.read(fd, size * 64)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    # Устройство отключено
+                    self._fds.remove(fd)
+                    continue
+                for _, _, event_type, code, value in INPUT_EVENT.iter_unpack(
+                    data[: len(data) - len(data) % size]
+                ):
+                    yield event_type, code, value
+
+    def close(self) -> None:
+        self._closed = True
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+
+class RecordedEventSource:
+    """События из файла записей input_event (например, cat /dev/input/eventN)"""
+
+    def __init__(self, path: Path, realtime: bool = False):
+        """
+        Args:
+            path: Файл с записями struct input_event
+            realtime: Воспроизводить с исходными интервалами между событиями
+        """
+        self.path = Path(path)
+        self.realtime = realtime
+
+    def events(self) -> Iterator[Event]:
+        data = self.path.read_bytes()
+        size = INPUT_EVENT.size
+        previous = None
+        for sec, usec, event_type, code, value in INPUT_EVENT.iter_unpack(
+            data[: len(data) - len(data) % size]
+        ):
+            if self.realtime:
+                stamp = sec + usec / 1e6
+                if previous is not None and stamp > previous:
+                    time.sleep(stamp - previous)
+                previous = stamp
+            yield event_type, code, value
+
+    def close(self) -> None:
+        pass
+
+
+class KeystrokeMonitor:
+    """Фоновый поток, передающий события источника в буфер"""
+
+    def __init__(self, buffer: KeystrokeBuffer, source):
+        self.buffer = buffer
+        self.source = source
+        self.logger = get_logger()
+        self._thread = threading.Thread(
+            target=self._run, name="lipunto-keystrokes", daemon=True
+        )
+
+    def _run(self) -> None:
+        try:
+            for event_type, code, value in self.source.events():
+                self.buffer.feed(event_type, code, value)
+        except Exception as e:
+            self.logger.warning("Keystroke monitor stopped: %s", e)
+            self.buffer.reset()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.source.close()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        self._thread.join(timeout)
+
+
+def start_monitor(recorded_file: Optional[str] = None) -> Optional[KeystrokeMonitor]:
+    """Запускает чтение клавиш из evdev или из записанного файла
+
+    Args:
+        recorded_file: Файл записей input_event вместо устройств evdev
+
+    Returns:
+        KeystrokeMonitor или None, если устройства ввода недоступны
+    """
+    try:
+        if recorded_file:
+            source = RecordedEventSource(Path(recorded_file), realtime=True)
+        else:
+            source = EvdevSource()
+    except RuntimeError as e:
+        get_logger().warning("Keystroke buffer disabled: %s", e)
+        return None
+    monitor = KeystrokeMonitor(KeystrokeBuffer(), source)
+    monitor.start()
+    return monitor
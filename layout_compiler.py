@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Компилятор раскладок XKB для lipunto
+Читает файлы символов XKB (системные или из указанного каталога) и
+записывает компактный двоичный кэш с символами первого и второго уровня
+для каждой клавиши. Кэш отображается в память и читается лениво из
+keyboard_layouts.get_layout_dict, поэтому новые раскладки не увеличивают
+время запуска.
+
+Запуск:
+    python layout_compiler.py                       # раскладки по умолчанию
+    python layout_compiler.py en=us ru uk=ua -o ~/.cache/lipunto/layouts.bin
+"""
+
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+XKB_ROOT = Path("/usr/share/X11/xkb")
+KEYSYMDEF = Path("/usr/include/X11/keysymdef.h")
+
+# Формат кэша:
+#   заголовок:  magic, версия, количество раскладок
+#   каталог:    имя (16 байт), смещение записей, количество записей
+#   записи:     код клавиши evdev, символ 1-го уровня, символ 2-го уровня
+MAGIC = b"LPKL"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+DIRECTORY_ENTRY = struct.Struct("<16sII")
+RECORD = struct.Struct("<HxxII")
+
+# Раскладки, компилируемые по умолчанию: имя в lipunto -> символы XKB
+DEFAULT_LAYOUTS = {
+    "en": "us",
+    "ru": "ru",
+    "uk": "ua",
+    "be": "by",
+    "de": "de",
+}
+
+# Клавиши алфавитно-цифрового блока, участвующие в преобразовании
+MAIN_KEYS = (
+    ["TLDE", "BKSL"]
+    + [f"AE{i:02d}" for i in range(1, 13)]
+    + [f"AD{i:02d}" for i in range(1, 13)]
+    + [f"AC{i:02d}" for i in range(1, 12)]
+    + [f"AB{i:02d}" for i in range(1, 11)]
+)
+
+# Имена символов ASCII на случай отсутствия keysymdef.h
+_ASCII_KEYSYMS = {
+    "space": " ", "exclam": "!", "quotedbl": '"', "numbersign": "#",
+    "dollar": "$", "percent": "%", "ampersand": "&", "apostrophe": "'",
+    "parenleft": "(", "parenright": ")", "asterisk": "*", "plus": "+",
+    "comma": ",", "minus": "-", "period": ".", "slash": "/", "colon": ":",
+    "semicolon": ";", "less": "<", "equal": "=", "greater": ">",
+    "question": "?", "at": "@", "bracketleft": "[", "backslash": "\\",
+    "bracketright": "]", "asciicircum": "^", "underscore": "_", "grave": "`",
+    "braceleft": "{", "bar": "|", "braceright": "}", "asciitilde": "~",
+}
+
+_SECTION_RE = re.compile(r'xkb_symbols\s+"([^"]+)"\s*\{')
+_INCLUDE_RE = re.compile(r'\b(?:include|augment|override|replace)\s+"([^"]+)"')
+_KEY_RE = re.compile(r"\bkey\s+<(\w+)>\s*\{(.*?)\}\s*;", re.S)
+_LEVELS_RE = re.compile(r"(?:symbols\[\w+\]\s*=\s*)?\[([^\]]*)\]")
+_KEYSYMDEF_RE = re.compile(r"#define XK_(\w+)\s+0x[0-9a-fA-F]+\s*/\*[ (]*U\+([0-9A-F]{4,6})")
+
+
+def load_keysyms(path: Path = KEYSYMDEF) -> Dict[str, str]:
+    """Загружает соответствие имен keysym символам Unicode"""
+    keysyms = dict(_ASCII_KEYSYMS)
+    try:
+        text = path.read_text(encoding="latin-1")
+    except OSError:
+        return keysyms
+    for name, code in _KEYSYMDEF_RE.findall(text):
+        keysyms.setdefault(name, chr(int(code, 16)))
+    return keysyms
+
+
+def keysym_to_char(name: str, keysyms: Dict[str, str]) -> Optional[str]:
+    """Преобразует имя keysym в символ или None для неизвестных/мертвых клавиш"""
+    if len(name) == 1:
+        return name
+    if name in keysyms:
+        return keysyms[name]
+    if re.fullmatch(r"U[0-9A-Fa-f]{4,6}", name):
+        return chr(int(name[1:], 16))
+    if re.fullmatch(r"0x1[0-9A-Fa-f]{6}", name):
+        return chr(int(name, 16) - 0x1000000)
+    return None
+
+
+def load_keycodes(root: Path = XKB_ROOT) -> Dict[str, int]:
+    """Читает коды клавиш evdev из keycodes/evdev (XKB-код минус 8)"""
+    codes: Dict[str, int] = {}
+    aliases: Dict[str, str] = {}
+    text = (root / "keycodes" / "evdev").read_text(encoding="utf-8")
+    for name, value in re.findall(r"<(\w+)>\s*=\s*(\d+)\s*;", text):
+        codes.setdefault(name, int(value) - 8)
+    for alias, target in re.findall(r"alias\s+<(\w+)>\s*=\s*<(\w+)>\s*;", text):
+        aliases[alias] = target
+    for alias, target in aliases.items():
+        if target in codes:
+            codes.setdefault(alias, codes[target])
+    return codes
+
+
+class SymbolsParser:
+    """Разбор файлов символов XKB с обработкой include"""
+
+    def __init__(self, root: Path = XKB_ROOT, keysyms: Optional[Dict[str, str]] = None):
+        self.root = Path(root)
+        self.keysyms = keysyms if keysyms is not None else load_keysyms()
+        self._files: Dict[str, Dict[str, str]] = {}
+        self._defaults: Dict[str, str] = {}
+
+    def _sections(self, file_name: str) -> Dict[str, str]:
+        """Возвращает тела секций файла символов"""
+        if file_name not in self._files:
+            path = self.root / "symbols" / file_name
+            text = re.sub(r"//[^\n]*", "", path.read_text(encoding="utf-8"))
+            sections: Dict[str, str] = {}
+            default = None
+            for match in _SECTION_RE.finditer(text):
+                name = match.group(1)
+                start = match.end()
+                depth = 1
+                pos = start
+                while depth and pos < len(text):
+                    if text[pos] == "{":
+                        depth += 1
+                    elif text[pos] == "}":
+                        depth -= 1
+                    pos += 1
+                sections[name] = text[start : pos - 1]
+                flags = text[text.rfind("\n", 0, match.start()) + 1 : match.start()]
+                if default is None and "default" in flags:
+                    default = name
+            self._files[file_name] = sections
+            self._defaults[file_name] = default or next(iter(sections), "")
+        return self._files[file_name]
+
+    def parse(self, spec: str, _depth: int = 0) -> Dict[str, List[Optional[str]]]:
+        """Собирает символы клавиш для спецификации вида 'ru' или 'ru(winkeys)'
+
+        Returns:
+            dict: Имя клавиши XKB -> [символ 1-го уровня, символ 2-го уровня]
+        """
+        if _depth > 16:
+            raise ValueError(f"Слишком глубокая вложенность include: {spec}")
+        keys: Dict[str, List[Optional[str]]] = {}
+        for part in spec.split("+"):
+            match = re.fullmatch(r"([\w-]+)(?:\(([\w-]+)\))?(?::\d+)?", part.strip())
+            if not match:
+                continue
+            file_name, section = match.groups()
+            sections = self._sections(file_name)
+            body = sections.get(section or self._defaults[file_name])
+            if body is None:
+                raise ValueError(f"Секция {part} не найдена")
+            keys.update(self._parse_body(body, _depth))
+        return keys
+
+    def _parse_body(self, body: str, depth: int) -> Dict[str, List[Optional[str]]]:
+        keys: Dict[str, List[Optional[str]]] = {}
+        # include и key обрабатываются в порядке появления
+        tokens = [(m.start(), "include", m) for m in _INCLUDE_RE.finditer(body)]
+        tokens += [(m.start(), "key", m) for m in _KEY_RE.finditer(body)]
+        for _, kind, match in sorted(tokens, key=lambda t: t[0]):
+            if kind == "include":
+                keys.update(self.parse(match.group(1), depth + 1))
+                continue
+            levels_match = _LEVELS_RE.search(match.group(2))
+            if not levels_match:
+                continue
+            names = [n.strip() for n in levels_match.group(1).split(",")]
+            levels = [keysym_to_char(n, self.keysyms) for n in names[:2]]
+            if len(levels) == 1:
+                levels.append(levels[0].upper() if levels[0] else None)
+            keys[match.group(1)] = levels
+        return keys
+
+
+def compile_layouts(
+    layouts: Dict[str, str], root: Path = XKB_ROOT, keysymdef: Path = KEYSYMDEF
+) -> Dict[str, List[Tuple[int, int, int]]]:
+    """Компилирует раскладки в записи (код клавиши, символ 1, символ 2)
+
+    Args:
+        layouts: Имя в lipunto -> спецификация символов XKB
+        root: Каталог данных XKB (системный или вложенный в проект)
+        keysymdef: Путь к keysymdef.h
+
+    Returns:
+        dict: Имя раскладки -> список записей, отсортированных по коду клавиши
+    """
+    keycodes = load_keycodes(root)
+    parser = SymbolsParser(root, load_keysyms(keysymdef))
+    result = {}
+    for name, spec in layouts.items():
+        keys = parser.parse(spec)
+        records = []
+        for key_name in MAIN_KEYS:
+            if key_name not in keys or key_name not in keycodes:
+                continue
+            level1, level2 = keys[key_name]
+            records.append(
+                (
+                    keycodes[key_name],
+                    ord(level1) if level1 else 0,
+                    ord(level2) if level2 else 0,
+                )
+            )
+        result[name] = sorted(records)
+    return result
+
+
+def write_cache(compiled: Dict[str, List[Tuple[int, int, int]]], path: Path) -> None:
+    """Записывает двоичный кэш раскладок"""
+    directory = bytearray()
+    records = bytearray()
+    data_offset = HEADER.size + DIRECTORY_ENTRY.size * len(compiled)
+    for name, entries in compiled.items():
+        directory += DIRECTORY_ENTRY.pack(
+            name.encode("ascii"), data_offset + len(records), len(entries)
+        )
+        for entry in entries:
+            records += RECORD.pack(*entry)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(HEADER.pack(MAGIC, VERSION, len(compiled)) + directory + records)
+    os.replace(tmp_path, path)
+
+
+class LayoutCache:
+    """Отображенный в память кэш раскладок"""
+
+    def __init__(self, path: Path):
+        """
+        Raises:
+            OSError, ValueError: Если файл недоступен или поврежден
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Неподдерживаемый формат кэша раскладок: {path}")
+        self._directory: Dict[str, Tuple[int, int]] = {}
+        for index in range(count):
+            raw_name, offset, length = DIRECTORY_ENTRY.unpack_from(
+                self._map, HEADER.size + index * DIRECTORY_ENTRY.size
+            )
+            self._directory[raw_name.rstrip(b"\0").decode("ascii")] = (offset, length)
+
+    def names(self) -> List[str]:
+        """Имена раскладок в кэше"""
+        return list(self._directory)
+
+    def records(self, name: str) -> List[Tuple[int, int, int]]:
+        """Записи (код клавиши, символ 1, символ 2) раскладки"""
+        offset, length = self._directory[name]
+        view = memoryview(self._map)[offset : offset + length * RECORD.size]
+        return list(RECORD.iter_unpack(view))
+
+    def pair(self, source: str, target: str) -> Dict[str, str]:
+        """Строит словарь символ -> символ для клавиш, общих для двух раскладок"""
+        target_keys = {code: (l1, l2) for code, l1, l2 in self.records(target)}
+        mapping: Dict[str, str] = {}
+        for code, level1, level2 in self.records(source):
+            if code not in target_keys:
+                continue
+            for src, dst in zip((level1, level2), target_keys[code]):
+                if src and dst and src != dst:
+                    mapping.setdefault(chr(src), chr(dst))
+        return mapping
+
+
+def default_cache_paths() -> List[Path]:
+    """Пути, в которых ищется кэш раскладок, в порядке приоритета"""
+    paths = []
+    override = os.environ.get("LIPUNTO_LAYOUT_CACHE")
+    if override:
+        paths.append(Path(override))
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    paths.append(Path(cache_dir) / "lipunto" / "layouts.bin")
+    paths.append(Path(__file__).resolve().parent / "layouts.bin")
+    return paths
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Компиляция раскладок XKB в кэш lipunto")
+    parser.add_argument(
+        "layouts",
+        nargs="*",
+        help="Раскладки вида имя=символы_XKB (например, uk=ua или ru)",
+    )
+    parser.add_argument("-o", "--output", help="Файл кэша")
+    parser.add_argument("--xkb-root", default=str(XKB_ROOT), help="Каталог данных XKB")
+    parser.add_argument("--keysymdef", default=str(KEYSYMDEF), help="Путь к keysymdef.h")
+    args = parser.parse_args()
+
+    layouts = {}
+    for item in args.layouts:
+        name, _, spec = item.partition("=")
+        layouts[name] = spec or name
+    compiled = compile_layouts(
+        layouts or DEFAULT_LAYOUTS, Path(args.xkb_root), Path(args.keysymdef)
+    )
+    output = Path(args.output) if args.output else default_cache_paths()[-1]
+    write_cache(compiled, output)
+    for name, records in compiled.items():
+        print(f"{name}: {len(records)} keys")
+    print(f"Layout cache written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Состояние раскладки клавиатуры KDE для lipunto
+Активная раскладка и список раскладок читаются через org.kde.keyboard
+(getLayout, getLayoutsList). Демон подписывается на сигналы layoutChanged
+и layoutListChanged и держит состояние в памяти, поэтому действие не
+тратит на него ни одного вызова D-Bus; одиночный запуск запрашивает
+активную раскладку один раз за действие. По состоянию выбирается
+направление преобразования, а нужная раскладка включается одним вызовом
+setLayout вместо switchToNextLayout.
+"""
+
+from typing import Callable, List, Optional
+
+from dbus_client import KEYBOARD_INTERFACE
+from logger import get_logger
+
+KEYBOARD_SERVICE = "org.kde.keyboard"
+KEYBOARD_PATH = "/Layouts"
+LAYOUT_CHANGED = "layoutChanged"
+LAYOUT_LIST_CHANGED = "layoutListChanged"
+
+# Имя символов XKB -> имя раскладки в lipunto ('us' -> 'en'); None - еще
+# не построено
+_xkb_names = None
+
+
+def layout_name(short_name: str) -> str:
+    """Имя раскладки lipunto по короткому имени KDE ('us' -> 'en')"""
+    global _xkb_names
+    if _xkb_names is None:
+        # Компилятор раскладок нужен только здесь: не загружаем его при старте
+        from layout_compiler import DEFAULT_LAYOUTS
+
+        _xkb_names = {symbols: name for name, symbols in DEFAULT_LAYOUTS.items()}
+    return _xkb_names.get(short_name, short_name)
+
+
+class LayoutState:
+    """Активная раскладка KDE: запрос getLayout или кэш по сигналам"""
+
+    def __init__(self, dbus, call: Callable):
+        """
+        Args:
+            dbus: Транспорт D-Bus из dbus_client
+            call: Функция вызова метода D-Bus (ClipboardManager.dbus_call)
+        """
+        self.dbus = dbus
+        self._call = call
+        self.logger = get_logger()
+        # Имена раскладок lipunto по номерам KDE; None - список неизвестен
+        self.layouts: Optional[List[str]] = None
+        # Номер активной раскладки; None - неизвестен
+        self.index: Optional[int] = None
+        # Состояние обновляется сигналами, а не запросом в каждом действии
+        self.tracking = False
+
+    def _keyboard(self, method: str, *args):
+        return self._call(KEYBOARD_SERVICE, KEYBOARD_PATH, method, *args)
+
+    def track(self) -> bool:
+        """Подписывается на сигналы раскладок (для демона)
+
+        Returns:
+            bool: False, если транспорт не принимает сигналы
+        """
+        if not hasattr(self.dbus, "take_signals"):
+            return False
+        try:
+            self.dbus.subscribe(KEYBOARD_INTERFACE, LAYOUT_CHANGED)
+            self.dbus.subscribe(KEYBOARD_INTERFACE, LAYOUT_LIST_CHANGED)
+        except Exception as e:
+            self.logger.debug("Keyboard layout signals unavailable: %s", e)
+            return False
+        self.tracking = True
+        # Изменения до подписки не видны - состояние читается заново
+        self.index = None
+        self.layouts = None
+        return True
+
+    def _apply_signals(self) -> None:
+        try:
+            signals = self.dbus.take_signals(KEYBOARD_INTERFACE)
+        except Exception as e:
+            self.logger.debug("Keyboard layout signals lost: %s", e)
+            self.tracking = False
+            return
+        for message in signals:
+            if message.member == LAYOUT_CHANGED and message.body:
+                self.index = message.body[0]
+            elif message.member == LAYOUT_LIST_CHANGED:
+                self.layouts = None
+
+    def refresh(self) -> None:
+        """Обновляет состояние перед действием
+
+        С подпиской применяются пришедшие сигналы, и D-Bus вызывается только
+        для неизвестных значений; без подписки активная раскладка
+        запрашивается всегда.
+
+        Raises:
+            RuntimeError: Если вызов D-Bus завершился с ошибкой
+        """
+        if self.tracking:
+            self._apply_signals()
+        if self.layouts is None:
+            names = []
+            for item in self._keyboard("getLayoutsList") or []:
+                if not isinstance(item, (list, tuple)):
+                    # qdbus выводит структуры без разбора - список неизвестен
+                    names = []
+                    break
+                names.append(layout_name(item[0]))
+            self.layouts = names
+        if self.index is None or not self.tracking:
+            self.index = self._keyboard("getLayout")
+
+    def current(self) -> Optional[str]:
+        """Имя активной раскладки ('en', 'ru') или None, если оно неизвестно"""
+        if self.layouts and self.index is not None and 0 <= self.index < len(self.layouts):
+            return self.layouts[self.index]
+        return None
+
+    def set(self, name: str) -> bool:
+        """Включает раскладку одним вызовом setLayout
+
+        Args:
+            name (str): Имя раскладки lipunto
+
+        Returns:
+            bool: False, если раскладки нет в списке KDE или KDE отказал
+        """
+        if not self.layouts or name not in self.layouts:
+            return False
+        index = self.layouts.index(name)
+        if not self._keyboard("setLayout", index):
+            return False
+        # Сигнал о собственном переключении придет позже с тем же номером
+        self.index = index
+        return True
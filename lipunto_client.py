@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Тонкий клиент демона lipunto
+Отправляет команду в Unix-сокет демона. Импортирует только стандартные
+модули socket/os/sys, поэтому запускается значительно быстрее switch_layout.py
+
+Эквивалент без Python:
+    echo last | socat - UNIX-CONNECT:$XDG_RUNTIME_DIR/lipunto.sock
+"""
+
+import os
+import socket
+import sys
+
+
+def default_socket_path() -> str:
+    """Путь к сокету демона (совпадает с daemon.default_socket_path)"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "lipunto.sock")
+    return f"/tmp/lipunto-{os.getuid()}.sock"
+
+
+def send_command(command: str, socket_path: str = "", timeout: float = 30.0) -> str:
+    """Отправляет команду демону и возвращает его ответ
+
+    Args:
+        command (str): Команда ('last', 'selected' или 'ping')
+        socket_path (str): Путь к сокету демона
+        timeout (float): Время ожидания ответа в секундах
+
+    Returns:
+        str: Ответ демона
+
+    Raises:
+        OSError: Если демон недоступен
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(command.encode("utf-8") + b"\n")
+        return sock.recv(4096).decode("utf-8", errors="replace").strip()
+
+
+def main() -> int:
+    command = sys.argv[1] if len(sys.argv) > 1 else "last"
+    socket_path = sys.argv[2] if len(sys.argv) > 2 else ""
+    try:
+        reply = send_command(command, socket_path)
+    except OSError as e:
+        print(f"lipunto daemon is not available: {e}", file=sys.stderr)
+        # Код 2 позволяет shell-обертке перейти на однократный запуск
+        return 2
+    if reply != "ok":
+        print(reply, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
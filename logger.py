@@ -2,14 +2,110 @@
 """
 Модуль логирования для lipunto
 Предоставляет многоуровневое логирование с разными выводами
+
+Сообщения форматируются лениво (аргументы в стиле %), а записываются
+фоновым потоком через очередь, поэтому медленный диск не задерживает
+действие. Текст пользователя передается через Payload: он обрезается
+или заменяется хэшем при выводе.
 """
 
+import atexit
+import functools
+import hashlib
+import json
 import logging
 import logging.handlers
+import os
+import queue
 import sys
-from datetime import datetime
+import threading
+import time
+from contextvars import ContextVar
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Сколько последних файлов трассировки хранить в каталоге
+MAX_TRACE_FILES = 50
+# Размер файла лога до ротации и число старых файлов по умолчанию
+DEFAULT_MAX_BYTES = 1 << 20
+DEFAULT_BACKUP_COUNT = 3
+# Сколько символов текста пользователя выводится в режиме truncate
+PAYLOAD_LIMIT = 64
+PAYLOAD_MODES = ("truncate", "hash", "full")
+
+# Режим вывода текста пользователя и поток записи текущего логгера
+_payload_mode = "truncate"
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def format_payload(text: Optional[str], mode: Optional[str] = None) -> str:
+    """Представление текста пользователя в логе
+
+    Args:
+        text (str): Текст
+        mode (str): truncate - начало текста, длина и хэш для длинного
+            текста; hash - только длина и хэш; full - текст целиком.
+            По умолчанию - режим из конфигурации логирования
+
+    Returns:
+        str: Строка для сообщения лога
+    """
+    if text is None:
+        return "None"
+    mode = mode or _payload_mode
+    if mode == "full" or (mode == "truncate" and len(text) <= PAYLOAD_LIMIT):
+        return repr(text)
+    digest = hashlib.blake2b(
+        text.encode("utf-8", "surrogatepass"), digest_size=4
+    ).hexdigest()
+    summary = f"<{len(text)} chars #{digest}>"
+    if mode == "hash":
+        return summary
+    return f"{text[:PAYLOAD_LIMIT]!r}... {summary}"
+
+
+class Payload:
+    """Текст пользователя как аргумент сообщения лога
+
+    Преобразуется в строку только при записи сообщения, поэтому при
+    выключенном логировании ничего не стоит:
+    logger.info("Converting text: %s", Payload(text))
+    """
+
+    __slots__ = ("text",)
+
+    def __init__(self, text: Optional[str]):
+        self.text = text
+
+    def __str__(self) -> str:
+        return format_payload(self.text)
+
+    __repr__ = __str__
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, откладывающий форматирование до потока записи
+
+    Стандартный prepare() форматирует сообщение в вызывающем потоке;
+    здесь запись передается как есть - аргументы сообщений не изменяются
+    после вызова логгера.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _stop_listener() -> None:
+    """Дописывает очередь и останавливает поток записи"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(_stop_listener)
 
 
 class LipuntoLogger:
@@ -24,6 +120,16 @@ class LipuntoLogger:
         "CRITICAL": logging.CRITICAL,
     }
 
+    # Методы уровней - методы logging.Logger, привязанные в __init__ без
+    # промежуточного вызова: сообщение выключенного уровня стоит одной
+    # проверки isEnabledFor, а аргументы форматируются только при записи
+    debug: Callable[..., None]
+    info: Callable[..., None]
+    warning: Callable[..., None]
+    error: Callable[..., None]
+    critical: Callable[..., None]
+    exception: Callable[..., None]
+
     def __init__(self, config: Optional[Dict[str, Any]] = None):
         """
         Инициализация логгера
@@ -31,8 +137,22 @@ class LipuntoLogger:
         Args:
             config: Конфигурация логирования
         """
+        global _payload_mode, _listener
         self.config = config or {}
         self.logger = logging.getLogger("lipunto")
+        # Записи предыдущего логгера дописываются с его настройками
+        self.logger.handlers.clear()
+        _stop_listener()
+        self.debug = self.logger.debug
+        self.info = self.logger.info
+        self.warning = self.logger.warning
+        self.error = self.logger.error
+        self.critical = self.logger.critical
+        self.exception = self.logger.exception
+        # Трассировка не зависит от включения логирования
+        configure_tracing(self.config)
+        mode = self.config.get("payload", "truncate")
+        _payload_mode = mode if mode in PAYLOAD_MODES else "truncate"
         self.formatter = logging.Formatter(
             "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
             datefmt="%Y-%m-%d %H:%M:%S",
@@ -45,8 +165,8 @@ class LipuntoLogger:
             self.logger.setLevel(logging.CRITICAL + 1)
             return
 
-        # Очищаем существующие обработчики
-        self.logger.handlers.clear()
+        # Обработчики вызываются потоком записи, а не логгером
+        handlers: List[logging.Handler] = []
 
         # Устанавливаем уровень логирования
         self.logger.setLevel(self._get_log_level())
@@ -56,7 +176,7 @@ class LipuntoLogger:
             self.console_handler = logging.StreamHandler(sys.stderr)
             self.console_handler.setLevel(self._get_log_level())
             self.console_handler.setFormatter(self.formatter)
-            self.logger.addHandler(self.console_handler)
+            handlers.append(self.console_handler)
 
         # Обработчик для файла
         log_file = self.config.get("file")
@@ -65,10 +185,17 @@ class LipuntoLogger:
                 # Создаем директорию если не существует
                 log_path = Path(log_file)
                 log_path.parent.mkdir(parents=True, exist_ok=True)
-                file_handler = logging.FileHandler(log_file, encoding="utf-8")
+                # Размер лога ограничен: старые записи уходят в .1, .2, ...
+                file_handler = logging.handlers.RotatingFileHandler(
+                    log_file,
+                    maxBytes=self.config.get("max_bytes", DEFAULT_MAX_BYTES),
+                    backupCount=self.config.get("backup_count", DEFAULT_BACKUP_COUNT),
+                    encoding="utf-8",
+                    delay=True,
+                )
                 file_handler.setLevel(self._get_log_level())
                 file_handler.setFormatter(self.formatter)
-                self.logger.addHandler(file_handler)
+                handlers.append(file_handler)
             except Exception as e:
                 # Используем консольный обработчик для ошибки, если он существует
                 if hasattr(self, 'console_handler'):
@@ -82,7 +209,7 @@ class LipuntoLogger:
                 syslog_handler = logging.handlers.SysLogHandler(address="/dev/log")
                 syslog_handler.setLevel(self._get_log_level())
                 syslog_handler.setFormatter(self.formatter)
-                self.logger.addHandler(syslog_handler)
+                handlers.append(syslog_handler)
             except Exception as e:
                 # Используем консольный обработчик для ошибки, если он существует
                 if hasattr(self, 'console_handler'):
@@ -90,6 +217,14 @@ class LipuntoLogger:
                 else:
                     print(f"Failed to setup syslog handler: {e}")
 
+        if handlers:
+            log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            _listener = logging.handlers.QueueListener(
+                log_queue, *handlers, respect_handler_level=True
+            )
+            _listener.start()
+            self.logger.addHandler(_DeferredQueueHandler(log_queue))
+
     def _get_log_level(self) -> int:
         """Получает уровень логирования из конфигурации"""
         # Если логирование отключено, возвращаем максимальный уровень
@@ -99,30 +234,6 @@ class LipuntoLogger:
         level = self.config.get("level", "WARNING").upper()
         return self.LEVELS.get(level, logging.WARNING)
 
-    def debug(self, message: str, *args, **kwargs) -> None:
-        """Логирование отладочной информации"""
-        self.logger.debug(message, *args, **kwargs)
-
-    def info(self, message: str, *args, **kwargs) -> None:
-        """Логирование информационных сообщений"""
-        self.logger.info(message, *args, **kwargs)
-
-    def warning(self, message: str, *args, **kwargs) -> None:
-        """Логирование предупреждений"""
-        self.logger.warning(message, *args, **kwargs)
-
-    def error(self, message: str, *args, **kwargs) -> None:
-        """Логирование ошибок"""
-        self.logger.error(message, *args, **kwargs)
-
-    def critical(self, message: str, *args, **kwargs) -> None:
-        """Логирование критических ошибок"""
-        self.logger.critical(message, *args, **kwargs)
-
-    def exception(self, message: str, *args, **kwargs) -> None:
-        """Логирование исключений"""
-        self.logger.exception(message, *args, **kwargs)
-
 
 # Глобальный экземпляр логгера
 _logger_instance = None
@@ -173,8 +284,205 @@ def exception(message: str, *args, **kwargs) -> None:
     get_logger().exception(message, *args, **kwargs)
 
 
+# Глубина вложенности и интервалы текущего действия. Контекстные
+# переменные наследуются задачами asyncio и asyncio.to_thread, поэтому
+# этапы, выполняемые параллельно, вкладываются в свое действие
+_trace_depth: ContextVar[int] = ContextVar("lipunto_trace_depth", default=0)
+_trace_events: ContextVar[Optional[list]] = ContextVar("lipunto_trace_events", default=None)
+
+# Интервал: (имя, начало, длительность, глубина, поток, аргументы)
+TraceEvent = Tuple[str, int, int, int, int, Dict[str, Any]]
+
+
+class Tracer:
+    """Настройки трассировки и вывод собранных интервалов
+
+    Интервалы измеряются time.perf_counter_ns; каждое действие (внешний
+    LogContext) собирает их в собственный список.
+    """
+
+    def __init__(self, trace_dir: Optional[str] = None):
+        """
+        Args:
+            trace_dir: Каталог для файлов Chrome trace; None - не сохранять
+        """
+        self.trace_dir = trace_dir
+
+    @staticmethod
+    def chrome_trace(events: List[TraceEvent]) -> Dict[str, Any]:
+        """Интервалы в формате Chrome trace-event (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        origin = min((event[1] for event in events), default=0)
+        return {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "ts": (start - origin) / 1e3,
+                    "dur": duration / 1e3,
+                    "pid": pid,
+                    "tid": tid,
+                    **({"args": args} if args else {}),
+                }
+                for name, start, duration, _, tid, args in events
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    @staticmethod
+    def summary(operation: str, events: List[TraceEvent]) -> str:
+        """Однострочная сводка: длительность действия и его верхних этапов
+
+        Повторяющиеся этапы суммируются, число повторов указывается после x.
+        """
+        total = 0
+        stages: Dict[str, List[int]] = {}
+        for name, _, duration, depth, _, _ in events:
+            if depth == 0 and name == operation:
+                total = duration
+            elif depth == 1:
+                stage = stages.setdefault(name, [0, 0])
+                stage[0] += duration
+                stage[1] += 1
+        parts = [
+            f"{name} {duration / 1e6:.1f}" + (f"x{count}" if count > 1 else "")
+            for name, (duration, count) in sorted(
+                stages.items(), key=lambda item: item[1][0], reverse=True
+            )
+        ]
+        return f"trace {operation}: {total / 1e6:.1f}ms | " + " | ".join(parts)
+
+    def export(self, operation: str, events: List[TraceEvent]) -> Optional[Path]:
+        """Сохраняет трассировку в trace_dir и удаляет старые файлы
+
+        Returns:
+            Path: Путь к файлу или None, если каталог не задан
+        """
+        if not self.trace_dir:
+            return None
+        directory = Path(self.trace_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = "".join(c if c.isalnum() else "-" for c in operation).strip("-")
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = directory / f"{stamp}-{time.time_ns() % 10**9:09d}-{slug}.json"
+        path.write_text(json.dumps(self.chrome_trace(events)), encoding="utf-8")
+        old = sorted(directory.glob("*.json"))[:-MAX_TRACE_FILES]
+        for stale in old:
+            try:
+                stale.unlink()
+            except OSError:
+                pass
+        return path
+
+
+class Span:
+    """Интервал трассировки; используется через span() или @traced"""
+
+    __slots__ = ("name", "args", "start", "depth", "token")
+
+    def __init__(self, name: str, args: Dict[str, Any]):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.depth = _trace_depth.get()
+        self.token = _trace_depth.set(self.depth + 1)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter_ns() - self.start
+        _trace_depth.reset(self.token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        events = _trace_events.get()
+        if events is not None:
+            # list.append атомарен - потоки этапов пишут без блокировки
+            events.append(
+                (self.name, self.start, duration, self.depth,
+                 threading.get_native_id(), self.args)
+            )
+        return False
+
+    def set(self, **args) -> None:
+        """Добавляет аргументы, известные только после начала интервала"""
+        self.args.update(args)
+
+
+class _NullSpan:
+    """Интервал при выключенной трассировке - ничего не делает"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def set(self, **args) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+# Текущий сборщик; None - трассировка выключена
+_tracer: Optional[Tracer] = None
+
+
+def configure_tracing(config: Dict[str, Any]) -> Optional[Tracer]:
+    """Включает или выключает трассировку по конфигурации логирования
+
+    Args:
+        config: Конфигурация логирования с ключами trace и trace_dir
+
+    Returns:
+        Tracer: Сборщик или None, если трассировка выключена
+    """
+    global _tracer
+    if not config.get("trace", False):
+        _tracer = None
+    elif _tracer is None or _tracer.trace_dir != config.get("trace_dir"):
+        _tracer = Tracer(config.get("trace_dir") or None)
+    return _tracer
+
+
+def span(name: str, **args):
+    """Контекстный менеджер интервала трассировки
+
+    При выключенной трассировке возвращает общий пустой объект, поэтому
+    стоит одной проверки глобальной переменной.
+
+    Args:
+        name: Имя этапа
+        **args: Аргументы для Chrome trace (без содержимого текста)
+    """
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(name, args)
+
+
+def traced(name: str):
+    """Декоратор: выполняет функцию внутри интервала трассировки"""
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with Span(name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
 class LogContext:
-    """Контекстный менеджер для логирования"""
+    """Контекстный менеджер для логирования
+
+    Корневой интервал трассировки: при выходе из внешнего LogContext
+    в лог пишется сводка этапов, а трассировка сохраняется в trace_dir.
+    """
 
     def __init__(self, operation: str, logger: Optional[LipuntoLogger] = None):
         """
@@ -187,23 +495,60 @@ class LogContext:
         self.operation = operation
         self.logger = logger or get_logger()
         self.start_time = None
+        self.span = _NULL_SPAN
+        self.tracer: Optional[Tracer] = None
+        self.events: Optional[List[TraceEvent]] = None
+        self._events_token = None
 
     def __enter__(self):
         """Вход в контекст"""
-        self.start_time = datetime.now()
-        self.logger.info(f"Starting operation: {self.operation}")
+        tracer = _tracer
+        if tracer is not None:
+            if _trace_events.get() is None:
+                # Внешний LogContext начинает новую трассировку
+                self.tracer = tracer
+                self.events = []
+                self._events_token = _trace_events.set(self.events)
+            self.span = Span(self.operation, {})
+            self.span.__enter__()
+        self.start_time = time.perf_counter_ns()
+        self.logger.info("Starting operation: %s", self.operation)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Выход из контекста"""
         if self.start_time is not None:
-            duration = datetime.now() - self.start_time
+            duration = (time.perf_counter_ns() - self.start_time) / 1e9
             if exc_type is None:
                 self.logger.info(
-                    f"Operation '{self.operation}' completed successfully in {duration.total_seconds():.3f}s"
+                    "Operation '%s' completed successfully in %.3fs",
+                    self.operation,
+                    duration,
                 )
             else:
                 self.logger.error(
-                    f"Operation '{self.operation}' failed after {duration.total_seconds():.3f}s: {exc_val}"
+                    "Operation '%s' failed after %.3fs: %s",
+                    self.operation,
+                    duration,
+                    exc_val,
                 )
-                return False  # Не подавляем исключение
+        self.span.__exit__(exc_type, exc_val, exc_tb)
+        if self._events_token is not None:
+            _trace_events.reset(self._events_token)
+            self._events_token = None
+            self._report()
+        return False  # Не подавляем исключение
+
+    def _report(self) -> None:
+        """Пишет сводку трассировки и сохраняет ее в формате Chrome trace"""
+        tracer, events = self.tracer, self.events
+        # При выключенном логировании сводка не выводится, файл сохраняется
+        if self.logger.logger.isEnabledFor(logging.INFO):
+            self.logger.info("%s", tracer.summary(self.operation, events))
+        try:
+            path = tracer.export(self.operation, events)
+        except OSError as e:
+            self.logger.warning("Failed to save trace: %s", e)
+            return
+        if path is not None:
+            self.logger.debug("Trace saved to %s", path)
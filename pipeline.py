@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Асинхронный конвейер действия lipunto
+Действие разбито на шаги. Независимые шаги выполняются одновременно:
+снимок истории буфера, определение класса окна и выделение слова. Строго
+упорядоченная часть - копирование -> чтение буфера -> вставка - идет одной
+цепочкой await. Переключение раскладки, восстановление истории и
+уведомление выполняются в фоне, после того как управление вернулось к
+пользователю; следующее действие начинается только после фоновых шагов
+предыдущего. В режиме selected с primary_selection текст берется из
+PRIMARY, если она не пуста и не устарела, - тогда копирования нет совсем,
+а замена выполняется только вставкой. Повторное нажатие в окне
+toggle_window отменяет предыдущую замену по журналу. Если монитор нажатий
+подтверждает, что после замены ничего не набрано, выделение и копирование
+не нужны; иначе текст замены выделяется и сверяется с журналом.
+
+Блокирующие вызовы (D-Bus, сокет ydotoold, процессы) выполняются в потоках
+через asyncio.to_thread; цикл событий работает в отдельном потоке и
+создается при первом действии.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+import time
+from typing import Coroutine, List, Optional, Set
+
+from input_backend import chord
+from keycodes import KEY_BACKSPACE, KEY_LEFT, KEY_LEFTSHIFT, KEY_RIGHT
+from logger import LogContext, get_logger, span
+
+
+class ActionPipeline:
+    """Конвейер действий 'last' и 'selected' для LayoutSwitcher"""
+
+    def __init__(self, switcher):
+        """
+        Args:
+            switcher: LayoutSwitcher, шаги которого выполняет конвейер
+        """
+        self.switcher = switcher
+        self.logger = get_logger()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # Фоновые шаги, которых ждет следующее действие
+        self._pending: Set[concurrent.futures.Future] = set()
+        self._pending_lock = threading.Lock()
+        # Уведомления: их не ждут ни действия, ни завершение процесса
+        self._detached: Set[asyncio.Task] = set()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self.loop.run_forever, name="lipunto-pipeline", daemon=True
+                )
+                self._thread.start()
+        return self.loop
+
+    def _submit(
+        self, coro: Coroutine, context: Optional[contextvars.Context] = None
+    ) -> concurrent.futures.Future:
+        """Запускает корутину в цикле конвейера с заданным контекстом
+
+        Контекст несет трассировку: этапы действия вкладываются в LogContext
+        вызывающего потока, а фоновые шаги получают пустой контекст и
+        собственную трассировку.
+        """
+        loop = self._ensure_loop()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        context = context if context is not None else contextvars.copy_context()
+
+        def start() -> None:
+            if not future.set_running_or_notify_cancel():
+                coro.close()
+                return
+            task = loop.create_task(coro, context=context)
+
+            def done(task: asyncio.Task) -> None:
+                if task.cancelled():
+                    future.cancel()
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+
+            task.add_done_callback(done)
+
+        loop.call_soon_threadsafe(start)
+        return future
+
+    def run(self, action: str) -> None:
+        """Выполняет действие и возвращается, когда текст заменен
+
+        Переключение раскладки и восстановление истории продолжаются в фоне.
+
+        Raises:
+            RuntimeError: Если шаг действия завершился с ошибкой
+        """
+        self.wait_idle()
+        self._submit(self._action(action)).result()
+
+    def background(self, coro: Coroutine) -> None:
+        """Запускает фоновые шаги; следующее действие дождется их"""
+        future = self._submit(coro, contextvars.Context())
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._forget)
+
+    def _forget(self, future: concurrent.futures.Future) -> None:
+        with self._pending_lock:
+            self._pending.discard(future)
+
+    def wait_idle(self, timeout: Optional[float] = None) -> None:
+        """Ждет завершения фоновых шагов предыдущих действий"""
+        with self._pending_lock:
+            pending = list(self._pending)
+        if pending:
+            concurrent.futures.wait(pending, timeout)
+
+    def spawn(self, command: List[str]) -> None:
+        """Запускает процесс без ожидания (уведомление kdialog)
+
+        Код возврата проверяется в цикле конвейера; если процесс не
+        завершился к закрытию конвейера, он продолжает работу сам по себе.
+        """
+        loop = self._ensure_loop()
+
+        def start() -> None:
+            task = loop.create_task(self._run_detached(command), context=contextvars.Context())
+            self._detached.add(task)
+            task.add_done_callback(self._detached.discard)
+
+        loop.call_soon_threadsafe(start)
+
+    async def _run_detached(self, command: List[str]) -> None:
+        try:
+            process = await asyncio.create_subprocess_exec(*command)
+        except OSError as e:
+            self.logger.warning("Failed to start %s: %s", command[0], e)
+            return
+        code = await process.wait()
+        if code:
+            self.logger.warning("%s exited with code %d", command[0], code)
+
+    def close(self) -> None:
+        """Дожидается фоновых шагов и останавливает цикл конвейера"""
+        loop = self.loop
+        if loop is None:
+            return
+        self.wait_idle()
+
+        def stop() -> None:
+            for task in self._detached:
+                task.cancel()
+            loop.stop()
+
+        loop.call_soon_threadsafe(stop)
+        self._thread.join()
+        self.loop = None
+
+    async def _select(self, action: str) -> None:
+        """Пауза перед действием и выделение последнего слова"""
+        switcher = self.switcher
+        delay = switcher.settings.delays.text_process
+        self.logger.debug("Waiting %ss for text processing", delay)
+        with span("sleep", step="text_process"):
+            await asyncio.sleep(delay)
+        if action == "last":
+            await asyncio.to_thread(switcher.select_last_word)
+
+    async def _action(self, action: str) -> None:
+        switcher = self.switcher
+        manager = switcher.clipboard_manager
+        manager.settle_times.clear()
+
+        entry = switcher.toggle_entry(action)
+        if entry is not None and await self._toggle(entry):
+            return
+
+        # Выделенный текст обычно уже есть в PRIMARY: он читается без Ctrl+C
+        # и без снимка истории буфера обмена
+        primary = action == "selected" and switcher.settings.primary_selection
+        first = switcher.read_primary if primary else manager.save_clipboard_history
+        # Независимые шаги: снимок истории (или PRIMARY), выделение -
+        # нажатия в сокет ydotoold, активная раскладка, класс окна - kdotool
+        steps = [
+            asyncio.to_thread(first),
+            self._select(action),
+            asyncio.to_thread(switcher.detect_layout),
+        ]
+        if switcher.delay_tuner is not None:
+            steps.append(asyncio.to_thread(switcher.detect_window_class))
+        try:
+            result = (await asyncio.gather(*steps))[0]
+        except BaseException:
+            self.background(self._finish(action))
+            raise
+
+        switch_layout = False
+        paste_delay = 0.0
+        try:
+            if action == "last":
+                self.logger.info("Processing last word")
+            elif primary and result:
+                self.logger.info("Processing selected text from PRIMARY")
+            else:
+                self.logger.info("Processing selected text")
+            if primary and result:
+                text = result
+            else:
+                # PRIMARY пуста или устарела - снимок истории и Ctrl+C
+                snapshot = (
+                    await asyncio.to_thread(manager.save_clipboard_history)
+                    if primary
+                    else result
+                )
+                # Упорядоченная часть: копирование -> чтение буфера -> вставка
+                text = await asyncio.to_thread(
+                    manager.copy_selection, snapshot, switcher.get_delay("clipboard_get")
+                )
+            if not text:
+                self.logger.warning("No text selected or last word found")
+                if switcher.show_popup:
+                    switcher.show_popup_message(
+                        "No text selected or last word found", error=True
+                    )
+                return
+
+            # Выделение может смешивать верно и неверно набранный текст
+            segment = action == "selected" and switcher.settings.segment_selection
+            # Выделение из PRIMARY могло быть снято: вставка в худшем случае
+            # добавит текст, а ввод клавиш стер бы текст перед курсором
+            strategy = "paste" if primary and result else None
+            converted_text, plan = switcher.prepare_replacement(text, segment, strategy)
+            if not switcher.conversion_plausible(text, converted_text):
+                self.logger.info("Text looks correct, conversion skipped")
+                if action == "last":
+                    # Снять выделение слова, оставив курсор в его конце
+                    await asyncio.to_thread(manager.send_keys, chord(KEY_RIGHT))
+                return
+            if plan.strategy == "keys":
+                # Раскладка переключается между стиранием и набором
+                await asyncio.to_thread(switcher.replace_with_keys, plan)
+            else:
+                started = time.monotonic()
+                await asyncio.to_thread(
+                    manager.send_paste, converted_text, switcher.get_delay("clipboard_set")
+                )
+                manager.settle_times["replace_paste"] = time.monotonic() - started
+                switch_layout = True
+                paste_delay = switcher.get_delay("paste")
+            switcher.record_conversion(action, text, converted_text, plan.strategy)
+            if switcher.show_popup:
+                switcher.show_conversion_popup(text, converted_text)
+        finally:
+            self.background(self._finish(action, switch_layout, paste_delay))
+
+    async def _toggle(self, entry) -> bool:
+        """Повторное нажатие: возвращает текст до предыдущей замены
+
+        Отмена сама записывается в журнал - следующее нажатие снова вернет
+        замену.
+
+        Args:
+            entry (JournalEntry): Последняя замена из журнала
+
+        Returns:
+            bool: False, если текст перед курсором уже не совпадает с
+            заменой и нажатие нужно выполнить как обычное действие
+        """
+        switcher = self.switcher
+        self.logger.info("Reverting previous conversion (%s)", entry.strategy)
+        # Раскладка после замены - цель отмены; демону она известна из кэша
+        await asyncio.to_thread(switcher.detect_layout)
+        if entry.edits is None:
+            return await self._toggle_verified(entry)
+        await self._toggle_tracked(entry)
+        return True
+
+    async def _toggle_tracked(self, entry) -> None:
+        """Отмена, когда монитор нажатий подтвердил, что после замены ничего не набрано
+
+        Новый текст стоит перед курсором, и журнал знает обе строки,
+        поэтому выделение и чтение буфера обмена не нужны.
+        """
+        switcher = self.switcher
+        manager = switcher.clipboard_manager
+        plan = switcher.plan_replacement(entry.converted, entry.original, selected=False)
+        switch_layout = False
+        paste_delay = 0.0
+        try:
+            if plan.strategy == "keys":
+                await asyncio.to_thread(switcher.replace_with_keys, plan)
+            else:
+                # Стирание и снимок истории независимы
+                erase = chord(KEY_BACKSPACE) * len(entry.converted)
+                steps = [asyncio.to_thread(manager.send_keys, erase)]
+                if manager.clipboard.has_history:
+                    steps.append(asyncio.to_thread(manager.save_clipboard_history))
+                await asyncio.gather(*steps)
+                await asyncio.to_thread(
+                    manager.send_paste, entry.original, switcher.get_delay("clipboard_set")
+                )
+                switch_layout = True
+                paste_delay = switcher.get_delay("paste")
+            self._record_toggle(entry, plan.strategy)
+        finally:
+            self.background(
+                self._finish(f"{entry.action}, toggle", switch_layout, paste_delay)
+            )
+
+    async def _toggle_verified(self, entry) -> bool:
+        """Отмена без монитора нажатий
+
+        Неизвестно, набрано ли что-то после замены, поэтому текст длины
+        замены выделяется (Shift+Left) и копируется. Замена отменяется,
+        только если он совпал с журналом; иначе выделение снимается и
+        ничего не стирается, а нажатие last выполняется как обычное.
+        """
+        switcher = self.switcher
+        manager = switcher.clipboard_manager
+        select = chord(KEY_LEFTSHIFT, KEY_LEFT) * len(entry.converted)
+        snapshot = (
+            await asyncio.gather(
+                asyncio.to_thread(manager.save_clipboard_history),
+                asyncio.to_thread(manager.send_keys, select),
+            )
+        )[0]
+        switch_layout = False
+        paste_delay = 0.0
+        try:
+            text = await asyncio.to_thread(
+                manager.copy_selection, snapshot, switcher.get_delay("clipboard_get")
+            )
+            if text != entry.converted:
+                self.logger.info("Text changed since the previous conversion, not reverting")
+                await asyncio.to_thread(manager.send_keys, chord(KEY_RIGHT))
+                # Обычное действие снимает свой снимок истории - эта
+                # история восстанавливается до него, а не в фоне
+                await self._finish(f"{entry.action}, toggle")
+                # Для selected обычное действие бессмысленно: после замены
+                # выделения нет, и Ctrl+C вернул бы прежний буфер
+                return entry.action != "last"
+            # Замена выделена: вставка заменяет выделение целиком
+            plan = switcher.plan_replacement(entry.converted, entry.original)
+            if plan.strategy == "keys":
+                await asyncio.to_thread(switcher.replace_with_keys, plan)
+            else:
+                await asyncio.to_thread(
+                    manager.send_paste, entry.original, switcher.get_delay("clipboard_set")
+                )
+                switch_layout = True
+                paste_delay = switcher.get_delay("paste")
+            self._record_toggle(entry, plan.strategy)
+        except BaseException:
+            self.background(self._finish(f"{entry.action}, toggle"))
+            raise
+        self.background(self._finish(f"{entry.action}, toggle", switch_layout, paste_delay))
+        return True
+
+    def _record_toggle(self, entry, strategy: str) -> None:
+        switcher = self.switcher
+        switcher.record_conversion(entry.action, entry.converted, entry.original, strategy)
+        if switcher.show_popup:
+            switcher.show_conversion_popup(entry.converted, entry.original)
+
+    async def _finish(
+        self, action: str, switch_layout: bool = False, paste_delay: float = 0.0
+    ) -> None:
+        """Фоновые шаги: раскладка, восстановление истории, статистика задержек"""
+        switcher = self.switcher
+        manager = switcher.clipboard_manager
+        try:
+            with LogContext(f"Background ({action})", self.logger):
+                steps = [self._restore(paste_delay)]
+                if switch_layout:
+                    steps.insert(0, asyncio.to_thread(switcher.switch_kde_layout))
+                await asyncio.gather(*steps)
+                await asyncio.to_thread(switcher._record_delays)
+        except Exception as e:
+            # Фоновые шаги некому прервать - ошибка только записывается
+            self.logger.exception("Background steps of '%s' failed: %s", action, e)
+            manager.history = None
+
+    async def _restore(self, delay: float) -> None:
+        """Ждет, пока приложение прочитает буфер, и восстанавливает историю"""
+        manager = self.switcher.clipboard_manager
+        if delay > 0:
+            self.logger.debug("Waiting %ss for clipboard paste operation", delay)
+            with span("sleep", step="paste"):
+                await asyncio.sleep(delay)
+        await asyncio.to_thread(manager.release_history)
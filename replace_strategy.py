@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Выбор способа замены текста в приложении
+Текст заменяется либо вставкой через буфер обмена (сохранение истории,
+Shift+Insert, пауза, восстановление), либо вводом клавиш: стирается и
+набирается заново только отличающаяся часть. Способ выбирается по оценке
+стоимости: число нажатий умножается на измеренное время одного нажатия и
+сравнивается с измеренным временем вставки.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from input_backend import KeyEvent, chord
+from keyboard_layouts import get_layout_cache
+from keycodes import KEY_BACKSPACE, KEY_LEFT, KEY_RIGHT, KEY_SPACE
+from keystroke_buffer import Stroke, stroke_events, strokes_text
+
+STRATEGIES = ("auto", "keys", "paste")
+
+# Оценка времени одного нажатия, пока нет измерений, и ее нижняя граница:
+# отправка события почти мгновенна, но приложение обрабатывает его не сразу
+KEY_COST = 0.002
+# Вызовы D-Bus при вставке сверх настроенных задержек
+PASTE_OVERHEAD = 0.03
+# Длинный ввод клавишами может вызвать автодополнение или автоповтор
+MAX_RETYPE_KEYS = 64
+# Общие начало и конец длинного текста сравниваются блоками такого размера
+AFFIX_BLOCK = 4096
+
+
+class ReplacePlan:
+    """План замены текста
+
+    Attributes:
+        strategy: 'keys' - ввод клавиш, 'paste' - вставка через буфер обмена
+        prefix: Длина общего начала исходного и нового текста
+        suffix: Длина общего конца исходного и нового текста
+        strokes: Нажатия, набирающие отличающуюся часть после смены раскладки
+        cost: Оценка времени выбранного способа в секундах
+        selected: Заменяемый текст выделен; иначе он стоит перед курсором
+    """
+
+    __slots__ = ("strategy", "prefix", "suffix", "strokes", "cost", "selected")
+
+    def __init__(
+        self, strategy, prefix=0, suffix=0, strokes=None, cost=0.0, selected=True
+    ):
+        self.strategy = strategy
+        self.prefix = prefix
+        self.suffix = suffix
+        self.strokes: List[Stroke] = strokes or []
+        self.cost = cost
+        self.selected = selected
+
+    @property
+    def keys(self) -> int:
+        """Количество нажатий для замены клавишами"""
+        return key_count(self.suffix, self.strokes, self.selected)
+
+    def erase_events(self) -> List[KeyEvent]:
+        """События до смены раскладки: снять выделение и стереть отличие
+
+        Выделение снимается клавишей Right (курсор встает в его конец),
+        общий конец обходится клавишей Left.
+        """
+        return (
+            (chord(KEY_RIGHT) if self.selected else [])
+            + chord(KEY_LEFT) * self.suffix
+            + chord(KEY_BACKSPACE) * len(self.strokes)
+        )
+
+    def type_events(self) -> List[KeyEvent]:
+        """События после смены раскладки: набрать отличие и вернуть курсор"""
+        return stroke_events(self.strokes) + chord(KEY_RIGHT) * self.suffix
+
+    def __repr__(self) -> str:
+        return (
+            f"ReplacePlan(strategy={self.strategy!r}, prefix={self.prefix}, "
+            f"suffix={self.suffix}, strokes={len(self.strokes)}, "
+            f"cost={self.cost:.4f})"
+        )
+
+
+def key_count(suffix: int, strokes: List[Stroke], selected: bool = True) -> int:
+    """Число нажатий: Right, обход конца, Backspace, ввод (с Shift) и возврат"""
+    return (
+        int(selected)
+        + 2 * suffix
+        + len(strokes)
+        + sum(2 if shift else 1 for _, shift in strokes)
+    )
+
+
+def common_affixes(text: str, converted: str) -> Tuple[int, int]:
+    """Возвращает длины общего начала и общего конца двух строк
+
+    Совпадающие блоки по AFFIX_BLOCK символов сравниваются срезами, и
+    посимвольно проверяется только последний блок.
+    """
+    limit = min(len(text), len(converted))
+    prefix = 0
+    while (
+        prefix + AFFIX_BLOCK <= limit
+        and text[prefix : prefix + AFFIX_BLOCK] == converted[prefix : prefix + AFFIX_BLOCK]
+    ):
+        prefix += AFFIX_BLOCK
+    while prefix < limit and text[prefix] == converted[prefix]:
+        prefix += 1
+    suffix = 0
+    while (
+        suffix + AFFIX_BLOCK <= limit - prefix
+        and text[len(text) - suffix - AFFIX_BLOCK : len(text) - suffix]
+        == converted[len(converted) - suffix - AFFIX_BLOCK : len(converted) - suffix]
+    ):
+        suffix += AFFIX_BLOCK
+    while (
+        suffix < limit - prefix
+        and text[len(text) - 1 - suffix] == converted[len(converted) - 1 - suffix]
+    ):
+        suffix += 1
+    return prefix, suffix
+
+
+@lru_cache(maxsize=None)
+def layout_keymap(layout: str) -> Optional[Dict[str, Stroke]]:
+    """Отображение символ -> нажатие для раскладки из кэша XKB
+
+    Args:
+        layout (str): Имя раскладки в кэше ('en', 'ru', ...)
+
+    Returns:
+        dict: Символ -> (код клавиши, Shift) или None, если раскладки нет
+    """
+    cache = get_layout_cache()
+    if cache is None or layout not in cache.names():
+        return None
+    keymap: Dict[str, Stroke] = {" ": (KEY_SPACE, False)}
+    for code, level1, level2 in cache.records(layout):
+        for point, shift in ((level1, False), (level2, True)):
+            if point:
+                keymap.setdefault(chr(point), (code, shift))
+    return keymap
+
+
+def retype_strokes(text: str, converted: str, layout_pair: str) -> Optional[List[Stroke]]:
+    """Находит нажатия, которые после смены раскладки дают новый текст
+
+    Исходный текст был набран в одной из раскладок пары; те же клавиши в
+    другой раскладке должны дать ровно преобразованный текст.
+
+    Args:
+        text (str): Исходный фрагмент
+        converted (str): Преобразованный фрагмент той же длины
+        layout_pair (str): Пара раскладок ('en_ru', ...)
+
+    Returns:
+        list: Нажатия или None, если фрагмент нельзя набрать в одной раскладке
+    """
+    source, _, target = layout_pair.partition("_")
+    for current, other in ((source, target), (target, source)):
+        keymap = layout_keymap(current)
+        if keymap is None:
+            continue
+        strokes = [keymap.get(char) for char in text]
+        if None in strokes:
+            continue
+        if strokes_text(strokes, other) == converted:
+            return strokes
+    return None
+
+
+def choose_plan(
+    text: str,
+    converted: str,
+    layout_pair: str,
+    key_cost: float = KEY_COST,
+    paste_cost: float = PASTE_OVERHEAD,
+    strategy: str = "auto",
+    selected: bool = True,
+) -> ReplacePlan:
+    """Выбирает способ замены текста
+
+    Args:
+        text (str): Исходный (выделенный) текст
+        converted (str): Текст, которым его нужно заменить
+        layout_pair (str): Пара раскладок
+        key_cost (float): Оценка времени одного нажатия
+        paste_cost (float): Оценка времени вставки через буфер обмена
+        strategy (str): 'auto', 'keys' (если возможно) или 'paste'
+        selected (bool): Текст выделен (иначе стоит перед курсором)
+
+    Returns:
+        ReplacePlan: План замены
+    """
+    paste = ReplacePlan("paste", cost=paste_cost, selected=selected)
+    if strategy == "paste" or len(text) != len(converted):
+        return paste
+    prefix, suffix = common_affixes(text, converted)
+    end = len(text) - suffix
+    strokes = retype_strokes(text[prefix:end], converted[prefix:end], layout_pair)
+    if strokes is None:
+        return paste
+    keys = key_count(suffix, strokes, selected)
+    plan = ReplacePlan(
+        "keys", prefix, suffix, strokes, keys * max(key_cost, KEY_COST), selected
+    )
+    if strategy == "keys":
+        return plan
+    if keys > MAX_RETYPE_KEYS or plan.cost >= paste.cost:
+        return paste
+    return plan
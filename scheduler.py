@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Планировщик действий lipunto
+Действия одного сеанса выполняются строго по очереди: демон ставит команды
+в очередь в памяти, одиночные запуски записывают нажатие в файл очереди и
+берут общий файл блокировки в $XDG_RUNTIME_DIR, поэтому два процесса не
+снимают и не восстанавливают историю Klipper одновременно. Нажатия,
+пришедшие во время действия, сливаются: подряд идущие нажатия одного
+действия попарно отменяют друг друга (повторное нажатие отменяет замену),
+и из серии выполняется не больше одного.
+"""
+
+import concurrent.futures
+import fcntl
+import os
+import threading
+from itertools import groupby
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from logger import get_logger
+
+# Длина строки нажатия в файле очереди: запись меньше PIPE_BUF атомарна
+MAX_ACTION_CHARS = 64
+
+
+def default_lock_path() -> Path:
+    """Путь к файлу блокировки: каталог времени выполнения пользователя"""
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or f"/tmp/lipunto-{os.getuid()}"
+    return Path(runtime_dir) / "lipunto" / "action.lock"
+
+
+def coalesce(actions: List[str]) -> List[Tuple[str, int]]:
+    """Группирует подряд идущие одинаковые нажатия
+
+    Args:
+        actions (list): Действия в порядке нажатий
+
+    Returns:
+        list: Пары (действие, число нажатий подряд)
+    """
+    return [(action, len(list(presses))) for action, presses in groupby(actions)]
+
+
+def _open(path: Path) -> Optional[int]:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        return os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+    except OSError as e:
+        # Без файла действия не упорядочиваются между процессами
+        get_logger().warning("Action lock file unavailable: %s", e)
+        return None
+
+
+class SessionLock:
+    """Блокировка действий сеанса на файле (flock) с очередью нажатий
+
+    Нажатия дописываются в файл очереди рядом с файлом блокировки; запись и
+    выборка очереди защищены собственной короткой блокировкой этого файла.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Args:
+            path: Файл блокировки; по умолчанию $XDG_RUNTIME_DIR/lipunto/action.lock
+        """
+        self.path = path or default_lock_path()
+        self.queue_path = self.path.with_suffix(".queue")
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> "SessionLock":
+        self._fd = _open(self.path)
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        if self._fd is not None:
+            # Закрытие дескриптора снимает блокировку
+            os.close(self._fd)
+            self._fd = None
+
+    def push(self, action: str) -> bool:
+        """Дописывает нажатие в очередь
+
+        Returns:
+            bool: False, если файл очереди недоступен
+        """
+        fd = _open(self.queue_path)
+        if fd is None:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, action[:MAX_ACTION_CHARS].encode("utf-8") + b"\n")
+        finally:
+            os.close(fd)
+        return True
+
+    def take(self) -> List[str]:
+        """Забирает все нажатия из очереди и очищает ее"""
+        fd = _open(self.queue_path)
+        if fd is None:
+            return []
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "rb") as queue:
+                data = queue.read()
+            os.ftruncate(fd, 0)
+        finally:
+            os.close(fd)
+        return data.decode("utf-8", errors="replace").split()
+
+
+def run_exclusive(
+    action: str, execute: Callable[[str], None], lock: Optional[SessionLock] = None
+) -> None:
+    """Выполняет нажатие одиночного запуска под блокировкой сеанса
+
+    Нажатие ставится в очередь, затем процесс ждет блокировку и выполняет
+    все накопившиеся нажатия со слиянием. Если нажатие уже выполнил
+    предыдущий процесс, очередь пуста и процесс сразу завершается.
+
+    Args:
+        action (str): Действие ('last' или 'selected')
+        execute: Функция, выполняющая одно действие
+        lock: Блокировка сеанса; по умолчанию - общий файл в $XDG_RUNTIME_DIR
+
+    Raises:
+        RuntimeError: Если действие завершилось с ошибкой
+    """
+    lock = lock or SessionLock()
+    if not lock.push(action):
+        # Очередь недоступна - действие выполняется без упорядочивания
+        execute(action)
+        return
+    logger = get_logger()
+    with lock:
+        while True:
+            actions = lock.take()
+            if not actions:
+                return
+            for queued, count in coalesce(actions):
+                if count % 2:
+                    execute(queued)
+                if count > 1:
+                    logger.info("Coalesced %d '%s' presses", count, queued)
+
+
+class ActionScheduler:
+    """Очередь действий демона со слиянием нажатий
+
+    Поток, первым нажавший в пустую очередь, выполняет действия; нажатия
+    из других потоков ждут, пока их обработает он. Каждое нажатие получает
+    свой Future, через который приходит результат или ошибка действия.
+    """
+
+    def __init__(self, execute: Callable[[str], None]):
+        """
+        Args:
+            execute: Функция, выполняющая одно действие
+        """
+        self._execute = execute
+        self.logger = get_logger()
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, concurrent.futures.Future]] = []
+        self._running = False
+
+    def submit(self, action: str) -> None:
+        """Выполняет нажатие (возможно, слитое с соседними) и ждет результата
+
+        Raises:
+            Exception: Ошибка действия, в которое вошло нажатие
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            self._pending.append((action, future))
+            worker = not self._running
+            self._running = True
+        if worker:
+            self._drain()
+        future.result()
+
+    def _drain(self) -> None:
+        while True:
+            with self._lock:
+                batch, self._pending = self._pending, []
+                if not batch:
+                    self._running = False
+                    return
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Tuple[str, concurrent.futures.Future]]) -> None:
+        for action, presses in groupby(batch, key=lambda press: press[0]):
+            futures = [future for _, future in presses]
+            if len(futures) > 1:
+                self.logger.info("Coalesced %d '%s' presses", len(futures), action)
+            try:
+                if len(futures) % 2:
+                    self._execute(action)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(None)
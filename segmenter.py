@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Сегментация выделенного текста со смешанными раскладками
+Текст разбивается на слова, каждое слово оценивается символьной
+триграммной моделью в исходном виде и после преобразования в обе стороны,
+и преобразуются только слова, набранные в неверной раскладке. Модели
+хранятся в плоских массивах логарифмов частот с хэшированием триграмм,
+поэтому оценка линейна по длине текста.
+"""
+
+import math
+import re
+from array import array
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from keyboard_layouts import get_layout_dict
+
+# Размер таблицы триграмм (степень двойки, индекс - хэш триграммы)
+TABLE_BITS = 14
+TABLE_MASK = (1 << TABLE_BITS) - 1
+# Граница слова в триграммах
+BOUNDARY = 0
+# Преобразованный вариант должен быть лучше исходного хотя бы на столько
+# (натуральный логарифм на символ)
+MARGIN_PER_CHAR = 0.5
+# Вклад символа, не являющегося буквой: чтобы варианты с разным числом букв
+# оставались сравнимыми, каждый символ слова дает одно слагаемое
+PUNCT_SCORE = -8.0
+# Дополнительный штраф за букву не из алфавита модели
+FOREIGN_SCORE = -10.0
+# Большой текст разбирается блоками примерно такого размера
+BLOCK_CHARS = 1 << 16
+# Сколько последних различных слов хранится с уже выбранным вариантом
+CHOSEN_WORDS = 4096
+_WHITESPACE = re.compile(r"\s")
+
+# Частотные слова, по которым строятся модели языков
+SEED_WORDS = {
+    "en": """
+        the be to of and a in that have i it for not on with he as you do at
+        this but his by from they we say her she or an will my one all would
+        there their what so up out if about who get which go me when make can
+        like time no just him know take people into year your good some could
+        them see other than then now look only come its over think also back
+        after use two how our work first well way even new want because any
+        these give day most us is are was were has had been said did made
+        where why here very much many more should must still between never
+        under again little world life hand part child eye woman place week
+        case point number group problem fact house home water room mother
+        area money story right study book word business issue side kind head
+        service friend father power hour game line end member law car city
+        name president team minute idea kid body information school face
+        others level office door health person art war history party result
+        change morning reason research girl guy moment air teacher force
+        education hello thanks please sorry yes what where today tomorrow
+        message letter text file open close start stop help small large
+        long great old big high different following public private thing
+        question government company system program during without before
+        through while should another something nothing everything together
+        keyboard layout window screen mouse computer language english russian
+    """,
+    "ru": """
+        и в не на я быть он с что а по это она этот к но они мы как из у
+        который то за свой весь год от так о для ты же все тот мочь вы
+        человек такой его сказать только или еще бы себя один как уже до
+        время если сам когда другой вот говорить наш мой знать стать при
+        чтобы дело жизнь кто первый очень два день ее новый рука даже во со
+        раз где там под можно ну какой после их работа без самый потом надо
+        хотеть ли слово идти большой должен место иметь ничто то сейчас
+        тут лицо каждый друг нет теперь ни глаз тоже тогда видеть вопрос
+        через да здесь дом сторона думать сделать страна жить чем мир об
+        последний случай голова более делать что-то смотреть ребенок просто
+        конечно сила российский конец перед несколько вид система всегда
+        основной пойти город деньги проблема привет спасибо пожалуйста
+        здравствуйте хорошо плохо сегодня завтра вчера сообщение письмо
+        текст файл открыть закрыть начать помощь маленький большой длинный
+        старый высокий разный следующий вода комната мать отец книга история
+        компания программа клавиатура раскладка окно экран язык русский
+        английский вместе ничего всего между никогда опять снова много
+        меньше больше работать писать читать понимать помнить спросить
+        ответить нужно будет было были была есть который которая которые
+        например сказал сказала тебя меня нас вас них него неё нам вам им
+        ещё её всё своё моё твоё
+    """,
+}
+
+
+def _trigram_index(a: int, b: int, c: int) -> int:
+    return ((a * 0x9E3779B1) ^ (b * 0x85EBCA77) ^ (c * 0xC2B2AE3D)) >> 7 & TABLE_MASK
+
+
+class TrigramModel:
+    """Символьная триграммная модель языка в виде массива log-вероятностей"""
+
+    __slots__ = ("language", "scores", "alphabet")
+
+    def __init__(self, language: str, words: List[str]):
+        """
+        Args:
+            language (str): Код языка ('en', 'ru')
+            words (list): Слова обучающего словаря
+        """
+        self.language = language
+        counts = array("I", bytes(4 << TABLE_BITS))
+        total = 0
+        self.alphabet = frozenset("".join(words).lower())
+        for word in words:
+            codes = [BOUNDARY, BOUNDARY] + [ord(c) for c in word.lower()] + [BOUNDARY]
+            for i in range(len(codes) - 2):
+                counts[_trigram_index(codes[i], codes[i + 1], codes[i + 2])] += 1
+                total += 1
+        # Сглаживание Лапласа: неизвестная триграмма получает малый, но
+        # конечный вес
+        denominator = total + len(counts)
+        self.scores = array("f", (math.log((n + 1) / denominator) for n in counts))
+
+    def score(self, word: str) -> float:
+        """Возвращает суммарную log-вероятность слова
+
+        Символы, не являющиеся буквами, считаются границами слова и дают
+        фиксированный вклад PUNCT_SCORE, буквы не из алфавита модели
+        дополнительно штрафуются.
+
+        Args:
+            word (str): Слово для оценки
+
+        Returns:
+            float: Сумма log-вероятностей триграмм
+        """
+        scores = self.scores
+        alphabet = self.alphabet
+        a = b = BOUNDARY
+        total = 0.0
+        for char in word.lower():
+            if char.isalpha():
+                c = ord(char)
+                if char not in alphabet:
+                    total += FOREIGN_SCORE
+            else:
+                c = BOUNDARY
+                total += PUNCT_SCORE
+                if b == BOUNDARY:
+                    continue
+            total += scores[_trigram_index(a, b, c)]
+            a, b = b, c
+        if b != BOUNDARY:
+            total += scores[_trigram_index(a, b, BOUNDARY)]
+        return total
+
+
+@lru_cache(maxsize=None)
+def get_model(language: str) -> Optional[TrigramModel]:
+    """Возвращает модель языка или None, если словаря для языка нет"""
+    words = SEED_WORDS.get(language)
+    if words is None:
+        return None
+    return TrigramModel(language, words.split())
+
+
+def _has_letters(text: str) -> bool:
+    return any(char.isalpha() for char in text)
+
+
+def _split(text: str) -> List[str]:
+    """Разбивает текст на чередующиеся слова и пробельные промежутки"""
+    return [chunk for chunk in re.split(r"(\s+)", text) if chunk]
+
+
+def _blocks(text: str) -> Iterator[str]:
+    """Делит текст на блоки около BLOCK_CHARS символов по пробельным символам
+
+    Слова не разрезаются; список фрагментов строится для одного блока за
+    раз, поэтому большое выделение не требует памяти на все слова сразу.
+    """
+    start = 0
+    while start < len(text):
+        match = _WHITESPACE.search(text, start + BLOCK_CHARS)
+        end = match.start() if match else len(text)
+        yield text[start:end]
+        start = end
+
+
+class Segmenter:
+    """Преобразование только тех слов, что набраны в неверной раскладке"""
+
+    def __init__(self, layout_name: str):
+        """
+        Args:
+            layout_name (str): Пара раскладок ('en_ru', 'ru_en', ...)
+
+        Raises:
+            ValueError: Если для одного из языков пары нет модели
+        """
+        source, _, target = layout_name.partition("_")
+        self.source_model = get_model(source)
+        self.target_model = get_model(target)
+        if self.source_model is None or self.target_model is None:
+            raise ValueError(f"Нет модели языка для пары раскладок '{layout_name}'")
+        forward_dict, reverse_dict = get_layout_dict(layout_name)
+        self.forward = {ord(k): v for k, v in forward_dict.items()}
+        self.reverse = {ord(k): v for k, v in reverse_dict.items()}
+
+    def _candidates(self, word: str):
+        """Варианты слова после преобразования в обе стороны
+
+        Кроме преобразования целиком, предлагается вариант, в котором знаки
+        препинания по краям слова остаются как есть: ',' после 'ghbdtn'
+        скорее знак препинания, чем буква 'б'.
+        """
+        start, end = 0, len(word)
+        while start < end and not word[start].isalpha():
+            start += 1
+        while end > start and not word[end - 1].isalpha():
+            end -= 1
+        for table, model in (
+            (self.forward, self.target_model),
+            (self.reverse, self.source_model),
+        ):
+            yield word.translate(table), model
+            if start > 0 or end < len(word):
+                core = word[start:end].translate(table)
+                yield word[:start] + core + word[end:], model
+
+    def choose(self, word: str) -> str:
+        """Выбирает для слова исходный вид или одно из преобразований
+
+        Args:
+            word (str): Слово без пробелов
+
+        Returns:
+            str: Слово в наиболее правдоподобном виде
+        """
+        if _has_letters(word):
+            original = max(
+                self.source_model.score(word), self.target_model.score(word)
+            )
+        else:
+            # Знаки препинания между словами не трогаем
+            original = 0.0
+        best, best_score = word, original + MARGIN_PER_CHAR * len(word)
+        for candidate, model in self._candidates(word):
+            if candidate == word or not _has_letters(candidate):
+                continue
+            score = model.score(candidate)
+            if score > best_score:
+                best, best_score = candidate, score
+        return best
+
+    def segment(
+        self, text: str, chosen: Optional["OrderedDict[str, str]"] = None
+    ) -> List[Tuple[str, bool]]:
+        """Разбивает текст на слова и разделители с пометкой о преобразовании
+
+        Args:
+            text (str): Исходный текст
+            chosen (OrderedDict): Уже оцененные слова (общие для блоков
+                одного текста); хранится не больше CHOSEN_WORDS последних
+
+        Returns:
+            list: Пары (фрагмент результата, был ли фрагмент преобразован)
+        """
+        segments = []
+        # Слова в тексте повторяются, каждое оценивается один раз
+        if chosen is None:
+            chosen = OrderedDict()
+        for chunk in _split(text):
+            if chunk[0].isspace():
+                segments.append((chunk, False))
+                continue
+            result = chosen.get(chunk)
+            if result is None:
+                result = chosen[chunk] = self.choose(chunk)
+                if len(chosen) > CHOSEN_WORDS:
+                    chosen.popitem(last=False)
+            else:
+                chosen.move_to_end(chunk)
+            segments.append((result, result != chunk))
+        return segments
+
+    def convert(self, text: str) -> Optional[str]:
+        """Преобразует слова, набранные в неверной раскладке
+
+        Текст разбирается блоками, а оцененные слова хранятся в LRU из
+        CHOSEN_WORDS элементов, поэтому кроме самого результата память не
+        растет ни с длиной текста, ни с числом различных слов в нем.
+
+        Args:
+            text (str): Исходный текст
+
+        Returns:
+            str: Результат или None, если ни одно слово не признано неверным
+        """
+        chosen: "OrderedDict[str, str]" = OrderedDict()
+        results = []
+        changed = False
+        for block in _blocks(text):
+            segments = self.segment(block, chosen)
+            changed = changed or any(flag for _, flag in segments)
+            results.append("".join(chunk for chunk, _ in segments))
+        if not changed:
+            return None
+        return "".join(results)
+
+
+_segmenters: Dict[str, Optional[Segmenter]] = {}
+
+
+def get_segmenter(layout_name: str) -> Optional[Segmenter]:
+    """Возвращает закэшированный сегментатор или None для пар без моделей"""
+    if layout_name not in _segmenters:
+        try:
+            _segmenters[layout_name] = Segmenter(layout_name)
+        except ValueError:
+            _segmenters[layout_name] = None
+    return _segmenters[layout_name]
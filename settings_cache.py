@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Кэш проверенных настроек lipunto
+Настройки, проверенные pydantic, сохраняются вместе с ключом из времени
+изменения .env, переменных окружения LIPUNTO_* и аргументов командной
+строки. Пока ключ совпадает, настройки читаются из кэша, и pydantic с
+pydantic_settings не импортируются вовсе. Кэш хранит несколько последних
+ключей, поэтому чередование горячих клавиш (last и selected) не вытесняет
+записи друг друга.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from logger import get_logger
+
+# Версия формата кэша; меняется вместе со схемой LipuntoSettings
+CACHE_VERSION = 2
+ENV_PREFIX = "LIPUNTO_"
+# Файл .env читается pydantic_settings относительно текущего каталога
+ENV_FILE = ".env"
+# Аргументы, не влияющие на настройки
+IGNORED_ARGS = ("--no-settings-cache", "--print-startup-profile", "--daemon")
+# Сколько последних наборов настроек хранит кэш
+MAX_ENTRIES = 8
+
+
+def default_cache_path() -> Path:
+    """Путь к файлу кэша настроек"""
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(cache_dir) / "lipunto" / "settings.json"
+
+
+def _file_stamp(path: Path) -> List[int]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return [0, 0]
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def cache_key(argv: List[str]) -> str:
+    """Вычисляет ключ кэша
+
+    Args:
+        argv (list): Аргументы командной строки без имени программы
+
+    Returns:
+        str: Хэш .env, окружения, аргументов и схемы настроек
+    """
+    env_file = Path(ENV_FILE).resolve()
+    schema = Path(__file__).resolve().parent / "config_manager.py"
+    material = [
+        CACHE_VERSION,
+        str(env_file),
+        _file_stamp(env_file),
+        _file_stamp(schema),
+        # pydantic_settings читает переменные без учета регистра
+        sorted((k, v) for k, v in os.environ.items() if k.upper().startswith(ENV_PREFIX)),
+        [arg for arg in argv if arg not in IGNORED_ARGS],
+    ]
+    data = json.dumps(material, ensure_ascii=False).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class SettingsView:
+    """Настройки из кэша с тем же доступом, что у LipuntoSettings
+
+    Вложенные разделы (delays, logging, ui) также представлены SettingsView.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+        for name, value in data.items():
+            setattr(self, name, SettingsView(value) if isinstance(value, dict) else value)
+
+    def model_dump(self) -> Dict[str, Any]:
+        """Возвращает копию настроек в виде словаря"""
+        return json.loads(json.dumps(self._data))
+
+    def get_layout(self) -> str:
+        """Получить текущую пару раскладок"""
+        return self.layout
+
+    def get_logging_config(self) -> "SettingsView":
+        """Получить конфигурацию логирования"""
+        return self.logging
+
+    def __repr__(self) -> str:
+        return f"SettingsView({self._data!r})"
+
+
+def _read_entries(path: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return {}
+    entries = data.get("entries")
+    return entries if isinstance(entries, dict) else {}
+
+
+def read_cached(key: str, path: Optional[Path] = None) -> Optional[Dict[str, Any]]:
+    """Возвращает сохраненные настройки, если ключ есть в кэше"""
+    settings = _read_entries(path or default_cache_path()).get(key)
+    return settings if isinstance(settings, dict) else None
+
+
+def write_cached(key: str, settings: Dict[str, Any], path: Optional[Path] = None) -> None:
+    """Сохраняет проверенные настройки, вытесняя самые старые записи"""
+    path = path or default_cache_path()
+    entries = _read_entries(path)
+    entries.pop(key, None)
+    entries[key] = settings
+    # Словарь сохраняет порядок записи: первыми идут самые старые ключи
+    entries = dict(list(entries.items())[-MAX_ENTRIES:])
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({"version": CACHE_VERSION, "entries": entries}, separators=(",", ":")),
+            encoding="utf-8",
+        )
+        os.replace(tmp_path, path)
+    except OSError as e:
+        get_logger().warning("Failed to save settings cache: %s", e)
+
+
+def load_settings(args, argv: List[str], use_cache: bool = True):
+    """Возвращает настройки из кэша или проверяет их через pydantic
+
+    Args:
+        args: Результат create_arg_parser().parse_args(argv)
+        argv (list): Аргументы командной строки без имени программы
+        use_cache (bool): Читать и обновлять кэш
+
+    Returns:
+        SettingsView при попадании в кэш, иначе LipuntoSettings
+    """
+    key = cache_key(argv) if use_cache else ""
+    if use_cache:
+        cached = read_cached(key)
+        if cached is not None:
+            return SettingsView(cached)
+
+    from config_manager import build_settings
+
+    settings = build_settings(args)
+    if use_cache:
+        write_cached(key, settings.model_dump(mode="json"))
+    return settings
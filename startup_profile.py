@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Профиль запуска lipunto
+Измеряет время импорта (выполнения тела) каждого модуля и время этапов
+инициализации. Включается флагом --print-startup-profile: модуль
+импортируется первым и при наличии флага сразу начинает измерять импорты.
+Без флага phase() ничего не измеряет.
+"""
+
+import sys
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from typing import List, Tuple
+
+# Записи (имя, собственное время, полное время, глубина вложенности)
+_imports: List[Tuple[str, float, float, int]] = []
+_phases: List[Tuple[str, float]] = []
+_enabled = False
+_started = time.perf_counter()
+
+
+class _TimedLoader:
+    """Обертка загрузчика, измеряющая выполнение модуля"""
+
+    _stack: List[float] = []
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        depth = len(self._stack)
+        self._stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - started
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += total
+            _imports.append((module.__name__, total - nested, total, depth))
+
+
+class _TimingFinder(MetaPathFinder):
+    """Находит модуль обычными средствами и подменяет загрузчик"""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def install() -> None:
+    """Начинает измерять импорты; вызывается до импорта модулей lipunto"""
+    global _enabled
+    if not _enabled:
+        _enabled = True
+        sys.meta_path.insert(0, _TimingFinder())
+
+
+@contextmanager
+def phase(name: str):
+    """Измеряет этап инициализации, если профиль включен"""
+    if not _enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - started))
+
+
+def report(limit: int = 25) -> str:
+    """Формирует отчет: самые долгие импорты и этапы инициализации
+
+    Args:
+        limit (int): Сколько модулей показать
+
+    Returns:
+        str: Текст отчета
+    """
+    lines = [f"{'import (self / cumulative, ms)':<48} {'self':>8} {'cumul':>8}"]
+    top = sorted(_imports, key=lambda entry: entry[2], reverse=True)[:limit]
+    for name, own, total, depth in top:
+        lines.append(f"{'  ' * depth + name:<48} {own * 1e3:>8.2f} {total * 1e3:>8.2f}")
+    imported = sum(total for _, _, total, depth in _imports if depth == 0)
+    lines.append(f"{'all imports':<48} {'':>8} {imported * 1e3:>8.2f}")
+    lines.append("")
+    lines.append(f"{'init phase':<48} {'ms':>8}")
+    for name, seconds in _phases:
+        lines.append(f"{name:<48} {seconds * 1e3:>8.2f}")
+    elapsed = time.perf_counter() - _started
+    lines.append(f"{'total since start':<48} {elapsed * 1e3:>8.2f}")
+    return "\n".join(lines)
+
+
+if "--print-startup-profile" in sys.argv:
+    install()
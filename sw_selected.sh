@@ -1,5 +1,19 @@
 #!/bin/bash
 export YDOTOOL_SOCKET=/tmp/.ydotool_socket
-sudo chmod go+rwx /tmp/.ydotool_socket
 _python=/home/buba/Projects/lipunto/.venv/bin/python
+_socket="${XDG_RUNTIME_DIR:+$XDG_RUNTIME_DIR/lipunto.sock}"
+_socket="${_socket:-/tmp/lipunto-$(id -u).sock}"
+[ -w /tmp/.ydotool_socket ] || sudo chmod go+rwx /tmp/.ydotool_socket
+
+# Быстрый путь: команда запущенному демону (switch_layout.py --daemon)
+if [ -S "${_socket}" ]; then
+    if command -v socat >/dev/null; then
+        echo selected | socat - UNIX-CONNECT:"${_socket}" >/dev/null && exit 0
+    else
+        "${_python}" -S /usr/local/sbin/lipunto_client.py selected "${_socket}"
+        [ $? -ne 2 ] && exit 0
+    fi
+fi
+
+# Демон не запущен - однократный запуск
 "${_python}" /usr/local/sbin/switch_layout.py selected
@@ -1,31 +1,55 @@
 #!/usr/bin/env python3
-import subprocess
 import sys
 import time
+from typing import TYPE_CHECKING, Optional
 
+# Импортируется первым: с --print-startup-profile измеряет импорты ниже
+import startup_profile  # isort: skip
+
+from cli_args import create_arg_parser
+from clipboard_history import content_hash
 from clipboard_utils import ClipboardManager
-from config_manager import (
-    DelaysConfig,
-    LipuntoSettings,
-    LoggingConfig,
-    UIConfig,
-    create_arg_parser,
-)
-from keyboard_layouts import get_layout_dict
-from logger import LogContext, init_logger
+from conversion import convert_text
+from delay_tuner import DEFAULT_CLASS, DelayTuner, active_window_class
+from input_backend import chord
+from journal import ConversionJournal, JournalEntry, MappedJournal
+from keycodes import KEY_BACKSPACE, KEY_LEFT, KEY_LEFTCTRL, KEY_LEFTSHIFT
+from keystroke_buffer import stroke_events, strokes_text
+from layout_state import LayoutState
+from logger import LogContext, Payload, init_logger, span, traced
+from pipeline import ActionPipeline
+from replace_strategy import KEY_COST, PASTE_OVERHEAD, ReplacePlan, choose_plan
+from scheduler import run_exclusive
+from segmenter import get_segmenter
+from settings_cache import load_settings
+from tool_paths import get_resolver
+
+if TYPE_CHECKING:
+    from config_manager import LipuntoSettings
+
+# Сколько символов текста показывать в уведомлении: текст передается
+# kdialog в командной строке
+POPUP_CHARS = 200
+
+
+def _excerpt(text: str) -> str:
+    """Начало текста для уведомления"""
+    return text if len(text) <= POPUP_CHARS else text[:POPUP_CHARS] + "…"
 
 
 class LayoutSwitcher:
     """Класс для переключения раскладки клавиатуры и преобразования текста"""
 
-    settings: LipuntoSettings
+    settings: "LipuntoSettings"
 
-    def __init__(self, settings):
+    def __init__(self, settings, journal=None):
         """
         Инициализация LayoutSwitcher
 
         Args:
             settings: Экземпляр LipuntoSettings. Если None, используется глобальный.
+            journal: Журнал замен для отмены повторным нажатием. Если None,
+                журнал хранится в памяти процесса
         """
         # Инициализация конфигурации
         self.settings = settings
@@ -37,56 +61,108 @@ class LayoutSwitcher:
         self.show_popup = self.settings.ui.show_popup
         self.layout = self.settings.get_layout()
 
-        self.clipboard_manager = ClipboardManager()
+        self.clipboard_manager = ClipboardManager(
+            self.settings.dbus_transport,
+            self.settings.input_backend,
+            self.settings.clipboard_backend,
+        )
+        # Активная раскладка KDE: направление преобразования и цель переключения
+        self.layout_state = LayoutState(
+            self.clipboard_manager.dbus, self.clipboard_manager.dbus_call
+        )
+        # Автоподбор задержек по классу активного окна
+        self.delay_tuner = DelayTuner() if self.settings.delays.auto_tune else None
+        self.window_class = DEFAULT_CLASS
         self.commands = ["qdbus", "kdialog", "ydotool"]
+        if self.clipboard_manager.dbus.name != "qdbus":
+            # При прямом соединении с шиной qdbus не требуется
+            self.commands.remove("qdbus")
+        if self.clipboard_manager.input.name != "ydotool":
+            # При записи в сокет ydotoold утилита ydotool не требуется
+            self.commands.remove("ydotool")
+        # wl-copy/wl-paste или xclip, если буфер обмена работает через них
+        self.commands += self.clipboard_manager.clipboard.commands
+
+        # Последние замены: повторное нажатие отменяет их без буфера обмена
+        self.journal = journal if journal is not None else ConversionJournal()
+        # KeystrokeMonitor демона: его счетчик правок отличает повтор от нового слова
+        self.keystrokes = None
+
+        # Шаги действий выполняются асинхронным конвейером
+        self.pipeline = ActionPipeline(self)
 
         self.logger.info(
-            f"LayoutSwitcher initialized with layout: {self.layout}, popup: {self.show_popup}"
+            "LayoutSwitcher initialized with layout: %s, popup: %s",
+            self.layout,
+            self.show_popup,
         )
 
-    def switch_text_layout(self, text: str) -> str:
+    @traced("convert")
+    def switch_text_layout(self, text: str, segment: bool = False) -> str:
         """Преобразование текста между раскладками клавиатуры
 
         Args:
             text (str): Входной текст для преобразования
+            segment (bool): Преобразовать только слова, набранные в неверной
+                раскладке. Если таких слов не найдено или для пары раскладок
+                нет языковых моделей, преобразуется весь текст
 
         Returns:
             str: Преобразованный текст
         """
+        layout_pair = self.layout_pair()
+        if segment:
+            segmenter = get_segmenter(layout_pair)
+            if segmenter is not None:
+                converted = segmenter.convert(text)
+                if converted is not None:
+                    return converted
+                self.logger.debug("No mistyped words found, converting whole text")
+        return convert_text(text, layout_pair)
+
+    def get_delay(self, step: str) -> float:
+        """Возвращает задержку шага с учетом автоподбора
+
+        Args:
+            step (str): Имя задержки из DelaysConfig
 
-        forward_dict, reverse_dict = get_layout_dict(self.settings.layout)
-        result = []
-        for char in text:
-            if char in forward_dict:
-                result.append(forward_dict[char])
-            elif char in reverse_dict:
-                result.append(reverse_dict[char])
-            else:
-                result.append(char)
-        return "".join(result)
+        Returns:
+            float: Задержка в секундах
+        """
+        configured = getattr(self.settings.delays, step)
+        if self.delay_tuner is None:
+            return configured
+        return self.delay_tuner.delay(step, configured, self.window_class)
+
+    @traced("record_delays")
+    def _record_delays(self) -> None:
+        """Передает фактические времена шагов в DelayTuner"""
+        if self.delay_tuner is None:
+            return
+        for step, seconds in self.clipboard_manager.settle_times.items():
+            self.delay_tuner.record(step, seconds, self.window_class)
+        self.delay_tuner.save()
 
+    @traced("check_dependencies")
     def check_dependencies(self) -> None:
-        """Проверка наличия необходимых утилит"""
+        """Проверка наличия необходимых утилит
+
+        Пути берутся из кэша ToolResolver и проверяются вызовом stat,
+        процессы не запускаются.
+        """
         self.logger.info("Checking dependencies...")
-        try:
-            result = subprocess.check_output(
-                ["which"] + self.commands, stderr=sys.stdout
-            )
-            self.logger.debug(f"Dependencies check result: {result.decode().strip()}")
-        except FileNotFoundError:
-            error_msg = "Команда 'which' не найдена. Убедитесь, что она установлена и доступна в вашем PATH."
-            self.logger.error(error_msg)
-            print(error_msg, file=sys.stderr)
-            exit(1)
-        except subprocess.CalledProcessError as e:
-            error_msg = f"Не удалось найти команду.Убедитесь что утилиты {self.commands} установлены\n{e.output.decode().strip()}"
+        problems = get_resolver().missing(self.commands)
+        if problems:
+            details = "\n".join(f"{name}: {problem}" for name, problem in problems.items())
+            error_msg = f"Не удалось найти команду.Убедитесь что утилиты {self.commands} установлены\n{details}"
             self.logger.error(error_msg)
             print(error_msg, file=sys.stderr)
             exit(1)
         self.logger.info("All dependencies are available")
 
+    @traced("popup")
     def show_popup_message(self, text: str, error: bool = False) -> None:
-        """Показ уведомления через kdialog
+        """Показ уведомления через kdialog без ожидания его закрытия
 
         Args:
             text (str): Текст сообщения
@@ -97,22 +173,29 @@ class LayoutSwitcher:
             return
 
         self.logger.info(
-            f"Showing {'error' if error else 'info'} popup: {text[:50]}..."
+            "Showing %s popup: %s", "error" if error else "info", Payload(text)
         )
-        try:
-            subprocess.run(
-                [
-                    "kdialog",
-                    "--title",
-                    "EnRu",
-                    "--error" if error else "--passivepopup",
-                    text,
-                    str(self.settings.ui.popup_timeout),
-                ],
-                check=True,
-            )
-        except subprocess.CalledProcessError as e:
-            self.logger.warning(f"Failed to show popup: {e}")
+        command = get_resolver().command(
+            [
+                "kdialog",
+                "--title",
+                "EnRu",
+                "--error" if error else "--passivepopup",
+                text,
+                str(self.settings.ui.popup_timeout),
+            ]
+        )
+        # kdialog --passivepopup работает до закрытия уведомления - не ждем его
+        self.pipeline.spawn(command)
+
+    def show_conversion_popup(self, text: str, converted_text: str) -> None:
+        """Уведомление о замене: начало исходного и нового текста
+
+        Args:
+            text (str): Текст до замены
+            converted_text (str): Текст после замены
+        """
+        self.show_popup_message(f"{_excerpt(text)}\n{_excerpt(converted_text)}")
 
     def run_ydotool_command(self, commands: list) -> None:
         """Выполнение команды ydotool
@@ -134,65 +217,257 @@ class LayoutSwitcher:
         return self.clipboard_manager.run_qbus_command(commands)
 
     def select_last_word(self) -> None:
-        """Выделение последнего слова с помощью ydotool (Ctrl+Shift+Left)
-        Коды клавиш: 29=Ctrl, 42=Shift, 105=Left
-        """
+        """Выделение последнего слова с помощью ydotool (Ctrl+Shift+Left)"""
         self.logger.debug("Selecting last word with Ctrl+Shift+Left")
-        self.run_ydotool_command(
-            ["key", "29:1", "42:1", "105:1", "105:0", "42:0", "29:0"]
-        )
+        self.clipboard_manager.send_chord(KEY_LEFTCTRL, KEY_LEFTSHIFT, KEY_LEFT)
 
-    def get_last_word(self) -> str:
-        """Выделение последнего слова и возврат его из буфера обмена"""
-        self.logger.debug("Getting last word from clipboard")
-        self.select_last_word()
-        return self.clipboard_manager.get_selection()
+    @traced("layout_switch")
+    def detect_layout(self) -> None:
+        """Обновляет состояние раскладки KDE перед действием
 
-    def switch_kde_layout(self) -> None:
-        """Переключение на следующую раскладку клавиатуры в KDE Plasma через D-Bus"""
-        self.logger.debug("Switching KDE keyboard layout")
-        self.run_qbus_command(["org.kde.keyboard", "/Layouts", "switchToNextLayout"])
+        Демон берет его из кэша, обновляемого сигналами; одиночный запуск
+        запрашивает активную раскладку. При ошибке действие выполняется по
+        настроенной паре раскладок.
+        """
+        try:
+            with span("layout_state"):
+                self.layout_state.refresh()
+        except RuntimeError as e:
+            self.logger.debug("Keyboard layout state unavailable: %s", e)
+        self.logger.debug("Active keyboard layout: %s", self.layout_state.current())
+
+    def layout_pair(self) -> str:
+        """Пара раскладок в направлении от активной раскладки
+
+        Если активна вторая раскладка настроенной пары, текст набран в ней,
+        и пара разворачивается ('en_ru' -> 'ru_en'). Если активная раскладка
+        неизвестна или не входит в пару, используется настроенная пара.
+        """
+        source, _, target = self.layout.partition("_")
+        if self.layout_state.current() == target:
+            return f"{target}_{source}"
+        return self.layout
 
-    def process_last_word(self) -> str:
-        """Обработка последнего слова перед курсором
+    def switch_kde_layout(self) -> None:
+        """Включение второй раскладки пары в KDE Plasma через D-Bus
 
-        Returns:
-            str: Текст последнего слова или пустая строка
+        Раскладка включается по номеру одним вызовом setLayout. Если список
+        раскладок KDE неизвестен, выполняется переход к следующей раскладке.
         """
-        delay = self.settings.delays.text_process
-        self.logger.debug(f"Waiting {delay}s for text processing")
-        time.sleep(delay)
-        return self.get_last_word()
+        target = self.layout_pair().partition("_")[2]
+        self.logger.debug("Switching KDE keyboard layout to %s", target)
+        if self.layout_state.set(target):
+            return
+        self.clipboard_manager.dbus_call(
+            "org.kde.keyboard", "/Layouts", "switchToNextLayout"
+        )
+        # Какая раскладка стала активной, неизвестно до следующего запроса
+        self.layout_state.index = None
+
+    @traced("plan")
+    def plan_replacement(
+        self,
+        text: str,
+        converted_text: str,
+        selected: bool = True,
+        strategy: Optional[str] = None,
+    ) -> ReplacePlan:
+        """Выбирает замену клавишами или вставкой по оценке стоимости
 
-    def process_selected_text(self) -> str:
-        """Обработка выделенного текста
+        Args:
+            text (str): Исходный текст
+            converted_text (str): Преобразованный текст
+            selected (bool): Текст выделен (иначе стоит перед курсором)
+            strategy (str): Способ вместо настроенного replace_strategy
 
         Returns:
-            str: Выделенный текст или пустая строка
+            ReplacePlan: План замены
         """
-        delay = self.settings.delays.text_process
-        self.logger.debug(f"Waiting {delay}s for text processing")
-        time.sleep(delay)
-        return self.clipboard_manager.get_selection()
+        key_cost = KEY_COST
+        # Пауза после вставки идет в фоне и не задерживает пользователя
+        paste_cost = self.get_delay("clipboard_set") + PASTE_OVERHEAD
+        if self.delay_tuner is not None:
+            key_cost = self.delay_tuner.estimate("replace_key", key_cost, self.window_class)
+            paste_cost = self.delay_tuner.estimate(
+                "replace_paste", paste_cost, self.window_class
+            )
+        return choose_plan(
+            text,
+            converted_text,
+            self.layout_pair(),
+            key_cost=key_cost,
+            paste_cost=paste_cost,
+            strategy=strategy or self.settings.replace_strategy,
+            selected=selected,
+        )
 
-    def convert_and_replace(self, text: str) -> None:
-        """Преобразование текста и замена в приложении
+    def prepare_replacement(
+        self, text: str, segment: bool = False, strategy: Optional[str] = None
+    ) -> tuple:
+        """Преобразует текст и выбирает способ замены
 
         Args:
             text (str): Исходный текст для преобразования
+            segment (bool): Преобразовать только слова в неверной раскладке
+            strategy (str): Способ вместо настроенного replace_strategy
+
+        Returns:
+            tuple: (преобразованный текст, ReplacePlan)
         """
-        self.logger.info(f"Converting text: '{text}'")
-        converted_text = self.switch_text_layout(text)
-        self.logger.info(f"Converted text: '{converted_text}'")
+        self.logger.info("Converting text: %s", Payload(text))
+        converted_text = self.switch_text_layout(text, segment)
+        self.logger.info("Converted text: %s", Payload(converted_text))
+
+        plan = self.plan_replacement(text, converted_text, strategy=strategy)
+        self.logger.debug(
+            "Replacement plan: %s, keep %d+%d chars, cost %.4fs",
+            plan.strategy,
+            plan.prefix,
+            plan.suffix,
+            plan.cost,
+        )
+        return converted_text, plan
+
+    def conversion_plausible(self, text: str, converted_text: str) -> bool:
+        """Проверяет по словарному индексу, что замена имеет смысл
 
-        self.logger.debug("Pasting converted text")
-        self.clipboard_manager.paste_text(converted_text)
+        Args:
+            text (str): Исходный текст
+            converted_text (str): Преобразованный текст
 
+        Returns:
+            bool: False, если проверка включена и исходный текст выглядит
+                набранным верно
+        """
+        if not self.settings.dictionary_check:
+            return True
+        # Индекс отображается в память только при первой проверке
+        from word_index import get_word_index
+
+        index = get_word_index()
+        if index is None:
+            self.logger.debug("Word index not found, dictionary check skipped")
+            return True
+        with span("dictionary"):
+            return index.plausible(text, converted_text, self.layout.split("_"))
+
+    @traced("replace_keys")
+    def replace_with_keys(self, plan: ReplacePlan) -> None:
+        """Замена клавишами: стирает отличие в текущей раскладке и набирает
+        его заново в следующей - буфер обмена не используется
+
+        Args:
+            plan (ReplacePlan): План со стратегией 'keys'
+        """
+        started = time.monotonic()
+        self.clipboard_manager.send_keys(plan.erase_events())
         self.logger.debug("Switching keyboard layout")
         self.switch_kde_layout()
+        self.clipboard_manager.send_keys(plan.type_events())
+        self.clipboard_manager.settle_times["replace_key"] = (
+            time.monotonic() - started
+        ) / plan.keys
+
+    def _edits(self):
+        """Счетчик правок KeystrokeBuffer или None без монитора нажатий"""
+        return self.keystrokes.buffer.edits if self.keystrokes is not None else None
+
+    def toggle_entry(self, action: str):
+        """Возвращает замену, которую отменит это нажатие, или None
+
+        Args:
+            action (str): Действие ('last' или 'selected')
+
+        Returns:
+            JournalEntry: Последняя замена, если нажатие повторное
+        """
+        return self.journal.toggle_candidate(
+            action, self.settings.toggle_window, self._edits()
+        )
 
-        if self.show_popup:
-            self.show_popup_message(f"{text}\n{converted_text}")
+    def record_conversion(
+        self, action: str, original: str, converted: str, strategy: str
+    ) -> None:
+        """Записывает замену в журнал
+
+        Args:
+            action (str): Действие ('last' или 'selected')
+            original (str): Текст до замены
+            converted (str): Текст после замены
+            strategy (str): Способ замены ('keys' или 'paste')
+        """
+        self.journal.record(
+            JournalEntry(action, original, converted, strategy, time.time(), self._edits())
+        )
+
+    def read_primary(self) -> Optional[str]:
+        """Читает выделенный текст из PRIMARY
+
+        PRIMARY не меняется, когда выделение снято, поэтому текст считается
+        устаревшим, если он не изменился с прошлого чтения или совпадает с
+        текстом одной из последних замен. Хэш прошлого чтения хранится в
+        журнале, поэтому одиночные запуски тоже видят предыдущее чтение.
+        Первое чтение давно снятого выделения так не отличить, поэтому
+        чтение PRIMARY выключено по умолчанию, а такой текст заменяется
+        только вставкой: клавиши стерли бы текст перед курсором.
+
+        Returns:
+            str: Выделенный текст или None, если нужно копирование через Ctrl+C
+        """
+        text = self.clipboard_manager.get_primary()
+        if not text:
+            return None
+        digest = content_hash(text)
+        if self.journal.swap_primary(digest) == digest:
+            self.logger.debug("PRIMARY selection unchanged, copying instead")
+            return None
+        if any(text in (entry.original, entry.converted) for entry in self.journal.entries()):
+            self.logger.debug("PRIMARY selection matches a recent conversion")
+            return None
+        return text
+
+    def detect_window_class(self) -> None:
+        """Определяет класс активного окна для автоподбора задержек"""
+        with span("window_class"):
+            self.window_class = active_window_class()
+        self.logger.debug("Active window class: %s", self.window_class)
+
+    def retype_last_word(self, strokes: list) -> None:
+        """Замена последнего слова повтором нажатий в другой раскладке
+
+        Слово стирается клавишей Backspace, раскладка переключается, и те же
+        коды клавиш вводятся заново - буфер обмена не используется.
+
+        Args:
+            strokes (list): Нажатия (код, Shift) из KeystrokeBuffer.last_word()
+        """
+        # Раскладка и история предыдущего действия должны быть на месте
+        self.pipeline.wait_idle()
+        with LogContext("Layout switch (last, keystrokes)", self.logger):
+            self.detect_layout()
+            source, _, target = self.layout_pair().partition("_")
+            text = strokes_text(strokes, source)
+            converted_text = strokes_text(strokes, target)
+            self.logger.info(
+                "Retyping %d keystrokes: %s -> %s",
+                len(strokes),
+                Payload(text),
+                Payload(converted_text),
+            )
+            if text is not None and not self.conversion_plausible(text, converted_text):
+                self.logger.info("Text looks correct, conversion skipped")
+                return
+            self.clipboard_manager.send_keys(chord(KEY_BACKSPACE) * len(strokes))
+
+            self.logger.debug("Switching keyboard layout")
+            self.switch_kde_layout()
+
+            self.clipboard_manager.send_keys(stroke_events(strokes))
+            if text is not None:
+                self.record_conversion("last", text, converted_text, "keys")
+
+            if self.show_popup and text is not None:
+                self.show_conversion_popup(text, converted_text)
 
     def run(self, action: str) -> None:
         """Основной метод запуска переключения раскладки
@@ -202,63 +477,67 @@ class LayoutSwitcher:
         """
         with LogContext(f"Layout switch ({action})", self.logger):
             self.check_dependencies()
+            self.pipeline.run(action)
 
-            selection_text = ""
-            if action == "last":
-                self.logger.info("Processing last word")
-                selection_text = self.process_last_word()
-            elif action == "selected":
-                self.logger.info("Processing selected text")
-                selection_text = self.process_selected_text()
+    def run_settled(self, action: str) -> None:
+        """Выполняет действие и дожидается его фоновых шагов
 
-            if selection_text:
-                self.convert_and_replace(selection_text)
-            else:
-                self.logger.warning("No text selected or last word found")
-                if self.show_popup:
-                    self.show_popup_message(
-                        "No text selected or last word found", error=True
-                    )
+        Так следующий процесс получает блокировку сеанса уже после
+        восстановления истории буфера обмена.
+
+        Args:
+            action (str): Действие ('last' или 'selected')
+        """
+        self.run(action)
+        self.pipeline.wait_idle()
+
+    def close(self) -> None:
+        """Дожидается фоновых шагов последнего действия"""
+        self.pipeline.close()
+        self.journal.close()
 
 
 def main():
     """Основная логика скрипта."""
-    parser = create_arg_parser()
-    args = parser.parse_args()
-
-    # Инициализация конфигурации с аргументами командной строки
-    delays_config = DelaysConfig(
-        clipboard_set=args.delay_clipboard_set or 0.05,
-        clipboard_get=args.delay_clipboard_get or 0.05,
-        text_process=args.delay_text_process or 0.05,
-        paste=args.delay_paste or 0.1,
-    )
-
-    # Определяем, включено ли логирование
-    logging_enabled = args.enable_logging
-
-    logging_config = LoggingConfig(
-        enabled=logging_enabled,
-        level=args.log_level if logging_enabled and args.log_level else "WARNING",
-        file=args.log_file or "/tmp/lipunto.log",
-        console=not args.no_console_log
-        if logging_enabled and args.no_console_log is not None
-        else False,
-        syslog=args.syslog or False,
-    )
-
-    ui_config = UIConfig(
-        show_popup=args.show_popup if args.show_popup else False,
-        popup_timeout=args.popup_timeout or 5,
-    )
-
-    settings = LipuntoSettings(
-        layout=args.layout, delays=delays_config, logging=logging_config, ui=ui_config
-    )
-
-    # Создаем LayoutSwitcher с передачей экземпляра Settings
-    switcher = LayoutSwitcher(settings)
-    switcher.run(args.action)
+    argv = sys.argv[1:]
+    with startup_profile.phase("parse arguments"):
+        parser = create_arg_parser()
+        args = parser.parse_args(argv)
+
+    # Проверенные настройки берутся из кэша, пока не изменились .env,
+    # переменные LIPUNTO_* и аргументы; иначе проверяются через pydantic
+    with startup_profile.phase("load settings"):
+        settings = load_settings(args, argv, use_cache=not args.no_settings_cache)
+
+    # Создаем LayoutSwitcher с передачей экземпляра Settings; одиночный
+    # запуск хранит журнал замен в файле, чтобы его увидел следующий запуск
+    with startup_profile.phase("LayoutSwitcher init"):
+        journal = None if args.daemon else MappedJournal()
+        switcher = LayoutSwitcher(settings, journal)
+
+    if args.print_startup_profile:
+        print(startup_profile.report(), file=sys.stderr)
+
+    if args.daemon:
+        # В режиме демона LayoutSwitcher создается один раз,
+        # а действия приходят через Unix-сокет
+        from daemon import LipuntoDaemon
+
+        keystrokes = None
+        if settings.keystroke_buffer or args.keystroke_file:
+            from keystroke_buffer import start_monitor
+
+            keystrokes = start_monitor(args.keystroke_file)
+        LipuntoDaemon(switcher, args.socket, keystrokes).serve_forever()
+        return
+
+    try:
+        # Одиночные запуски сеанса выполняются по очереди; нажатие, которое
+        # уже выполнил предыдущий процесс, здесь не повторяется
+        run_exclusive(args.action, switcher.run_settled)
+    finally:
+        # Процесс завершается после восстановления истории буфера
+        switcher.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""Тесты бэкендов буфера обмена: Klipper и утилиты на поддельных реализациях"""
+
+import json
+import os
+import shutil
+import stat
+
+import pytest
+
+import clipboard_backend
+import tool_paths
+from clipboard_backend import (
+    KlipperBackend,
+    WlClipboardBackend,
+    XclipBackend,
+    create_clipboard_backend,
+    measure,
+)
+from clipboard_utils import ClipboardManager
+from dbus_client import QdbusTransport
+
+# Поддельные утилиты хранят буфер в файле $LIPUNTO_TEST_CLIPBOARD;
+# пустой буфер, как у настоящих утилит, - код возврата 1. В PATH тестов
+# только каталог поддельных утилит, поэтому cat вызывается по полному пути
+CAT = shutil.which("cat")
+FAKE_SCRIPTS = {
+    "wl-paste": '[ -s "$LIPUNTO_TEST_CLIPBOARD" ] || exit 1\n$CAT "$LIPUNTO_TEST_CLIPBOARD"\n',
+    "wl-copy": '$CAT > "$LIPUNTO_TEST_CLIPBOARD"\n',
+    "xclip": (
+        'case " $* " in\n'
+        '  *" -o "*) [ -s "$LIPUNTO_TEST_CLIPBOARD" ] || exit 1\n'
+        '           $CAT "$LIPUNTO_TEST_CLIPBOARD" ;;\n'
+        '  *) $CAT > "$LIPUNTO_TEST_CLIPBOARD" ;;\n'
+        "esac\n"
+    ),
+}
+
+
+class FakeKlipper:
+    """Klipper в памяти: история, верхний элемент - буфер обмена"""
+
+    def __init__(self, history=None, fail=False):
+        self.history = list(history or [])
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, method, *args):
+        self.calls.append(method)
+        if self.fail:
+            raise RuntimeError("org.freedesktop.DBus.Error.ServiceUnknown")
+        if method == "getClipboardContents":
+            return self.history[0] if self.history else ""
+        if method == "setClipboardContents":
+            if args[0] in self.history:
+                self.history.remove(args[0])
+            self.history.insert(0, args[0])
+        elif method == "clearClipboardContents":
+            self.history.pop(0)
+        elif method == "clearClipboardHistory":
+            self.history.clear()
+        elif method == "getClipboardHistoryMenu":
+            return list(self.history)
+        elif method == "getClipboardHistoryItem":
+            index = args[0]
+            return self.history[index] if index < len(self.history) else ""
+        return None
+
+
+class FakeTransport:
+    """Транспорт D-Bus, передающий вызовы Klipper в FakeKlipper"""
+
+    def __init__(self, klipper, name="socket"):
+        self.klipper = klipper
+        self.name = name
+
+    def call(self, service, path, method, *args):
+        return self.klipper(method, *args)
+
+
+def make_klipper(history=None, fail=False, transport_name="socket"):
+    klipper = FakeKlipper(history, fail)
+    transport = FakeTransport(klipper, transport_name)
+    return klipper, transport, KlipperBackend(transport, klipper)
+
+
+@pytest.fixture
+def tools(tmp_path, monkeypatch):
+    """Каталог поддельных утилит в PATH и файл буфера"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, body in FAKE_SCRIPTS.items():
+        script = bin_dir / name
+        script.write_text(f"#!/bin/sh\nCAT={CAT}\n{body}", encoding="utf-8")
+        script.chmod(script.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("PATH", str(bin_dir))
+    monkeypatch.setenv("LIPUNTO_TEST_CLIPBOARD", str(tmp_path / "clipboard"))
+    monkeypatch.setenv("WAYLAND_DISPLAY", "wayland-test")
+    monkeypatch.setenv("DISPLAY", ":99")
+    monkeypatch.setattr(
+        tool_paths, "_resolver", tool_paths.ToolResolver(tmp_path / "tools.json")
+    )
+    return bin_dir
+
+
+def test_klipper_get_set_and_history():
+    klipper, _, backend = make_klipper(["старый", "текст"])
+    assert backend.available()
+    assert backend.get_text() == "старый"
+
+    backend.set_text("новый")
+    assert backend.get_text() == "новый"
+    assert backend.history() == ["новый", "старый", "текст"]
+
+    backend.remove_top()
+    assert backend.history() == ["старый", "текст"]
+    backend.clear_history()
+    assert backend.history() == []
+    assert backend.get_text() == ""
+
+
+def test_klipper_history_by_item_for_qdbus():
+    klipper, _, backend = make_klipper(["a", "b", "c"], transport_name="qdbus")
+    assert backend.history() == ["a", "b", "c"]
+    assert "getClipboardHistoryMenu" not in klipper.calls
+    assert klipper.calls.count("getClipboardHistoryItem") == 4
+
+
+def test_klipper_history_falls_back_when_bulk_call_fails():
+    klipper, _, backend = make_klipper(["a", "b"])
+    original = klipper.__call__
+
+    def call(method, *args):
+        if method == "getClipboardHistoryMenu":
+            raise RuntimeError("No such method")
+        return original(method, *args)
+
+    backend._call = call
+    assert backend.history() == ["a", "b"]
+    # После отказа история больше не запрашивается одним вызовом
+    assert backend._bulk_history is False
+
+
+def test_klipper_unavailable_when_bus_fails():
+    _, _, backend = make_klipper(fail=True)
+    assert not backend.available()
+    assert measure(backend) is None
+
+
+def test_klipper_probe_without_qdbus_runs_nothing(tools):
+    klipper, _, backend = make_klipper(transport_name="qdbus")
+    assert not backend.available()
+    assert klipper.calls == []
+
+
+def test_klipper_probe_through_failing_qdbus_is_silent(tools, capfd):
+    qdbus = tools / "qdbus"
+    qdbus.write_text(
+        "#!/bin/sh\necho \"Service 'org.kde.klipper' does not exist.\" >&2\nexit 2\n",
+        encoding="utf-8",
+    )
+    qdbus.chmod(qdbus.stat().st_mode | stat.S_IXUSR)
+    manager = ClipboardManager.__new__(ClipboardManager)
+    transport = QdbusTransport(manager._run_command)
+    backend = KlipperBackend(transport, None)
+    assert not backend.available()
+    assert capfd.readouterr() == ("", "")
+    # Сообщение утилиты попадает в текст ошибки для того, кто ее сообщит
+    with pytest.raises(RuntimeError, match="does not exist"):
+        transport.call("org.kde.klipper", "/klipper", "getClipboardContents")
+
+
+@pytest.mark.parametrize("backend_class", [WlClipboardBackend, XclipBackend])
+def test_command_backend_round_trip(tools, backend_class):
+    backend = backend_class()
+    assert backend.available()
+    # Пустой буфер не считается ошибкой
+    assert backend.get_text() == ""
+
+    text = "Привет, ghbdtn\n\tконец "
+    backend.set_text(text)
+    assert backend.get_text() == text
+
+
+@pytest.mark.parametrize("backend_class", [WlClipboardBackend, XclipBackend])
+def test_command_backend_needs_display(tools, monkeypatch, backend_class):
+    monkeypatch.delenv(backend_class.display_variable)
+    assert not backend_class().available()
+
+
+def test_command_backend_needs_all_tools(tools):
+    (tools / "wl-copy").unlink()
+    assert not WlClipboardBackend().available()
+    assert XclipBackend().available()
+
+
+def test_command_backend_write_failure_raises(tools):
+    (tools / "wl-copy").write_text("#!/bin/sh\nexit 3\n", encoding="utf-8")
+    with pytest.raises(RuntimeError, match="кодом 3"):
+        WlClipboardBackend().set_text("текст")
+
+
+def test_measure_returns_best_time(tools):
+    elapsed = measure(WlClipboardBackend())
+    assert elapsed is not None and elapsed > 0
+
+
+def test_saved_choice_is_bound_to_session(tmp_path, monkeypatch):
+    path = tmp_path / "clipboard.json"
+    monkeypatch.setenv("WAYLAND_DISPLAY", "wayland-1")
+    clipboard_backend._save_choice(path, "xclip", {"xclip": 0.001})
+    assert clipboard_backend._load_choice(path) == "xclip"
+
+    monkeypatch.setenv("WAYLAND_DISPLAY", "wayland-2")
+    assert clipboard_backend._load_choice(path) is None
+
+
+@pytest.mark.parametrize(
+    "data",
+    ["не json", json.dumps({"version": 0}), json.dumps(["klipper"])],
+)
+def test_invalid_saved_choice_is_ignored(tmp_path, data):
+    path = tmp_path / "clipboard.json"
+    path.write_text(data, encoding="utf-8")
+    assert clipboard_backend._load_choice(path) is None
+
+
+def test_saved_backend_must_be_known(tmp_path):
+    path = tmp_path / "clipboard.json"
+    clipboard_backend._save_choice(path, "auto", {})
+    assert clipboard_backend._load_choice(path) is None
+
+
+def test_explicit_backend_is_not_probed(tmp_path):
+    klipper, transport, _ = make_klipper(fail=True)
+    backend = create_clipboard_backend("xclip", transport, klipper, tmp_path / "state.json")
+    assert isinstance(backend, XclipBackend)
+    assert klipper.calls == []
+    assert not (tmp_path / "state.json").exists()
+
+
+def test_auto_prefers_klipper_over_faster_tools(tools, tmp_path, monkeypatch):
+    timings = {"klipper": 0.5, "wl-clipboard": 0.001, "xclip": 0.002}
+    probed = []
+
+    def fake_measure(backend):
+        probed.append(backend.name)
+        return timings[backend.name]
+
+    monkeypatch.setattr(clipboard_backend, "measure", fake_measure)
+    klipper, transport, _ = make_klipper()
+    path = tmp_path / "state.json"
+    backend = create_clipboard_backend("auto", transport, klipper, path)
+
+    assert isinstance(backend, KlipperBackend)
+    # При работающем Klipper утилиты не замеряются
+    assert probed == ["klipper"]
+    assert json.loads(path.read_text(encoding="utf-8"))["backend"] == "klipper"
+
+
+def test_auto_picks_fastest_tool_without_klipper(tools, tmp_path, monkeypatch):
+    timings = {"klipper": None, "wl-clipboard": 0.004, "xclip": 0.002}
+    monkeypatch.setattr(clipboard_backend, "measure", lambda backend: timings[backend.name])
+    klipper, transport, _ = make_klipper(fail=True)
+    path = tmp_path / "state.json"
+    backend = create_clipboard_backend("auto", transport, klipper, path)
+
+    assert isinstance(backend, XclipBackend)
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    assert saved["backend"] == "xclip"
+    assert set(saved["timings"]) == {"wl-clipboard", "xclip"}
+
+
+def test_auto_probes_real_tools_without_klipper(tools, tmp_path, monkeypatch):
+    monkeypatch.delenv("DISPLAY")
+    klipper, transport, _ = make_klipper(fail=True)
+    backend = create_clipboard_backend("auto", transport, klipper, tmp_path / "state.json")
+    assert isinstance(backend, WlClipboardBackend)
+
+
+def test_auto_reuses_saved_choice(tmp_path):
+    path = tmp_path / "state.json"
+    clipboard_backend._save_choice(path, "wl-clipboard", {"wl-clipboard": 0.001})
+    klipper, transport, _ = make_klipper()
+    backend = create_clipboard_backend("auto", transport, klipper, path)
+    assert isinstance(backend, WlClipboardBackend)
+    assert klipper.calls == []
+
+
+def test_auto_without_working_backend_falls_back_to_klipper(tmp_path, monkeypatch):
+    for variable in clipboard_backend.SESSION_VARIABLES:
+        monkeypatch.delenv(variable, raising=False)
+    klipper, transport, _ = make_klipper(fail=True)
+    path = tmp_path / "state.json"
+    backend = create_clipboard_backend("auto", transport, klipper, path)
+    assert isinstance(backend, KlipperBackend)
+    # Выбор не сохраняется: Klipper мог еще не запуститься
+    assert not os.path.exists(path)
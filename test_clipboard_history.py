@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Тесты расчета восстановления истории буфера обмена"""
+
+from clipboard_history import (
+    HistorySnapshot,
+    RestorePlan,
+    content_hash,
+    full_restore_plan,
+    plan_restore,
+)
+
+
+def apply_plan(plan: RestorePlan, history: list, max_items: int = 20) -> list:
+    """Выполняет план над моделью истории Klipper"""
+    history = list(history)
+    if plan.full:
+        history.clear()
+    for _ in range(plan.remove_top):
+        history.pop(0)
+    for item in plan.reinsert:
+        # setClipboardContents перемещает уже известный элемент на вершину
+        if item in history:
+            history.remove(item)
+        history.insert(0, item)
+    return history[:max_items]
+
+
+def test_unchanged_history_needs_no_calls():
+    items = ["a", "b", "c"]
+    plan = plan_restore(HistorySnapshot(items), items)
+    assert plan.calls == 0
+    assert not plan.full
+
+
+def test_new_top_items_are_removed():
+    items = ["a", "b", "c"]
+    current = ["converted", "copied"] + items
+    plan = plan_restore(HistorySnapshot(items), current)
+    assert plan.remove_top == 2
+    assert plan.reinsert == []
+    assert apply_plan(plan, current) == items
+
+
+def test_recopied_item_is_moved_back():
+    items = ["a", "b", "c", "d"]
+    # Повторно скопированный элемент Klipper перемещает на вершину
+    current = ["c", "a", "b", "d"]
+    plan = plan_restore(HistorySnapshot(items), current)
+    assert not plan.full
+    assert plan.remove_top == 0
+    assert apply_plan(plan, current) == items
+
+
+def test_removed_top_is_reinserted_from_tail():
+    items = ["a", "b", "c"]
+    # Действие удалило верхний элемент (clearClipboardContents)
+    current = ["b", "c"]
+    plan = plan_restore(HistorySnapshot(items), current)
+    assert not plan.full
+    assert plan.reinsert == ["a"]
+    assert plan.missing == 0
+    assert apply_plan(plan, current) == items
+
+
+def test_removed_top_outside_tail_is_reported_missing():
+    items = [f"item {i}" for i in range(10)]
+    current = items[1:]
+    plan = plan_restore(HistorySnapshot(items, tail_size=4), current)
+    assert not plan.full
+    assert plan.reinsert == []
+    assert plan.missing == 1
+
+
+def test_removed_top_replaced_by_new_item():
+    items = ["a", "b", "c"]
+    current = ["converted", "b", "c"]
+    plan = plan_restore(HistorySnapshot(items), current)
+    assert plan.remove_top == 1
+    assert plan.reinsert == ["a"]
+    assert apply_plan(plan, current) == items
+
+
+def test_evicted_item_is_reported_missing():
+    items = ["a", "b", "c", "d"]
+    # Новый элемент вытеснил самый старый при переполнении истории
+    current = ["converted", "a", "b", "c"]
+    plan = plan_restore(HistorySnapshot(items), current)
+    assert not plan.full
+    # Вытесненный элемент не вернуть вниз без перезаписи всей истории
+    assert plan.remove_top == 1
+    assert plan.reinsert == []
+    assert plan.calls == 1
+    assert plan.missing == 1
+    assert apply_plan(plan, current, max_items=4) == items[:3]
+
+
+def test_full_history_costs_constant_calls():
+    items = [f"item {i}" for i in range(500)]
+    # Копирование и вставка добавили два элемента и вытеснили два старых
+    current = ["copied", "converted"] + items[:-2]
+    plan = plan_restore(HistorySnapshot(items), current)
+    assert plan.calls == 2
+    assert plan.missing == 2
+    assert apply_plan(plan, current, max_items=500) == items[:-2]
+
+
+def test_new_item_below_top_falls_back_to_full_rebuild():
+    items = ["a", "b", "c"]
+    # Неизвестный элемент не на вершине - перемещениями историю не вернуть
+    current = ["a", "foreign", "b", "c"]
+    plan = plan_restore(HistorySnapshot(items), current)
+    assert plan.full
+    assert plan.remove_top == 0
+    assert plan.reinsert == ["c", "b", "a"]
+    assert plan.calls == 4
+    assert apply_plan(plan, current) == items
+
+
+def test_full_rebuild_counts_lost_contents():
+    items = [f"item {i}" for i in range(8)]
+    # Элемент из середины пропал, и его текста нет ни в истории, ни в хвосте
+    current = ["foreign", items[0], "other"] + items[2:]
+    plan = plan_restore(HistorySnapshot(items, tail_size=2), current)
+    assert plan.full
+    assert plan.missing == 1
+    assert apply_plan(plan, current) == [item for item in items if item != items[1]]
+
+
+def test_full_restore_plan_rebuilds_in_order():
+    items = ["a", "b", "c"]
+    current = ["x", "c", "b"]
+    plan = full_restore_plan(HistorySnapshot(items), current)
+    assert plan.full
+    assert plan.missing == 0
+    assert apply_plan(plan, current) == items
+
+
+def test_snapshot_top_and_hashes():
+    snapshot = HistorySnapshot(["верх", "низ"], tail_size=1)
+    assert snapshot.top == content_hash("верх")
+    assert len(snapshot) == 2
+    assert list(snapshot.tail.values()) == ["низ"]
+    assert HistorySnapshot([]).top is None
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""Тесты сериализации D-Bus: байты по спецификации и обратный разбор"""
+
+import struct
+
+import pytest
+
+from dbus_client import (
+    FIELD_DESTINATION,
+    FIELD_INTERFACE,
+    FIELD_MEMBER,
+    FIELD_PATH,
+    FIELD_REPLY_SERIAL,
+    FIELD_SIGNATURE,
+    METHOD_CALL,
+    METHOD_RETURN,
+    STRING_CHUNK,
+    Message,
+    _Reader,
+    _Writer,
+    split_signature,
+)
+
+
+def encode(signature: str, *values) -> bytes:
+    writer = _Writer()
+    writer.write_all(signature, values)
+    return bytes(writer.buf)
+
+
+def decode(signature: str, data: bytes, endian: str = "<") -> tuple:
+    return _Reader(data, 0, endian).read_all(signature)
+
+
+def string_bytes(text: str) -> bytes:
+    data = text.encode("utf-8")
+    return struct.pack("<I", len(data)) + data + b"\0"
+
+
+def test_split_signature():
+    assert split_signature("") == []
+    assert split_signature("sa(sss)ia{sv}aas") == ["s", "a(sss)", "i", "a{sv}", "aas"]
+    with pytest.raises(ValueError):
+        split_signature("a(ss")
+
+
+@pytest.mark.parametrize(
+    "signature, values, expected",
+    [
+        ("s", ("ab",), b"\x02\0\0\0ab\0"),
+        ("s", ("",), b"\0\0\0\0\0"),
+        ("s", ("я",), b"\x02\0\0\0\xd1\x8f\0"),
+        ("o", ("/klipper",), b"\x08\0\0\0/klipper\0"),
+        ("g", ("a(sss)",), b"\x06a(sss)\0"),
+        # Строка выравнивается по 4 байтам после байта
+        ("ys", (7, "x"), b"\x07\0\0\0\x01\0\0\0x\0"),
+        # Логическое значение занимает 4 байта
+        ("yb", (1, True), b"\x01\0\0\0\x01\0\0\0"),
+        ("yx", (1, -2), b"\x01" + b"\0" * 7 + struct.pack("<q", -2)),
+        ("yd", (1, 2.5), b"\x01" + b"\0" * 7 + struct.pack("<d", 2.5)),
+        ("yn", (1, -3), b"\x01\0" + struct.pack("<h", -3)),
+    ],
+)
+def test_basic_types_bytes(signature, values, expected):
+    data = encode(signature, *values)
+    assert data == expected
+    assert decode(signature, data) == values
+
+
+def test_string_array_bytes():
+    data = encode("as", ["a", "bc"])
+    # Длина массива без заполнения после нее; элементы выровнены по 4
+    expected = (
+        struct.pack("<I", 15)
+        + b"\x01\0\0\0a\0"
+        + b"\0\0"
+        + b"\x02\0\0\0bc\0"
+    )
+    assert data == expected
+    assert decode("as", data) == (["a", "bc"],)
+
+
+def test_empty_array_of_structs_alignment():
+    # Заполнение до начала первого элемента есть и у пустого массива
+    assert encode("a(sss)", []) == b"\0" * 8
+    # После длины на смещении 4 позиция уже кратна 8 - заполнения нет
+    assert encode("ya(ss)", 1, []) == b"\x01\0\0\0" + b"\0" * 4
+    assert encode("yya(ss)", 1, 2, []) == b"\x01\x02\0\0" + b"\0" * 4
+    assert decode("ya(ss)", encode("ya(ss)", 1, [])) == (1, [])
+
+
+def test_array_of_doubles_is_aligned_to_eight():
+    data = encode("ad", [1.5, -2.0])
+    assert data[:4] == struct.pack("<I", 16)
+    assert data[4:8] == b"\0" * 4
+    assert data[8:] == struct.pack("<dd", 1.5, -2.0)
+
+
+def test_struct_alignment_bytes():
+    data = encode("y(yu)", 1, (2, 3))
+    assert data == b"\x01" + b"\0" * 7 + b"\x02\0\0\0" + struct.pack("<I", 3)
+    assert decode("y(yu)", data) == (1, (2, 3))
+
+
+def test_dict_and_variant_round_trip():
+    values = ({"a": ("s", "текст"), "b": ("u", 7), "c": ("as", ["x", "y"])},)
+    data = encode("a{sv}", *values)
+    assert decode("a{sv}", data) == ({"a": "текст", "b": 7, "c": ["x", "y"]},)
+
+
+def test_layout_list_round_trip():
+    layouts = [("us", "", "English (US)"), ("ru", "", "Russian")]
+    assert decode("a(sss)", encode("a(sss)", layouts)) == (layouts,)
+
+
+def test_large_string_matches_single_chunk_encoding():
+    # Двухбайтовые символы, граница частей приходится внутрь текста
+    text = "ж" * (STRING_CHUNK + 3) + "end"
+    data = encode("ys", 1, text)
+    assert data == b"\x01\0\0\0" + string_bytes(text)
+    assert decode("ys", data) == (1, text)
+
+
+def test_large_string_inside_array():
+    items = ["x" * (STRING_CHUNK * 2 + 1), "короткий"]
+    data = encode("as", items)
+    assert decode("as", data) == (items,)
+    (length,) = struct.unpack_from("<I", data, 0)
+    assert length == len(data) - 4
+
+
+def test_big_endian_reader():
+    data = b"\0\0\0\x05" + b"\0\0\0\x02ab\0"
+    assert decode("us", data, ">") == (5, "ab")
+
+
+def test_method_call_round_trip():
+    body = ("Привет", ["a", "бв"], -5, True, ("x", 1, 2.5))
+    message = Message(
+        METHOD_CALL,
+        {
+            FIELD_PATH: "/klipper",
+            FIELD_INTERFACE: "org.kde.klipper.klipper",
+            FIELD_MEMBER: "setClipboardContents",
+            FIELD_DESTINATION: "org.kde.klipper",
+            FIELD_SIGNATURE: "sasib(sud)",
+        },
+        body,
+        serial=42,
+    )
+    header, encoded_body = message.encode_parts()
+    # Тело начинается с границы 8 байт
+    assert len(header) % 8 == 0
+    data = message.encode()
+    assert data[:4] == b"l\x01\x00\x01"
+    assert struct.unpack_from("<II", data, 4) == (len(encoded_body), 42)
+
+    decoded = Message.decode(data)
+    assert decoded.type == METHOD_CALL
+    assert decoded.serial == 42
+    assert decoded.path == "/klipper"
+    assert decoded.member == "setClipboardContents"
+    assert decoded.signature == "sasib(sud)"
+    assert decoded.body == body
+
+
+def test_reply_without_body_has_no_signature_field():
+    message = Message(METHOD_RETURN, {FIELD_REPLY_SERIAL: 7, FIELD_SIGNATURE: ""}, serial=8)
+    decoded = Message.decode(message.encode())
+    assert decoded.reply_serial == 7
+    assert FIELD_SIGNATURE not in decoded.fields
+    assert decoded.body == ()
+
+
+def test_large_message_round_trip():
+    text = "ab\nв" * STRING_CHUNK
+    message = Message(
+        METHOD_CALL,
+        {FIELD_PATH: "/klipper", FIELD_MEMBER: "setClipboardContents", FIELD_SIGNATURE: "s"},
+        (text,),
+        serial=1,
+    )
+    assert Message.decode(message.encode()).body == (text,)
+
+
+def test_truncated_body_is_rejected():
+    message = Message(
+        METHOD_CALL, {FIELD_PATH: "/", FIELD_MEMBER: "m", FIELD_SIGNATURE: "u"}, (1,), serial=1
+    )
+    data = bytearray(message.encode())
+    # Заявленная длина тела меньше фактической
+    struct.pack_into("<I", data, 4, 0)
+    with pytest.raises(ValueError):
+        Message.decode(bytes(data))
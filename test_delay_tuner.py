@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Тесты автоподбора задержек"""
+
+from delay_tuner import FLOOR, DelayTuner
+
+
+def test_delay_is_configured_until_enough_samples(tmp_path):
+    tuner = DelayTuner(tmp_path / "delays.json")
+    for _ in range(3):
+        tuner.record("clipboard_get", 0.002)
+    assert tuner.delay("clipboard_get", 0.5) == 0.5
+    for _ in range(10):
+        tuner.record("clipboard_get", 0.002)
+    assert FLOOR <= tuner.delay("clipboard_get", 0.5) < 0.5
+
+
+def test_timeouts_grow_learned_delay_back(tmp_path):
+    tuner = DelayTuner(tmp_path / "delays.json")
+    for _ in range(50):
+        tuner.record("clipboard_get", 0.002)
+    delay = tuner.delay("clipboard_get", 0.5)
+    # Приложение стало медленнее: каждое ожидание истекает на границе
+    for _ in range(20):
+        tuner.record("clipboard_get", delay)
+        grown = tuner.delay("clipboard_get", 0.5)
+        assert grown > delay or grown == 0.5
+        delay = grown
+    assert delay == 0.5
+
+
+def test_paste_delay_is_not_learned_from_copy(tmp_path):
+    tuner = DelayTuner(tmp_path / "delays.json")
+    for _ in range(50):
+        tuner.record("clipboard_get", 0.002)
+    assert tuner.delay("paste", 0.2) == 0.2
+
+
+def test_statistics_are_per_window_class_and_saved(tmp_path):
+    path = tmp_path / "delays.json"
+    tuner = DelayTuner(path)
+    for _ in range(10):
+        tuner.record("clipboard_set", 0.003, "kate")
+    tuner.save()
+    loaded = DelayTuner(path)
+    assert loaded.delay("clipboard_set", 0.5, "kate") < 0.5
+    assert loaded.delay("clipboard_set", 0.5, "firefox") == 0.5
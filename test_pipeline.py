@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Тесты конвейера действия на поддельных буфере обмена и приложении"""
+
+import pytest
+
+import switch_layout
+from cli_args import create_arg_parser
+from clipboard_utils import ClipboardManager
+from config_manager import build_settings
+from keycodes import KEY_BACKSPACE, KEY_C, KEY_INSERT, KEY_LEFTCTRL
+from logger import get_logger
+
+
+class FakeClipboard:
+    """Буфер обмена без истории"""
+
+    name = "fake"
+    has_history = False
+    signals = False
+    commands: list = []
+
+    def __init__(self, text=""):
+        self.text = text
+
+    def get_text(self):
+        return self.text
+
+    def set_text(self, text):
+        self.text = text
+
+
+class FakeApplication:
+    """Приложение: записывает события и копирует выделение по Ctrl+C"""
+
+    name = "fake"
+
+    def __init__(self, clipboard, selection=""):
+        self.clipboard = clipboard
+        self.selection = selection
+        self.events = []
+
+    def send_keys(self, events):
+        self.events.extend(events)
+        pressed = {code for code, state in events if state}
+        if {KEY_LEFTCTRL, KEY_C} <= pressed and self.selection:
+            self.clipboard.set_text(self.selection)
+
+    def pressed(self, code):
+        return any(event == (code, 1) for event in self.events)
+
+
+class FakeManager(ClipboardManager):
+    """ClipboardManager без D-Bus и ydotoold"""
+
+    def __init__(self, clipboard, application, primary=None):
+        self.logger = get_logger()
+        self.history = None
+        self.dbus = type("Bus", (), {"name": "native"})()
+        self.input = application
+        self.clipboard = clipboard
+        # Читатель PRIMARY с тем же интерфейсом, что у буфера обмена
+        self._primary = FakeClipboard(primary) if primary is not None else False
+        self._top_removal = True
+        self.settle_times = {}
+
+
+class FakeLayoutState:
+    def __init__(self, *args):
+        self.index = None
+
+    def refresh(self):
+        pass
+
+    def current(self):
+        return None
+
+    def set(self, target):
+        return True
+
+
+@pytest.fixture
+def run_action(monkeypatch):
+    """Выполняет действие и возвращает поддельное приложение"""
+    switchers = []
+
+    def run(action, clipboard_text, selection, primary=None):
+        clipboard = FakeClipboard(clipboard_text)
+        application = FakeApplication(clipboard, selection)
+        monkeypatch.setattr(
+            switch_layout,
+            "ClipboardManager",
+            lambda *args: FakeManager(clipboard, application, primary),
+        )
+        monkeypatch.setattr(switch_layout, "LayoutState", FakeLayoutState)
+        args = create_arg_parser().parse_args(
+            [
+                action,
+                "--no-popup",
+                "--primary-selection" if primary is not None else "--no-primary-selection",
+                "--delay-text-process", "0.001",
+                "--delay-clipboard-get", "0.05",
+                "--replace-strategy", "keys",
+            ]
+        )
+        switcher = switch_layout.LayoutSwitcher(build_settings(args))
+        switchers.append(switcher)
+        switcher.pipeline.run(action)
+        switcher.pipeline.wait_idle()
+        return switcher, application
+
+    yield run
+    for switcher in switchers:
+        switcher.close()
+
+
+@pytest.mark.parametrize("action", ["last", "selected"])
+def test_unconfirmed_copy_erases_nothing(run_action, action):
+    # Ctrl+C ничего не скопировал; в буфере старый текст, который можно
+    # преобразовать, но он не выделен в приложении
+    switcher, application = run_action(action, "ghbdtn", "")
+    assert application.pressed(KEY_C)
+    assert not application.pressed(KEY_BACKSPACE)
+    assert not application.pressed(KEY_INSERT)
+    assert application.clipboard.text == "ghbdtn"
+    assert list(switcher.journal.entries()) == []
+
+
+def test_confirmed_copy_is_replaced_with_keys(run_action):
+    switcher, application = run_action("selected", "старый буфер", "ghbdtn")
+    assert application.pressed(KEY_BACKSPACE)
+    assert not application.pressed(KEY_INSERT)
+    (entry,) = switcher.journal.entries()
+    assert (entry.original, entry.converted) == ("ghbdtn", "привет")
+
+
+def test_primary_text_is_replaced_only_by_paste(run_action):
+    # Выделение могло быть снято: клавиши стерли бы текст перед курсором
+    switcher, application = run_action("selected", "старый буфер", "", primary="ghbdtn")
+    assert not application.pressed(KEY_C)
+    assert not application.pressed(KEY_BACKSPACE)
+    assert application.pressed(KEY_INSERT)
+    (entry,) = switcher.journal.entries()
+    assert (entry.converted, entry.strategy) == ("привет", "paste")
+
+
+def test_primary_selection_is_off_by_default(tmp_path, monkeypatch):
+    # Без .env и переменных окружения действует значение по умолчанию
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("LIPUNTO_PRIMARY_SELECTION", raising=False)
+    settings = build_settings(create_arg_parser().parse_args(["selected"]))
+    assert not settings.primary_selection
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Тесты очереди действий: слияние нажатий и порядок выполнения"""
+
+import threading
+import time
+
+import pytest
+
+from scheduler import ActionScheduler, SessionLock, coalesce, run_exclusive
+
+
+class FakeExecutor:
+    """Записывает выполненные действия; может задерживать или падать"""
+
+    def __init__(self, fail=()):
+        self.actions = []
+        self.fail = set(fail)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, action):
+        self.started.set()
+        self.release.wait(5)
+        self.actions.append(action)
+        if action in self.fail:
+            raise RuntimeError(f"{action} failed")
+
+
+def test_coalesce_groups_consecutive_presses():
+    assert coalesce([]) == []
+    assert coalesce(["last"]) == [("last", 1)]
+    assert coalesce(["last", "last", "selected", "last"]) == [
+        ("last", 2),
+        ("selected", 1),
+        ("last", 1),
+    ]
+
+
+def test_scheduler_runs_single_press():
+    execute = FakeExecutor()
+    ActionScheduler(execute).submit("last")
+    assert execute.actions == ["last"]
+
+
+def submit_during_action(scheduler, execute, presses):
+    """Нажатия, пришедшие, пока выполняется первое действие"""
+    execute.release.clear()
+    first = threading.Thread(target=scheduler.submit, args=("last",))
+    first.start()
+    assert execute.started.wait(5)
+    threads = [threading.Thread(target=scheduler.submit, args=(action,)) for action in presses]
+    for thread in threads:
+        thread.start()
+    # Нажатия ждут в очереди, пока первое действие не завершится
+    while len(scheduler._pending) < len(presses):
+        time.sleep(0.001)
+    execute.release.set()
+    for thread in [first, *threads]:
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+@pytest.mark.parametrize(
+    "presses, expected",
+    [
+        # Два повторных нажатия отменяют друг друга
+        (["last", "last"], ["last"]),
+        # Нечетная серия выполняется один раз
+        (["last", "last", "last"], ["last", "last"]),
+        (["selected"], ["last", "selected"]),
+    ],
+)
+def test_scheduler_coalesces_by_parity(presses, expected):
+    execute = FakeExecutor()
+    scheduler = ActionScheduler(execute)
+    submit_during_action(scheduler, execute, presses)
+    assert execute.actions == expected
+
+
+def test_scheduler_reports_error_to_every_coalesced_press():
+    execute = FakeExecutor(fail={"selected"})
+    scheduler = ActionScheduler(execute)
+    errors = []
+
+    def submit(action):
+        try:
+            scheduler.submit(action)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    execute.release.clear()
+    first = threading.Thread(target=submit, args=("last",))
+    first.start()
+    assert execute.started.wait(5)
+    threads = [threading.Thread(target=submit, args=("selected",)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while len(scheduler._pending) < 3:
+        time.sleep(0.001)
+    execute.release.set()
+    for thread in [first, *threads]:
+        thread.join(5)
+    assert execute.actions == ["last", "selected"]
+    assert errors == ["selected failed"] * 3
+    # После ошибки очередь снова принимает нажатия
+    scheduler.submit("last")
+    assert execute.actions[-1] == "last"
+
+
+def test_session_lock_queue(tmp_path):
+    lock = SessionLock(tmp_path / "action.lock")
+    assert lock.take() == []
+    assert lock.push("last")
+    assert lock.push("selected")
+    assert lock.take() == ["last", "selected"]
+    assert lock.take() == []
+
+
+def test_run_exclusive_runs_own_press(tmp_path):
+    execute = FakeExecutor()
+    run_exclusive("selected", execute, SessionLock(tmp_path / "action.lock"))
+    assert execute.actions == ["selected"]
+
+
+def test_run_exclusive_runs_queued_presses_in_order(tmp_path):
+    path = tmp_path / "action.lock"
+    # Нажатия других процессов, пришедшие, пока блокировку держал третий
+    other = SessionLock(path)
+    for action in ["last", "last", "last", "selected"]:
+        other.push(action)
+    execute = FakeExecutor()
+    run_exclusive("last", execute, SessionLock(path))
+    assert execute.actions == ["last", "selected", "last"]
+    assert SessionLock(path).take() == []
+
+
+def test_run_exclusive_waits_for_lock_holder(tmp_path):
+    path = tmp_path / "action.lock"
+    execute = FakeExecutor()
+    holder = SessionLock(path)
+    with holder:
+        thread = threading.Thread(
+            target=run_exclusive, args=("last", execute, SessionLock(path))
+        )
+        thread.start()
+        thread.join(0.2)
+        # Пока блокировку держит другой, действие не выполняется
+        assert thread.is_alive()
+        assert execute.actions == []
+    thread.join(5)
+    assert execute.actions == ["last"]
+
+
+class DrainedLock(SessionLock):
+    """Очередь, которую сразу после записи забирает предыдущий процесс"""
+
+    def push(self, action):
+        pushed = super().push(action)
+        self.take()
+        return pushed
+
+
+def test_run_exclusive_press_done_by_previous_process(tmp_path):
+    execute = FakeExecutor()
+    run_exclusive("last", execute, DrainedLock(tmp_path / "action.lock"))
+    assert execute.actions == []
+
+
+def test_run_exclusive_without_queue_runs_directly(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("", encoding="utf-8")
+    execute = FakeExecutor()
+    # Каталог блокировки не создать: очередь недоступна
+    run_exclusive("selected", execute, SessionLock(blocker / "action.lock"))
+    assert execute.actions == ["selected"]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Тесты сегментации текста со смешанными раскладками"""
+
+from collections import OrderedDict
+
+import pytest
+
+import segmenter
+from segmenter import BLOCK_CHARS, Segmenter, _blocks, get_segmenter
+
+
+@pytest.fixture(scope="module")
+def en_ru():
+    return Segmenter("en_ru")
+
+
+def test_only_wrong_words_are_converted(en_ru):
+    assert en_ru.convert("Привет, ghbdtn") == "Привет, привет"
+    assert en_ru.convert("hello ghbdtn world") == "hello привет world"
+
+
+def test_punctuation_after_word_is_kept(en_ru):
+    assert en_ru.segment("ghbdtn, hello") == [
+        ("привет,", True),
+        (" ", False),
+        ("hello", False),
+    ]
+
+
+def test_correct_text_is_not_converted(en_ru):
+    assert en_ru.convert("hello world") is None
+    assert en_ru.convert("привет мир") is None
+
+
+def test_whitespace_is_preserved(en_ru):
+    text = "  ghbdtn\tvbh\n\nhello  \r\n текст "
+    assert en_ru.convert(text) == "  привет\tмир\n\nhello  \r\n текст "
+
+
+def test_segments_reassemble_text(en_ru):
+    text = "ghbdtn  hello\nvbh"
+    segments = en_ru.segment(text)
+    assert "".join(chunk for chunk, _ in segments) == "привет  hello\nмир"
+    assert [flag for chunk, flag in segments if chunk.isspace()] == [False, False]
+
+
+def test_blocks_split_only_at_whitespace():
+    word = "ghbdtn"
+    filler = "x" * (BLOCK_CHARS - 3)
+    # Слово начинается за три символа до границы блока и пересекает ее
+    text = f"{filler} {word} hello"
+    blocks = list(_blocks(text))
+    assert "".join(blocks) == text
+    assert len(blocks) == 2
+    assert blocks[0].endswith(word)
+    assert blocks[1] == " hello"
+
+
+def test_word_straddling_block_boundary_is_converted(en_ru):
+    words = ["hello"] * (BLOCK_CHARS // 6)
+    prefix = " ".join(words)
+    # Граница блока приходится на середину слова 'ghbdtn'
+    prefix = prefix[: BLOCK_CHARS - 3].rstrip()
+    text = f"{prefix} ghbdtn vbh"
+    assert len(prefix) + 1 < BLOCK_CHARS < len(prefix) + 1 + len("ghbdtn")
+    assert en_ru.convert(text) == f"{prefix} привет мир"
+
+
+def test_small_blocks_give_same_result(en_ru, monkeypatch):
+    text = "hello ghbdtn,  vbh\n" * 20
+    expected = en_ru.convert(text)
+    monkeypatch.setattr(segmenter, "BLOCK_CHARS", 7)
+    assert len(list(_blocks(text))) > 1
+    assert en_ru.convert(text) == expected
+
+
+def test_reverse_pair():
+    ru_en = Segmenter("ru_en")
+    assert ru_en.convert("hello руддщ") == "hello hello"
+
+
+def test_unknown_language_has_no_segmenter():
+    with pytest.raises(ValueError):
+        Segmenter("en_xx")
+    assert get_segmenter("en_xx") is None
+    assert get_segmenter("en_ru") is get_segmenter("en_ru")
+
+
+def test_chosen_words_are_bounded(en_ru, monkeypatch):
+    monkeypatch.setattr(segmenter, "CHOSEN_WORDS", 3)
+    chosen = OrderedDict()
+    en_ru.segment("ghbdtn vbh hello ghbdtn world", chosen)
+    # Недавно встреченное слово остается, самое старое вытеснено
+    assert list(chosen) == ["hello", "ghbdtn", "world"]
+    # Вытесненные слова оцениваются заново с тем же результатом
+    assert en_ru.convert("ghbdtn vbh hello world " * 3) == "привет мир hello world " * 3
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Кэш путей к внешним утилитам lipunto
+Пути к qdbus, kdialog, ydotool и другим утилитам ищутся в PATH один раз и
+сохраняются в памяти и в файле состояния. Запись считается верной, пока
+не изменились PATH, время изменения и размер файла утилиты, поэтому
+проверка зависимостей и запуск команд не порождают процессов и не
+просматривают PATH при каждом нажатии.
+"""
+
+import json
+import os
+import shutil
+import stat
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from logger import get_logger
+
+# Версия формата файла состояния
+STATE_VERSION = 1
+
+
+def default_state_path() -> Path:
+    """Путь к файлу состояния с путями утилит"""
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return Path(cache_dir) / "lipunto" / "tools.json"
+
+
+def _stamp(path: str) -> Optional[List[int]]:
+    """Время изменения и размер исполняемого файла или None"""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(info.st_mode) or not os.access(path, os.X_OK):
+        return None
+    return [info.st_mtime_ns, info.st_size]
+
+
+class ToolResolver:
+    """Находит и запоминает абсолютные пути к утилитам"""
+
+    def __init__(self, state_path: Optional[Path] = None):
+        """
+        Args:
+            state_path: Файл состояния; по умолчанию ~/.cache/lipunto/tools.json
+        """
+        self.state_path = state_path or default_state_path()
+        self.logger = get_logger()
+        # Имя утилиты -> [путь, время изменения, размер]
+        self._tools: Dict[str, list] = {}
+        self._path_env = os.environ.get("PATH", "")
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            data = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != STATE_VERSION
+            or data.get("path") != self._path_env
+        ):
+            # При другом PATH утилиты могут находиться в другом месте
+            return
+        tools = data.get("tools")
+        if isinstance(tools, dict):
+            self._tools = {
+                name: entry
+                for name, entry in tools.items()
+                if isinstance(entry, list) and len(entry) == 3
+            }
+
+    def save(self) -> None:
+        """Сохраняет файл состояния, если пути изменились"""
+        if not self._dirty:
+            return
+        data = {"version": STATE_VERSION, "path": self._path_env, "tools": self._tools}
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(data), encoding="utf-8")
+            os.replace(tmp_path, self.state_path)
+            self._dirty = False
+        except OSError as e:
+            self.logger.warning("Failed to save tool paths: %s", e)
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Возвращает абсолютный путь к утилите
+
+        Запомненный путь проверяется одним вызовом stat; PATH
+        просматривается заново, только если файл изменился или исчез.
+
+        Args:
+            name (str): Имя утилиты
+
+        Returns:
+            str: Путь или None, если утилита не найдена или не исполняема
+        """
+        if os.environ.get("PATH", "") != self._path_env:
+            self._path_env = os.environ.get("PATH", "")
+            self._tools.clear()
+            self._dirty = True
+        entry = self._tools.get(name)
+        if entry is not None and _stamp(entry[0]) == entry[1:]:
+            return entry[0]
+
+        path = shutil.which(name, path=self._path_env)
+        stamp = _stamp(path) if path else None
+        if stamp is None:
+            if self._tools.pop(name, None) is not None:
+                self._dirty = True
+            return None
+        path = os.path.abspath(path)
+        self._tools[name] = [path, *stamp]
+        self._dirty = True
+        self.logger.debug("Resolved %s to %s", name, path)
+        return path
+
+    def missing(self, names: List[str]) -> Dict[str, str]:
+        """Проверяет утилиты без запуска процессов
+
+        Args:
+            names (list): Имена утилит
+
+        Returns:
+            dict: Имя -> описание проблемы для ненайденных утилит
+        """
+        problems = {}
+        for name in names:
+            if self.resolve(name) is not None:
+                continue
+            problems[name] = self._describe_missing(name)
+        self.save()
+        return problems
+
+    def _describe_missing(self, name: str) -> str:
+        """Объясняет, почему утилита не найдена"""
+        for directory in self._path_env.split(os.pathsep):
+            candidate = os.path.join(directory or ".", name)
+            if not os.path.lexists(candidate):
+                continue
+            if not os.path.exists(candidate):
+                return f"{candidate} - битая символическая ссылка"
+            return f"{candidate} не является исполняемым файлом"
+        return "не найдена в PATH"
+
+    def command(self, commands: list) -> list:
+        """Заменяет имя утилиты в команде абсолютным путем
+
+        Если утилита не найдена, команда возвращается без изменений -
+        ошибку сообщит запуск.
+        """
+        path = self.resolve(commands[0])
+        if path is None or path == commands[0]:
+            return commands
+        self.save()
+        return [path, *commands[1:]]
+
+
+_resolver: Optional[ToolResolver] = None
+
+
+def get_resolver() -> ToolResolver:
+    """Возвращает общий для процесса ToolResolver"""
+    global _resolver
+    if _resolver is None:
+        _resolver = ToolResolver()
+    return _resolver
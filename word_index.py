@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Словарный индекс lipunto
+Компилирует списки слов по языкам в компактный двоичный индекс:
+для каждого языка - отсортированные слова в UTF-8 подряд и таблица
+смещений. Индекс отображается в память и не загружается в объекты Python;
+поиск слова - двоичный поиск по таблице смещений, поэтому занимает
+микросекунды и затрагивает лишь несколько страниц файла. Перед заменой
+индекс подтверждает, что преобразованный текст правдоподобнее исходного:
+случайное нажатие на верно набранном слове ничего не меняет.
+
+Запуск:
+    python word_index.py                              # словари по умолчанию
+    python word_index.py en=/usr/share/dict/words ru=ru.dic -o ~/.cache/lipunto/words.bin
+"""
+
+import argparse
+import mmap
+import os
+import re
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Формат индекса:
+#   заголовок:  magic, версия, количество языков
+#   каталог:    язык (16 байт), смещение таблицы, количество слов, смещение слов
+#   таблица:    смещения начала слов (uint32), последнее - конец последнего слова
+#   слова:      слова в нижнем регистре, UTF-8, по возрастанию байтов, без разделителей
+MAGIC = b"LPWI"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+DIRECTORY_ENTRY = struct.Struct("<16sIII")
+OFFSET = struct.Struct("<I")
+SPAN = struct.Struct("<II")
+
+# Словари, используемые по умолчанию: hunspell и списки слов системы
+DEFAULT_SOURCES = {
+    "en": ["/usr/share/hunspell/en_US.dic", "/usr/share/dict/words"],
+    "ru": ["/usr/share/hunspell/ru_RU.dic", "/usr/share/dict/russian"],
+    "uk": ["/usr/share/hunspell/uk_UA.dic", "/usr/share/dict/ukrainian"],
+    "be": ["/usr/share/hunspell/be_BY.dic"],
+    "de": ["/usr/share/hunspell/de_DE.dic", "/usr/share/dict/ngerman"],
+}
+# Сколько слов текста проверяется: для длинного выделения хватает начала
+MAX_CHECK_WORDS = 64
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def _dictionary_encoding(path: Path) -> str:
+    try:
+        with open(path.with_suffix(".aff"), encoding="latin-1") as aff:
+            for line in aff:
+                if line.startswith("SET "):
+                    return line.split()[1]
+    except (OSError, IndexError):
+        pass
+    return "utf-8"
+
+
+def read_words(path: Path) -> List[str]:
+    """Читает список слов (по одному в строке) или словарь hunspell (.dic)
+
+    В словаре hunspell первая строка - число слов, а флаги после '/'
+    отбрасываются; кодировка берется из строки SET файла .aff.
+    """
+    words = []
+    with open(path, encoding=_dictionary_encoding(path), errors="replace") as source:
+        for line in source:
+            word = line.split("/", 1)[0].strip().lower()
+            if word.isalpha():
+                words.append(word)
+    return words
+
+
+def compile_index(sources: Dict[str, Iterable[str]]) -> Dict[str, List[bytes]]:
+    """Сортирует слова каждого языка в порядке байтов UTF-8
+
+    Args:
+        sources (dict): Язык -> слова
+
+    Returns:
+        dict: Язык -> отсортированные слова без повторов в UTF-8
+    """
+    return {
+        language: sorted({word.lower().encode("utf-8") for word in words})
+        for language, words in sources.items()
+    }
+
+
+def write_index(compiled: Dict[str, List[bytes]], path: Path) -> None:
+    """Записывает двоичный индекс слов"""
+    directory = bytearray()
+    data = bytearray()
+    data_offset = HEADER.size + DIRECTORY_ENTRY.size * len(compiled)
+    for language, words in compiled.items():
+        table = bytearray()
+        position = 0
+        for word in words:
+            table += OFFSET.pack(position)
+            position += len(word)
+        table += OFFSET.pack(position)
+        table_offset = data_offset + len(data)
+        directory += DIRECTORY_ENTRY.pack(
+            language.encode("ascii"), table_offset, len(words), table_offset + len(table)
+        )
+        data += table + b"".join(words)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(HEADER.pack(MAGIC, VERSION, len(compiled)) + directory + data)
+    os.replace(tmp_path, path)
+
+
+class WordIndex:
+    """Отображенный в память индекс слов"""
+
+    def __init__(self, path: Path):
+        """
+        Raises:
+            OSError, ValueError: Если файл недоступен или поврежден
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Неподдерживаемый формат индекса слов: {path}")
+        self._directory: Dict[str, Tuple[int, int, int]] = {}
+        for index in range(count):
+            raw_name, table, words, blob = DIRECTORY_ENTRY.unpack_from(
+                self._map, HEADER.size + index * DIRECTORY_ENTRY.size
+            )
+            self._directory[raw_name.rstrip(b"\0").decode("ascii")] = (table, words, blob)
+
+    def languages(self) -> List[str]:
+        """Языки в индексе"""
+        return list(self._directory)
+
+    def __len__(self) -> int:
+        return sum(words for _, words, _ in self._directory.values())
+
+    def contains(self, language: str, word: str) -> bool:
+        """Есть ли слово (без учета регистра) в словаре языка"""
+        entry = self._directory.get(language)
+        if entry is None:
+            return False
+        table, count, blob = entry
+        key = word.lower().encode("utf-8")
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            start, end = SPAN.unpack_from(self._map, table + middle * OFFSET.size)
+            probe = self._map[blob + start : blob + end]
+            if probe < key:
+                low = middle + 1
+            elif probe > key:
+                high = middle
+            else:
+                return True
+        return False
+
+    def known_words(self, text: str, languages: List[str]) -> int:
+        """Число слов текста, найденных в словаре хотя бы одного из языков"""
+        words = _WORD_RE.findall(text)[:MAX_CHECK_WORDS]
+        return sum(
+            any(self.contains(language, word) for language in languages) for word in words
+        )
+
+    def plausible(self, text: str, converted: str, languages: List[str]) -> bool:
+        """Правдоподобнее ли преобразованный текст исходного
+
+        Замена отклоняется, только если в исходном тексте известных слов
+        больше: незнакомые обоим словарям слова (имена, опечатки)
+        по-прежнему преобразуются.
+
+        Args:
+            text (str): Исходный текст
+            converted (str): Преобразованный текст
+            languages (list): Языки пары раскладок
+
+        Returns:
+            bool: False, если исходный текст выглядит набранным верно
+        """
+        return self.known_words(converted, languages) >= self.known_words(text, languages)
+
+
+def default_index_paths() -> List[Path]:
+    """Пути, в которых ищется индекс слов, в порядке приоритета"""
+    paths = []
+    override = os.environ.get("LIPUNTO_WORD_INDEX")
+    if override:
+        paths.append(Path(override))
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    paths.append(Path(cache_dir) / "lipunto" / "words.bin")
+    paths.append(Path(__file__).resolve().parent / "words.bin")
+    return paths
+
+
+# Индекс слов: None - еще не загружался, False - не найден
+_word_index = None
+
+
+def get_word_index() -> Optional[WordIndex]:
+    """Лениво открывает отображенный в память индекс слов"""
+    global _word_index
+    if _word_index is None:
+        _word_index = False
+        for path in default_index_paths():
+            if not path.exists():
+                continue
+            try:
+                _word_index = WordIndex(path)
+                break
+            except (OSError, ValueError):
+                continue
+    return _word_index or None
+
+
+def default_sources() -> Dict[str, List[str]]:
+    """Слова языков из системных словарей; без них - частотные слова сегментатора"""
+    from segmenter import SEED_WORDS
+
+    sources: Dict[str, List[str]] = {}
+    for language, candidates in DEFAULT_SOURCES.items():
+        for candidate in candidates:
+            if Path(candidate).exists():
+                sources[language] = read_words(Path(candidate))
+                break
+        else:
+            if language in SEED_WORDS:
+                sources[language] = SEED_WORDS[language].split()
+    return sources
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Компиляция словарей в индекс слов lipunto")
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        help="Словари вида язык=файл (список слов или .dic hunspell)",
+    )
+    parser.add_argument("-o", "--output", help="Файл индекса")
+    args = parser.parse_args()
+
+    sources = {}
+    for item in args.sources:
+        language, _, path = item.partition("=")
+        sources[language] = read_words(Path(path))
+    compiled = compile_index(sources or default_sources())
+    output = Path(args.output) if args.output else default_index_paths()[-1]
+    write_index(compiled, output)
+    for language, words in compiled.items():
+        print(f"{language}: {len(words)} words")
+    print(f"Word index written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())